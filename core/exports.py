@@ -0,0 +1,50 @@
+import csv
+import json
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Echo:
+    # File-like object for csv.writer that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv_lines(rows, labels):
+    writer = csv.writer(Echo())
+    yield writer.writerow(labels)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def _ndjson_lines(rows, labels):
+    for row in rows:
+        yield json.dumps(dict(zip(labels, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def streaming_export(queryset, columns, export_format, filename):
+    # columns: list of (label, field lookup) pairs. Rows are read through a
+    # server-side cursor and written out as they arrive, so memory use does
+    # not grow with the size of the export.
+    labels = [label for label, _ in columns]
+    rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    lines = _csv_lines(rows, labels) if export_format == 'csv' else _ndjson_lines(rows, labels)
+
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
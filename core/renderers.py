@@ -0,0 +1,39 @@
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+def _as_rows(data):
+    if isinstance(data, dict):
+        return [data]
+    return list(data or [])
+
+
+class CSVRenderer(BaseRenderer):
+    # Streaming exports write their own body; this only renders regular
+    # responses (e.g. errors) for requests that negotiated CSV.
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = _as_rows(data)
+        if not rows:
+            return ''
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()), extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue()
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in _as_rows(data))
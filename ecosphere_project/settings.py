@@ -75,6 +75,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.StandardResultsSetPagination',
+    'PAGE_SIZE': 50,
 }
 
 SIMPLE_JWT = {
@@ -140,6 +142,57 @@ if os.environ.get('DJANGO_ENV') == 'production':
     }
 
 
+# Optional monthly partitioning of energy usage readings, maintained with
+# `python manage.py manage_energy_partitions`
+ENERGY_USAGE_PARTITIONING = os.getenv('ENERGY_USAGE_PARTITIONING') == 'True'
+ENERGY_USAGE_PARTITION_PREMAKE_MONTHS = int(os.getenv('ENERGY_USAGE_PARTITION_PREMAKE_MONTHS', 3))
+ENERGY_USAGE_PARTITION_DETACH_AFTER_MONTHS = int(os.getenv('ENERGY_USAGE_PARTITION_DETACH_AFTER_MONTHS', 0))
+
+# Raw energy readings older than this are folded into rollups and deleted by
+# `python manage.py compact_energy_usage` (or energy_dashboard.tasks). While
+# archiving is enabled, a month's readings are only compacted once it has
+# been archived, so readings stay raw for ENERGY_ARCHIVE_AFTER_MONTHS.
+ENERGY_RAW_RETENTION_DAYS = int(os.getenv('ENERGY_RAW_RETENTION_DAYS', 90))
+ENERGY_RETENTION_BATCH_SIZE = int(os.getenv('ENERGY_RETENTION_BATCH_SIZE', 5000))
+
+# Months of raw readings older than this are moved into columnar files by
+# `python manage.py archive_energy_usage`. Files live in ENERGY_ARCHIVE_DIR,
+# or in the default (django-storages) storage when
+# ENERGY_ARCHIVE_USE_DEFAULT_STORAGE=True, with ENERGY_ARCHIVE_DIR then used
+# as the local copy that gets memory-mapped. Point the default storage at a
+# private bucket before enabling that. 0 disables archiving, and
+# compact_energy_usage then discards raw readings after
+# ENERGY_RAW_RETENTION_DAYS on its own.
+ENERGY_ARCHIVE_AFTER_MONTHS = int(os.getenv('ENERGY_ARCHIVE_AFTER_MONTHS', 12))
+ENERGY_ARCHIVE_DIR = os.getenv('ENERGY_ARCHIVE_DIR', os.path.join(BASE_DIR, 'energy_archive'))
+ENERGY_ARCHIVE_USE_DEFAULT_STORAGE = os.getenv('ENERGY_ARCHIVE_USE_DEFAULT_STORAGE') == 'True'
+
+# SmartHomeDevice.last_sync is buffered in memory and written in bulk this
+# often; 0 writes it on every ingest
+DEVICE_LAST_SYNC_FLUSH_SECONDS = float(os.getenv('DEVICE_LAST_SYNC_FLUSH_SECONDS', 5.0))
+
+# In-process cache mapping device_identifier to the device and its owner for
+# ingestion; entries are invalidated on device save/delete
+DEVICE_LOOKUP_CACHE_SIZE = int(os.getenv('DEVICE_LOOKUP_CACHE_SIZE', 10000))
+DEVICE_LOOKUP_CACHE_TTL = float(os.getenv('DEVICE_LOOKUP_CACHE_TTL', 300))
+
+# How often the live community goal stream re-reads progress (one query per
+# process for every watched goal); updates in between are coalesced
+COMMUNITY_PROGRESS_POLL_SECONDS = float(os.getenv('COMMUNITY_PROGRESS_POLL_SECONDS', 1.0))
+
+# Seconds before the in-process leaderboard rank index is reloaded to pick
+# up points awarded by other processes
+LEADERBOARD_INDEX_TTL = int(os.getenv('LEADERBOARD_INDEX_TTL', 300))
+
+# Seconds before the in-process cache of active eco-challenges is reloaded
+# to pick up challenges edited by other processes
+ACTIVE_CHALLENGE_CACHE_TTL = int(os.getenv('ACTIVE_CHALLENGE_CACHE_TTL', 60))
+
+# Waste entries logged with a location count towards the region of the
+# nearest recycling center within this distance
+WASTE_REGION_RADIUS_KM = float(os.getenv('WASTE_REGION_RADIUS_KM', 25))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from energy_dashboard.models import (
     SmartHomeDevice, EnergyUsage, EnergySavingRecommendation,
-    CommunityEnergyGoal, UserCommunityProgress
+    CommunityEnergyGoal, UserCommunityProgress,
+    DeviceEnergyRollup, UserEnergyRollup, CompactedEnergyDay,
+    CommunityGoalProgressShard, ArchivedEnergyMonth
 )
 
 admin.site.register(SmartHomeDevice)
@@ -9,3 +11,8 @@ admin.site.register(EnergyUsage)
 admin.site.register(EnergySavingRecommendation)
 admin.site.register(CommunityEnergyGoal)
 admin.site.register(UserCommunityProgress)
+admin.site.register(DeviceEnergyRollup)
+admin.site.register(UserEnergyRollup)
+admin.site.register(CompactedEnergyDay)
+admin.site.register(CommunityGoalProgressShard)
+admin.site.register(ArchivedEnergyMonth)
@@ -0,0 +1,160 @@
+import warnings
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from energy_dashboard import recommendations as energy_recommendations, rollups
+from energy_dashboard.models import SmartHomeDevice, DeviceEnergyRollup
+
+LOOKBACK_DAYS = 28
+BASELINE_DAYS = 7
+DEVICE_BATCH_SIZE = 2000
+Z_THRESHOLD = 3.0
+
+MIN_HOURS_PER_DAY = 20
+MIN_BASELINE_DAYS = 4
+MIN_SPIKE_KWH = 0.5
+
+STANDBY_PERCENTILE = 5
+STANDBY_SHARE_THRESHOLD = 0.5
+MIN_STANDBY_KWH = 0.05
+# Devices that are expected to draw power around the clock
+ALWAYS_ON_DEVICE_TYPES = {'camera'}
+
+HOURS_PER_DAY = 24
+SECONDS_PER_HOUR = 3600
+
+
+def load_hourly_matrix(device_ids, window_start, hours):
+    # (devices x hours) matrix of hourly kWh; NaN where a device reported nothing
+    index = {device_id: position for position, device_id in enumerate(device_ids)}
+    rows = list(
+        DeviceEnergyRollup.objects
+        .filter(
+            device_id__in=device_ids, period=rollups.HOUR,
+            bucket__gte=window_start, bucket__lt=window_start + timedelta(hours=hours),
+        )
+        .values_list('device_id', 'bucket', 'energy_sum')
+    )
+
+    matrix = np.full((len(device_ids), hours), np.nan)
+    if rows:
+        start_s = window_start.timestamp()
+        device_positions = np.fromiter((index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        hour_positions = np.fromiter(
+            ((row[1].timestamp() - start_s) // SECONDS_PER_HOUR for row in rows), dtype=np.int64, count=len(rows)
+        )
+        matrix[device_positions, hour_positions] = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    return matrix
+
+
+def daily_totals(matrix):
+    # Days with too few reported hours are treated as missing
+    days = matrix.reshape(matrix.shape[0], -1, HOURS_PER_DAY)
+    observed = (~np.isnan(days)).sum(axis=2)
+    totals = np.nansum(days, axis=2)
+    totals[observed < MIN_HOURS_PER_DAY] = np.nan
+    return totals
+
+
+def rolling_zscores(daily, window=BASELINE_DAYS):
+    # z-score of every day against the mean/std of the `window` days before
+    # it, computed for all devices at once from running sums.
+    valid = ~np.isnan(daily)
+    values = np.where(valid, daily, 0.0)
+    padding = ((0, 0), (1, 0))
+    sums = np.cumsum(np.pad(values, padding), axis=1)
+    squares = np.cumsum(np.pad(values * values, padding), axis=1)
+    counts = np.cumsum(np.pad(valid.astype(np.float64), padding), axis=1)
+
+    window_sums = sums[:, window:-1] - sums[:, :-window - 1]
+    window_squares = squares[:, window:-1] - squares[:, :-window - 1]
+    window_counts = counts[:, window:-1] - counts[:, :-window - 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = window_sums / window_counts
+        variances = np.maximum(window_squares / window_counts - means * means, 0.0)
+        stds = np.maximum(np.sqrt(variances), np.maximum(0.1 * means, 0.05))
+        zscores = (daily[:, window:] - means) / stds
+
+    zscores[window_counts < MIN_BASELINE_DAYS] = np.nan
+    return zscores, means
+
+
+def standby_loads(matrix):
+    # Hourly base load (a low percentile of hourly kWh) and its share of the
+    # device's total consumption over the window
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        base_loads = np.nanpercentile(matrix, STANDBY_PERCENTILE, axis=1)
+    observed_hours = (~np.isnan(matrix)).sum(axis=1)
+    totals = np.nansum(matrix, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = base_loads * observed_hours / totals
+    return base_loads, np.nan_to_num(shares)
+
+
+def _analyze_batch(devices, window_start, hours):
+    device_ids = [device[0] for device in devices]
+    matrix = load_hourly_matrix(device_ids, window_start, hours)
+    latest_day = window_start + timedelta(hours=hours) - timedelta(days=1)
+    daily = daily_totals(matrix)
+    zscores, baselines = rolling_zscores(daily)
+    latest_z = zscores[:, -1]
+    latest_total = daily[:, -1]
+    latest_baseline = baselines[:, -1]
+    spikes = np.nonzero(
+        (latest_z > Z_THRESHOLD) & (latest_total - latest_baseline > MIN_SPIKE_KWH)
+    )[0]
+
+    base_loads, shares = standby_loads(matrix)
+    standby = np.nonzero((shares > STANDBY_SHARE_THRESHOLD) & (base_loads > MIN_STANDBY_KWH))[0]
+
+    recommendations = []
+    for position in spikes.tolist():
+        device_id, user_id, device_name, _ = devices[position]
+        recommendations.append(energy_recommendations.build(
+            user_id,
+            f"{device_name} used {latest_total[position]:.1f} kWh yesterday, "
+            f"{latest_total[position] / max(latest_baseline[position], 0.01):.1f}x its usual daily consumption. "
+            "Check whether it was left running or needs maintenance.",
+            device_id=device_id,
+            dedup_key=f'spike:{latest_day:%Y-%m-%d}',
+        ))
+    for position in standby.tolist():
+        device_id, user_id, device_name, device_type = devices[position]
+        if device_type in ALWAYS_ON_DEVICE_TYPES:
+            continue
+        recommendations.append(energy_recommendations.build(
+            user_id,
+            f"{device_name} draws about {base_loads[position]:.2f} kWh every hour even when idle, "
+            f"{shares[position]:.0%} of its consumption. Consider switching it off fully or scheduling it.",
+            device_id=device_id,
+            dedup_key='standby',
+        ))
+    return recommendations
+
+
+def detect_anomalies(lookback_days=LOOKBACK_DAYS, batch_size=DEVICE_BATCH_SIZE):
+    # One pass over every active device, in id-ordered batches. Only complete
+    # days up to the start of today (UTC) are analyzed. Returns the number of
+    # recommendations emitted; ones the user already has are skipped.
+    window_end = rollups.bucket_start(timezone.now(), rollups.DAY)
+    window_start = window_end - timedelta(days=lookback_days)
+    hours = lookback_days * HOURS_PER_DAY
+
+    devices = (
+        SmartHomeDevice.objects
+        .filter(is_active=True)
+        .order_by('id')
+        .values_list('id', 'user_id', 'device_name', 'device_type')
+    )
+    created = 0
+    last_id = 0
+    while True:
+        batch = list(devices.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return created
+        last_id = batch[-1][0]
+        created += energy_recommendations.emit(_analyze_batch(batch, window_start, hours))
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EnergyDashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'energy_dashboard'
+
+    def ready(self):
+        # Connects the device lookup cache invalidation and rollup signals
+        from energy_dashboard import device_cache, rollups
@@ -0,0 +1,309 @@
+import io
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection, transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from energy_dashboard import partitions, retention, rollups
+from energy_dashboard.models import EnergyUsage, DeviceEnergyRollup, UserEnergyRollup, ArchivedEnergyMonth, CompactedEnergyDay
+
+# Each archived month is a set of .npy arrays sorted by (device, timestamp):
+# `devices` holds the distinct device ids and `offsets` where each device's
+# rows start, so one device's readings are a contiguous slice of `ids`,
+# `timestamps` (epoch seconds) and `energy` (kWh).
+ARRAYS = ('devices', 'offsets', 'ids', 'timestamps', 'energy')
+READ_CHUNK_SIZE = 20000
+DELETE_BATCH_SIZE = retention.DEFAULT_BATCH_SIZE
+SECONDS_PER_DAY = 86400
+# Archived months kept memory-mapped per process, least recently used first
+MAPPED_MONTHS = 24
+
+_mapped = OrderedDict()
+_mapped_lock = threading.Lock()
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def get_storage():
+    if settings.ENERGY_ARCHIVE_USE_DEFAULT_STORAGE:
+        return default_storage
+    return FileSystemStorage(location=settings.ENERGY_ARCHIVE_DIR)
+
+
+def _file_name(path, array):
+    return f'{path}/{array}.npy'
+
+
+def _local_path(storage, name):
+    # Memory mapping needs a local file; remote storages are copied once
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        pass
+    local = os.path.join(settings.ENERGY_ARCHIVE_DIR, name)
+    if not os.path.exists(local):
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with storage.open(name, 'rb') as source, open(f'{local}.part', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.replace(f'{local}.part', local)
+    return local
+
+
+def load_month(path):
+    # Memory-mapped arrays of one archived month, kept open for the
+    # MAPPED_MONTHS most recently read months. Every archive run writes
+    # under a new path, so entries never go stale.
+    with _mapped_lock:
+        arrays = _mapped.get(path)
+        if arrays is not None:
+            _mapped.move_to_end(path)
+            return arrays
+    storage = get_storage()
+    arrays = {
+        array: np.load(_local_path(storage, _file_name(path, array)), mmap_mode='r')
+        for array in ARRAYS
+    }
+    with _mapped_lock:
+        _mapped[path] = arrays
+        while len(_mapped) > MAPPED_MONTHS:
+            _mapped.popitem(last=False)
+    return arrays
+
+
+def load_device_readings(device_id, start, end):
+    # (epoch seconds, kWh) arrays of a device's archived readings in [start, end)
+    paths = ArchivedEnergyMonth.objects.filter(
+        month__gte=partitions.month_start(start), month__lte=partitions.month_start(end),
+    ).order_by('month').values_list('path', flat=True)
+
+    timestamps = []
+    values = []
+    for path in paths:
+        arrays = load_month(path)
+        position = np.searchsorted(arrays['devices'], device_id)
+        if position == len(arrays['devices']) or arrays['devices'][position] != device_id:
+            continue
+        lower, upper = arrays['offsets'][position], arrays['offsets'][position + 1]
+        device_timestamps = arrays['timestamps'][lower:upper]
+        first, last = np.searchsorted(device_timestamps, [start.timestamp(), end.timestamp()])
+        timestamps.append(np.asarray(device_timestamps[first:last]))
+        values.append(np.asarray(arrays['energy'][lower + first:lower + last]))
+    if not timestamps:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(timestamps), np.concatenate(values)
+
+
+def _read_rows(queryset):
+    rows = (
+        queryset.order_by()
+        .values_list('id', 'device_id', 'timestamp', 'energy_consumed')
+        .iterator(chunk_size=READ_CHUNK_SIZE)
+    )
+    chunks = []
+    while True:
+        chunk = list(islice(rows, READ_CHUNK_SIZE))
+        if not chunk:
+            break
+        chunks.append((
+            np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk)),
+            np.fromiter((row[1] for row in chunk), dtype=np.int64, count=len(chunk)),
+            np.fromiter((row[2].timestamp() for row in chunk), dtype=np.float64, count=len(chunk)),
+            np.fromiter((row[3] for row in chunk), dtype=np.float64, count=len(chunk)),
+        ))
+    if not chunks:
+        return tuple(np.empty(0, dtype=dtype) for dtype in (np.int64, np.int64, np.float64, np.float64))
+    return tuple(np.concatenate(columns) for columns in zip(*chunks))
+
+
+def _build_arrays(ids, device_ids, timestamps, energy):
+    # Drops rows already archived by an interrupted run, then sorts
+    _, unique = np.unique(ids, return_index=True)
+    ids, device_ids, timestamps, energy = ids[unique], device_ids[unique], timestamps[unique], energy[unique]
+    order = np.lexsort((timestamps, device_ids))
+    device_ids = device_ids[order]
+    devices, starts = np.unique(device_ids, return_index=True)
+    return {
+        'devices': devices,
+        'offsets': np.append(starts, len(device_ids)).astype(np.int64),
+        'ids': ids[order],
+        'timestamps': timestamps[order],
+        'energy': energy[order],
+    }
+
+
+def _write_arrays(storage, path, arrays):
+    for array in ARRAYS:
+        buffer = io.BytesIO()
+        np.save(buffer, arrays[array])
+        storage.save(_file_name(path, array), ContentFile(buffer.getvalue()))
+
+
+def _delete_arrays(storage, path):
+    with _mapped_lock:
+        _mapped.pop(path, None)
+    for array in ARRAYS:
+        if storage.exists(_file_name(path, array)):
+            storage.delete(_file_name(path, array))
+
+
+def _daily_totals(month, source, previous):
+    # {day: [reading count, kWh]} over the month's live rows plus what an
+    # earlier run already archived
+    start, end = partitions.month_bounds(month)
+    totals = defaultdict(lambda: [0, 0.0])
+    live = (
+        source.objects
+        .filter(timestamp__gte=start, timestamp__lt=end)
+        .annotate(day=TruncDay('timestamp', tzinfo=dt_timezone.utc))
+        .values('day')
+        .annotate(count=Count('id'), total=Sum('energy_consumed'))
+        .order_by()
+    )
+    for row in live:
+        totals[row['day']][0] += row['count']
+        totals[row['day']][1] += row['total']
+    if previous is not None:
+        arrays = load_month(previous.path)
+        days, inverse = np.unique(np.asarray(arrays['timestamps']) // SECONDS_PER_DAY, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=arrays['energy'])
+        for day, count, total in zip(days.tolist(), counts.tolist(), sums.tolist()):
+            day_totals = totals[datetime.fromtimestamp(day * SECONDS_PER_DAY, tz=dt_timezone.utc)]
+            day_totals[0] += count
+            day_totals[1] += total
+    return totals
+
+
+def _mismatched_days(month, totals):
+    # Days whose device or user rollups do not match the readings
+    start, end = partitions.month_bounds(month)
+    sealed = set(CompactedEnergyDay.objects.filter(day__gte=start, day__lt=end).values_list('day', flat=True))
+    mismatched = set()
+    for model in (DeviceEnergyRollup, UserEnergyRollup):
+        rolled = {
+            row['bucket']: row
+            for row in model.objects
+            .filter(period=rollups.DAY, bucket__gte=start, bucket__lt=end)
+            .values('bucket')
+            .annotate(count=Sum('reading_count'), total=Sum('energy_sum'))
+            .order_by()
+        }
+        for day, (count, total) in totals.items():
+            row = rolled.get(day, {'count': 0, 'total': 0.0})
+            if day in sealed:
+                continue
+            if count != row['count'] or not math.isclose(total, row['total'], rel_tol=1e-9, abs_tol=1e-6):
+                mismatched.add(day)
+    return sorted(mismatched)
+
+
+def _verify_rollups(month, source, previous):
+    # Rollups are all that aggregates read once the rows leave the database,
+    # so they must account for every reading of the month
+    mismatched = _mismatched_days(month, _daily_totals(month, source, previous))
+    if mismatched and source is EnergyUsage and previous is None:
+        # Rollups are missing readings (e.g. rows written before rollups
+        # existed), so fold the month again from its raw readings.
+        start, end = partitions.month_bounds(month)
+        rollups.backfill(start, end)
+        mismatched = _mismatched_days(month, _daily_totals(month, source, previous))
+    if mismatched:
+        raise ArchiveError(f'Rollup totals for {mismatched[0]:%Y-%m-%d} do not match its readings.')
+
+
+def archive_month(month, backend=None):
+    # Moves one month of readings (live rows or a detached partition) into
+    # the archive, merging with what an earlier run archived. Returns the
+    # number of readings moved out of the database.
+    backend = backend or partitions.get_backend()
+    detached = settings.ENERGY_USAGE_PARTITIONING and month in backend.detached_months()
+    source = partitions.partition_model(month) if detached else EnergyUsage
+    start, end = partitions.month_bounds(month)
+    rows = source.objects.filter(timestamp__gte=start, timestamp__lt=end)
+
+    previous = ArchivedEnergyMonth.objects.filter(month=month).first()
+    _verify_rollups(month, source, previous)
+
+    columns = _read_rows(rows)
+    moved_ids = columns[0]
+    moved = len(moved_ids)
+    if not moved:
+        return 0
+
+    storage = get_storage()
+    if previous is not None:
+        existing = load_month(previous.path)
+        columns = tuple(
+            np.concatenate([column, existing_column]) for column, existing_column in zip(columns, (
+                np.asarray(existing['ids']),
+                np.repeat(existing['devices'], np.diff(existing['offsets'])),
+                np.asarray(existing['timestamps']),
+                np.asarray(existing['energy']),
+            ))
+        )
+    arrays = _build_arrays(*columns)
+    path = f'energy_usage/{month:%Y-%m}/{timezone.now():%Y%m%dT%H%M%S%f}'
+    _write_arrays(storage, path, arrays)
+
+    ArchivedEnergyMonth.objects.update_or_create(month=month, defaults={
+        'path': path,
+        'reading_count': len(arrays['ids']),
+        'energy_total': float(arrays['energy'].sum()),
+    })
+    if previous is not None:
+        _delete_arrays(storage, previous.path)
+
+    if detached:
+        with connection.schema_editor() as schema_editor:
+            schema_editor.delete_model(source)
+        return moved
+
+    for batch_start in range(0, moved, DELETE_BATCH_SIZE):
+        ids = moved_ids[batch_start:batch_start + DELETE_BATCH_SIZE].tolist()
+        with transaction.atomic():
+            rollups.delete_sealed_readings(EnergyUsage.objects.filter(id__in=ids))
+    return moved
+
+
+def archivable_months(older_than_months, backend=None):
+    # Months before the cutoff that still have readings in the database
+    backend = backend or partitions.get_backend()
+    cutoff = partitions.add_months(partitions.month_start(timezone.now()), -older_than_months)
+    months = set()
+    if settings.ENERGY_USAGE_PARTITIONING:
+        months.update(month for month in backend.detached_months() if month < cutoff)
+
+    first = EnergyUsage.objects.aggregate(first=Min('timestamp'))['first']
+    if first is not None:
+        month = partitions.month_start(first)
+        while month < cutoff:
+            start, end = partitions.month_bounds(month)
+            if EnergyUsage.objects.filter(timestamp__gte=start, timestamp__lt=end).exists():
+                months.add(month)
+            month = partitions.add_months(month, 1)
+    return sorted(months)
+
+
+def archive(older_than_months):
+    # Returns (months archived, readings moved)
+    backend = partitions.get_backend()
+    months = 0
+    moved = 0
+    for month in archivable_months(older_than_months, backend=backend):
+        moved += archive_month(month, backend=backend)
+        months += 1
+    return months, moved
@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from energy_dashboard import recommendations as energy_recommendations
+from energy_dashboard.models import CommunityEnergyGoal, CommunityGoalProgressShard, UserCommunityProgress
+
+THRESHOLD_SHARE = 0.75
+THRESHOLD_TEXT = "Great job! You're helping the community reach 75% of our energy reduction goal. Keep it up!"
+
+
+def contribute(user, community_goal, energy_reduced):
+    # Both counters are bumped with single UPDATE ... SET x = x + n statements,
+    # so concurrent contributions never overwrite each other.
+    with transaction.atomic():
+        progress, created = UserCommunityProgress.objects.get_or_create(
+            user=user, community_goal=community_goal, defaults={'energy_contributed': energy_reduced},
+        )
+        if not created:
+            UserCommunityProgress.objects.filter(pk=progress.pk).update(
+                energy_contributed=F('energy_contributed') + energy_reduced, updated_at=timezone.now(),
+            )
+        community_goal.update_progress(energy_reduced)
+
+    if community_goal.threshold_reached_at is None:
+        _check_threshold(user, community_goal)
+
+
+def _check_threshold(user, community_goal):
+    goal = CommunityEnergyGoal.objects.annotate(shard_progress=Sum('progress_shards__amount')).get(pk=community_goal.pk)
+    if goal.threshold_reached_at is not None:
+        return
+    if goal.get_total_progress() < THRESHOLD_SHARE * goal.target_energy_reduction:
+        return
+    # Only the request whose conditional UPDATE claims the threshold notifies
+    claimed = CommunityEnergyGoal.objects.filter(pk=goal.pk, threshold_reached_at__isnull=True).update(
+        threshold_reached_at=timezone.now(),
+    )
+    if claimed:
+        energy_recommendations.emit([energy_recommendations.build(
+            user.id, THRESHOLD_TEXT, dedup_key=f'community-goal-75:{goal.pk}',
+        )])
+
+
+def merge_progress_shards():
+    # Folds shard amounts into CommunityEnergyGoal.current_progress. Shards are
+    # locked only for the duration of one goal's merge. Returns the number of
+    # goals merged.
+    goal_ids = (
+        CommunityGoalProgressShard.objects
+        .exclude(amount=0)
+        .order_by('community_goal_id')
+        .values_list('community_goal_id', flat=True)
+        .distinct()
+    )
+    merged = 0
+    for goal_id in list(goal_ids):
+        with transaction.atomic():
+            shards = list(
+                CommunityGoalProgressShard.objects
+                .select_for_update()
+                .filter(community_goal_id=goal_id)
+                .exclude(amount=0)
+                .values_list('id', 'amount')
+            )
+            if not shards:
+                continue
+            total = sum(amount for _, amount in shards)
+            CommunityEnergyGoal.objects.filter(pk=goal_id).update(current_progress=F('current_progress') + total)
+            CommunityGoalProgressShard.objects.filter(id__in=[shard_id for shard_id, _ in shards]).update(amount=0.0)
+        merged += 1
+    return merged
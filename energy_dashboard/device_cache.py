@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from energy_dashboard.models import SmartHomeDevice
+
+DeviceRef = namedtuple('DeviceRef', ['pk', 'user_id', 'is_active'])
+
+
+
+class DeviceLookupCache:
+    # Bounded LRU cache of device_identifier -> DeviceRef. Unknown identifiers
+    # are not cached, so a device registered through another process is found
+    # straight away. Entries are dropped by the SmartHomeDevice save/delete
+    # signals in this process; the TTL bounds how long other processes can
+    # serve a stale entry.
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._identifiers_by_pk = {}
+        # Bumped by every invalidation, so a lookup that raced with one does
+        # not cache what it read
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        max_size = self.max_size if self.max_size is not None else settings.DEVICE_LOOKUP_CACHE_SIZE
+        ttl = self.ttl if self.ttl is not None else settings.DEVICE_LOOKUP_CACHE_TTL
+        return max_size, ttl
+
+    def _get(self, identifier, now):
+        entry = self._entries.get(identifier)
+        if entry is None:
+            return None
+        expires_at, ref = entry
+        if expires_at <= now:
+            self._pop(identifier)
+            return None
+        self._entries.move_to_end(identifier)
+        return ref
+
+    def _put(self, identifier, ref, now, max_size, ttl):
+        self._pop(identifier)
+        self._entries[identifier] = (now + ttl, ref)
+        self._identifiers_by_pk[ref.pk] = identifier
+        while len(self._entries) > max_size:
+            self._pop(next(iter(self._entries)))
+
+    def _pop(self, identifier):
+        entry = self._entries.pop(identifier, None)
+        if entry is not None:
+            self._identifiers_by_pk.pop(entry[1].pk, None)
+
+    def resolve_many(self, identifiers):
+        # Returns {identifier: DeviceRef or None}; cache misses are fetched
+        # with a single query.
+        max_size, ttl = self._limits()
+        now = time.monotonic()
+        resolved = {}
+        with self._lock:
+            version = self._version
+            for identifier in identifiers:
+                ref = self._get(identifier, now)
+                if ref is not None:
+                    resolved[identifier] = ref
+        missing = [identifier for identifier in identifiers if identifier not in resolved]
+        if not missing:
+            return resolved
+
+        found = self._fetch(missing)
+        with self._lock:
+            cache = self._version == version
+            for identifier in missing:
+                ref = found.get(identifier)
+                if ref is not None and cache:
+                    self._put(identifier, ref, now, max_size, ttl)
+                resolved[identifier] = ref
+        return resolved
+
+    def _fetch(self, identifiers):
+        return {
+            identifier: DeviceRef(pk, user_id, is_active)
+            for identifier, pk, user_id, is_active in SmartHomeDevice.objects
+            .filter(device_identifier__in=identifiers)
+            .values_list('device_identifier', 'id', 'user_id', 'is_active')
+        }
+
+    def resolve(self, identifier):
+        return self.resolve_many([identifier])[identifier]
+
+    def invalidate(self, pk=None, identifier=None):
+        with self._lock:
+            self._version += 1
+            if identifier is not None:
+                self._pop(identifier)
+            if pk is not None and pk in self._identifiers_by_pk:
+                self._pop(self._identifiers_by_pk[pk])
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._identifiers_by_pk.clear()
+
+
+device_cache = DeviceLookupCache()
+
+
+# Imported from EnergyDashboardConfig.ready so the receivers are always connected
+@receiver(post_save, sender=SmartHomeDevice)
+@receiver(post_delete, sender=SmartHomeDevice)
+def invalidate_device(sender, instance, **kwargs):
+    device_cache.invalidate(pk=instance.pk, identifier=instance.device_identifier)
@@ -0,0 +1,270 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from energy_dashboard import rollups
+from energy_dashboard.analysis import load_hourly_matrix
+
+# Additive exponential smoothing with a 24-hour and a 168-hour season
+# (double-seasonal Holt-Winters without trend) over hourly rollups, so both
+# the daily shape and weekday/weekend differences are forecast. The full fit
+# runs every parameter combination of the grid for every device at once;
+# afterwards each device's state is advanced hour by hour as new hours
+# complete.
+FIT_WEEKS = 8
+WARMUP_HOURS = 7 * 24
+DAY_HOURS = 24
+WEEK_HOURS = 7 * 24
+# A weekly forecast needs the weekly season to have seen each hour twice
+MIN_WEEK_HISTORY_HOURS = 2 * WEEK_HOURS
+ALPHAS = (0.02, 0.05, 0.1, 0.2, 0.4)
+GAMMAS = (0.05, 0.1, 0.2, 0.4)
+DELTAS = (0.0, 0.1, 0.3)
+REFIT_INTERVAL = timedelta(days=1)
+CACHE_SIZE = 50000
+
+
+class ForecastState:
+    __slots__ = ('alpha', 'gamma', 'delta', 'level', 'daily', 'weekly', 'history_hours', 'last_bucket', 'fitted_at', 'forecast')
+
+    def __init__(self, alpha, gamma, delta, level, daily, weekly, history_hours, last_bucket, fitted_at):
+        self.alpha = alpha
+        self.gamma = gamma
+        self.delta = delta
+        self.level = level
+        self.daily = daily
+        self.weekly = weekly
+        self.history_hours = history_hours
+        self.last_bucket = last_bucket
+        self.fitted_at = fitted_at
+        self.forecast = None
+
+
+def _empty_state(last_bucket, fitted_at):
+    # Devices without readings yet
+    return ForecastState(None, None, None, None, None, None, 0, last_bucket, fitted_at)
+
+
+def _week_hour(moment):
+    # Hours since Monday 00:00 UTC
+    return moment.weekday() * DAY_HOURS + moment.hour
+
+
+def _smooth(values, observed, level, daily, weekly, alphas, gammas, deltas, start, warmup=0):
+    # Runs the recursions for every (device, parameter set) row at once.
+    # values/observed are (rows, hours); level is (rows,), daily (rows, 24),
+    # weekly (rows, 168); start is the UTC datetime of the first hour. Hours
+    # before a device's first reading are skipped. Returns the updated level,
+    # seasons and the sum of squared one-step errors after warm-up.
+    sse = np.zeros(values.shape[0])
+    rows = np.arange(values.shape[0])
+    first_week_hour = _week_hour(start)
+    for hour in range(values.shape[1]):
+        day_slot = (start.hour + hour) % DAY_HOURS
+        week_slot = (first_week_hour + hour) % WEEK_HOURS
+        predicted = level + daily[rows, day_slot] + weekly[rows, week_slot]
+        errors = np.where(observed[:, hour], values[:, hour] - predicted, 0.0)
+        if hour >= warmup:
+            sse += errors * errors
+        level = level + alphas * errors
+        daily[rows, day_slot] += gammas * (1 - alphas) * errors
+        weekly[rows, week_slot] += deltas * (1 - alphas) * errors
+    return level, daily, weekly, sse
+
+
+def _slot_means(values, observed, slots, count):
+    # Per device, the mean of the observed values falling in each slot
+    # (0 where a slot was never observed)
+    sums = np.zeros((values.shape[0], count))
+    counts = np.zeros((values.shape[0], count))
+    for slot in range(count):
+        columns = slots == slot
+        sums[:, slot] = np.where(observed[:, columns], values[:, columns], 0.0).sum(axis=1)
+        counts[:, slot] = observed[:, columns].sum(axis=1)
+    return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+
+def _initial_seasons(values, observed, means, start):
+    # Seasons start from the average daily and weekly shape of the fit window,
+    # so the smoothing does not spend weeks learning them from zero (and pick
+    # a level that chases the weekday/weekend changes instead)
+    positions = np.arange(values.shape[1])
+    deviations = values - means[:, np.newaxis]
+    day_slots = (start.hour + positions) % DAY_HOURS
+    daily = _slot_means(deviations, observed, day_slots, DAY_HOURS)
+    week_slots = (_week_hour(start) + positions) % WEEK_HOURS
+    weekly = _slot_means(deviations - daily[:, day_slots], observed, week_slots, WEEK_HOURS)
+    return daily, weekly
+
+
+def fit(device_ids, end):
+    # Fits every device over the FIT_WEEKS before `end` (an hour boundary) and
+    # returns {device_id: ForecastState}; devices without readings get an
+    # empty state (level None) so they are not refitted on every request.
+    hours = FIT_WEEKS * 7 * 24
+    start = end - timedelta(hours=hours)
+    matrix = load_hourly_matrix(device_ids, start, hours)
+    # Missing hours after a device's first reading mean nothing was consumed
+    started = np.maximum.accumulate(~np.isnan(matrix), axis=1)
+    history = started.sum(axis=1)
+    values = np.nan_to_num(matrix)
+    means = values.sum(axis=1) / np.maximum(history, 1)
+
+    daily, weekly = _initial_seasons(values, started, means, start)
+
+    grids = np.meshgrid(ALPHAS, GAMMAS, DELTAS, indexing='ij')
+    alpha_grid, gamma_grid, delta_grid = (grid.ravel() for grid in grids)
+    combinations = len(alpha_grid)
+    level, daily, weekly, sse = _smooth(
+        np.repeat(values, combinations, axis=0),
+        np.repeat(started, combinations, axis=0),
+        np.repeat(means, combinations),
+        np.repeat(daily, combinations, axis=0),
+        np.repeat(weekly, combinations, axis=0),
+        np.tile(alpha_grid, len(device_ids)),
+        np.tile(gamma_grid, len(device_ids)),
+        np.tile(delta_grid, len(device_ids)),
+        start,
+        warmup=WARMUP_HOURS,
+    )
+    best = sse.reshape(len(device_ids), combinations).argmin(axis=1)
+
+    fitted_at = timezone.now()
+    last_bucket = end - timedelta(hours=1)
+    states = {}
+    for position, device_id in enumerate(device_ids):
+        if not history[position]:
+            states[device_id] = _empty_state(last_bucket, fitted_at)
+            continue
+        choice = best[position]
+        row = position * combinations + choice
+        states[device_id] = ForecastState(
+            float(alpha_grid[choice]), float(gamma_grid[choice]), float(delta_grid[choice]),
+            float(level[row]), daily[row].copy(), weekly[row].copy(), int(history[position]),
+            last_bucket, fitted_at,
+        )
+    return states
+
+
+def advance(device_id, state, end):
+    # Folds the hours completed since the state was last updated
+    hours = int((end - state.last_bucket).total_seconds() // 3600) - 1
+    if hours <= 0:
+        return state
+    start = state.last_bucket + timedelta(hours=1)
+    matrix = load_hourly_matrix([device_id], start, hours)
+    if state.level is None:
+        # No history yet: fit from scratch once the first readings arrive
+        if np.isnan(matrix).all():
+            return _empty_state(end - timedelta(hours=1), state.fitted_at)
+        return fit([device_id], end)[device_id]
+    level, daily, weekly, _ = _smooth(
+        np.nan_to_num(matrix), np.ones_like(matrix, dtype=bool),
+        np.array([state.level]), state.daily[np.newaxis, :].copy(), state.weekly[np.newaxis, :].copy(),
+        np.array([state.alpha]), np.array([state.gamma]), np.array([state.delta]), start,
+    )
+    return ForecastState(
+        state.alpha, state.gamma, state.delta, float(level[0]), daily[0], weekly[0],
+        state.history_hours + hours, end - timedelta(hours=1), state.fitted_at,
+    )
+
+
+def _forecast(device_id, state):
+    # The next 24 hours, and the next 168 once the device has two weeks of
+    # history; next_week_kwh is None before that
+    if state.level is None:
+        return None
+    start = state.last_bucket + timedelta(hours=1)
+    with_week = state.history_hours >= MIN_WEEK_HISTORY_HOURS
+    horizon = np.arange(WEEK_HOURS if with_week else DAY_HOURS)
+    hourly = np.maximum(
+        state.level
+        + state.daily[(start.hour + horizon) % DAY_HOURS]
+        + state.weekly[(_week_hour(start) + horizon) % WEEK_HOURS],
+        0.0,
+    )
+    return {
+        'device': device_id,
+        'fitted_through': start,
+        'next_day_kwh': float(hourly[:DAY_HOURS].sum()),
+        'next_week_kwh': float(hourly.sum()) if with_week else None,
+        'hourly': [
+            {'timestamp': start + timedelta(hours=hour), 'energy_consumed': value}
+            for hour, value in enumerate(hourly.tolist())
+        ],
+    }
+
+
+class ForecastCache:
+    # Bounded LRU of per-device smoothing state. An entry stays valid until
+    # the next hour completes, so repeated requests are a dictionary lookup;
+    # after that it is advanced incrementally, and refitted from scratch once
+    # REFIT_INTERVAL has passed (which also picks up late readings).
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def forecasts(self, device_ids):
+        # Returns {device_id: forecast dict}; devices without history are omitted
+        end = rollups.bucket_start(timezone.now(), rollups.HOUR)
+        current = end - timedelta(hours=1)
+        results = {}
+        stale = []
+        refit = []
+        with self._lock:
+            for device_id in device_ids:
+                state = self._states.get(device_id)
+                if state is None or timezone.now() - state.fitted_at > REFIT_INTERVAL:
+                    refit.append(device_id)
+                elif state.last_bucket != current:
+                    stale.append((device_id, state))
+                else:
+                    self._states.move_to_end(device_id)
+                    if state.forecast is not None:
+                        results[device_id] = state.forecast
+        if not refit and not stale:
+            return results
+
+        updated = fit(refit, end) if refit else {}
+        for device_id, state in stale:
+            updated[device_id] = advance(device_id, state, end)
+        with self._lock:
+            for device_id, state in updated.items():
+                state.forecast = _forecast(device_id, state)
+                self._states[device_id] = state
+                self._states.move_to_end(device_id)
+                if state.forecast is not None:
+                    results[device_id] = state.forecast
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+        return results
+
+
+forecast_cache = ForecastCache()
+
+
+def device_forecast(device_id):
+    return forecast_cache.forecasts([device_id]).get(device_id)
+
+
+def user_forecast(user, device_ids):
+    # A user's forecast is the sum of their devices' forecasts; the week is
+    # only included when every device has a weekly forecast
+    forecasts = forecast_cache.forecasts(device_ids)
+    with_week = bool(forecasts) and all(forecast['next_week_kwh'] is not None for forecast in forecasts.values())
+    horizon = WEEK_HOURS if with_week else DAY_HOURS
+    hourly = {}
+    for forecast in forecasts.values():
+        for point in forecast['hourly'][:horizon]:
+            hourly[point['timestamp']] = hourly.get(point['timestamp'], 0.0) + point['energy_consumed']
+    return {
+        'user': user.username,
+        'devices': sorted(forecasts),
+        'next_day_kwh': sum(forecast['next_day_kwh'] for forecast in forecasts.values()),
+        'next_week_kwh': sum(forecast['next_week_kwh'] for forecast in forecasts.values()) if with_week else None,
+        'hourly': [{'timestamp': timestamp, 'energy_consumed': value} for timestamp, value in sorted(hourly.items())],
+    }
@@ -0,0 +1,128 @@
+import math
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from energy_dashboard import partitions, rollups
+from energy_dashboard.device_cache import device_cache
+from energy_dashboard.last_sync import last_sync_buffer
+from energy_dashboard.models import SmartHomeDevice, EnergyUsage
+
+MAX_BATCH_READINGS = 10000
+BULK_CREATE_BATCH_SIZE = 1000
+
+DEVICE_NOT_FOUND_ERROR = 'Smart Home Device not found or not owned by the user.'
+DEVICE_INACTIVE_ERROR = 'Smart Home Device is inactive.'
+TIMESTAMP_NOT_STORED_ERROR = 'timestamp falls in a month that is not stored.'
+
+
+def _parse_reading(row, now):
+    if not isinstance(row, dict):
+        raise ValueError('Reading must be an object.')
+
+    # Field devices send their device_identifier; device_id is still accepted
+    device_id = None
+    device_identifier = row.get('device_identifier')
+    if device_identifier is not None:
+        if not isinstance(device_identifier, str) or not device_identifier.strip():
+            raise ValueError('device_identifier must be a non-empty string.')
+        device_identifier = device_identifier.strip()
+    else:
+        device_id = row.get('device_id')
+        if isinstance(device_id, bool):
+            raise ValueError('device_id must be an integer.')
+        try:
+            device_id = int(device_id)
+        except (TypeError, ValueError):
+            raise ValueError('Provide a device_identifier or an integer device_id.')
+
+    energy_consumed = row.get('energy_consumed')
+    if isinstance(energy_consumed, bool):
+        raise ValueError('energy_consumed must be a non-negative number.')
+    try:
+        energy_consumed = float(energy_consumed)
+    except (TypeError, ValueError):
+        raise ValueError('energy_consumed must be a non-negative number.')
+    if not math.isfinite(energy_consumed) or energy_consumed < 0:
+        raise ValueError('energy_consumed must be a non-negative number.')
+
+    timestamp = row.get('timestamp')
+    if timestamp in (None, ''):
+        timestamp = now
+    else:
+        try:
+            timestamp = parse_datetime(str(timestamp))
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise ValueError('timestamp must be an ISO 8601 datetime.')
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+    # Past detached months and months without a partition yet
+    if not partitions.writable_months.accepts(timestamp):
+        raise ValueError(TIMESTAMP_NOT_STORED_ERROR)
+
+    return device_id, device_identifier, timestamp, energy_consumed
+
+
+def ingest_readings(user, rows):
+    # Validates a batch of readings, checks device ownership and writes the
+    # accepted rows in one transaction.
+    now = timezone.now()
+    results = [None] * len(rows)
+    parsed = []
+
+    for index, row in enumerate(rows):
+        try:
+            parsed.append((index,) + _parse_reading(row, now))
+        except ValueError as exc:
+            results[index] = {'index': index, 'status': 'rejected', 'error': str(exc)}
+
+    # Identifiers resolve through the in-process device cache; numeric ids
+    # are checked with a single query.
+    identifiers = {identifier for _, _, identifier, _, _ in parsed if identifier is not None}
+    devices_by_identifier = device_cache.resolve_many(identifiers) if identifiers else {}
+    device_ids = {device_id for _, device_id, _, _, _ in parsed if device_id is not None}
+    owned_devices = {}
+    if device_ids:
+        owned_devices = dict(
+            SmartHomeDevice.objects.filter(user=user, id__in=device_ids).values_list('id', 'is_active')
+        )
+
+    readings = []
+    accepted_indexes = []
+    for index, device_id, device_identifier, timestamp, energy_consumed in parsed:
+        if device_identifier is not None:
+            device = devices_by_identifier.get(device_identifier)
+            if device is None or device.user_id != user.id:
+                results[index] = {'index': index, 'status': 'rejected', 'error': DEVICE_NOT_FOUND_ERROR}
+                continue
+            device_id, is_active = device.pk, device.is_active
+        elif device_id in owned_devices:
+            is_active = owned_devices[device_id]
+        else:
+            results[index] = {'index': index, 'status': 'rejected', 'error': DEVICE_NOT_FOUND_ERROR}
+            continue
+        if not is_active:
+            results[index] = {'index': index, 'status': 'rejected', 'error': DEVICE_INACTIVE_ERROR}
+            continue
+        readings.append(EnergyUsage(device_id=device_id, timestamp=timestamp, energy_consumed=energy_consumed))
+        accepted_indexes.append(index)
+
+    if readings:
+        with transaction.atomic():
+            EnergyUsage.objects.bulk_create(readings, batch_size=BULK_CREATE_BATCH_SIZE)
+            rollups.apply_readings(
+                (reading.device_id, user.id, reading.timestamp, reading.energy_consumed) for reading in readings
+            )
+            last_sync_buffer.record_on_commit({reading.device_id for reading in readings}, now)
+
+    for index in accepted_indexes:
+        results[index] = {'index': index, 'status': 'accepted'}
+
+    return {
+        'accepted': len(readings),
+        'rejected': len(rows) - len(readings),
+        'results': results,
+    }
@@ -0,0 +1,104 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from energy_dashboard.models import SmartHomeDevice
+
+UPDATE_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class LastSyncBuffer:
+    # Write-behind buffer for SmartHomeDevice.last_sync. Ingestion records the
+    # latest sync time per device in memory; a background thread writes them
+    # with one UPDATE per batch of devices every flush_interval seconds, and
+    # whatever is left is flushed at interpreter exit. With an interval of 0
+    # every record is written immediately.
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _interval(self):
+        if self.flush_interval is not None:
+            return self.flush_interval
+        return settings.DEVICE_LAST_SYNC_FLUSH_SECONDS
+
+    def record(self, device_ids, synced_at):
+        with self._lock:
+            for device_id in device_ids:
+                current = self._pending.get(device_id)
+                if current is None or current < synced_at:
+                    self._pending[device_id] = synced_at
+        if self._interval() <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def record_on_commit(self, device_ids, synced_at):
+        device_ids = list(device_ids)
+        transaction.on_commit(lambda: self.record(device_ids, synced_at))
+
+    def flush(self):
+        # Returns the number of devices written
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = sorted(pending.items())
+        try:
+            for start in range(0, len(items), UPDATE_BATCH_SIZE):
+                batch = items[start:start + UPDATE_BATCH_SIZE]
+                synced_at = Case(
+                    *[When(id=device_id, then=Value(timestamp)) for device_id, timestamp in batch],
+                    output_field=DateTimeField(),
+                )
+                # Never move last_sync backwards if another process wrote a newer time
+                SmartHomeDevice.objects.filter(id__in=[device_id for device_id, _ in batch]).update(
+                    last_sync=Greatest(Coalesce(F('last_sync'), synced_at), synced_at),
+                )
+        except Exception:
+            with self._lock:
+                for device_id, timestamp in pending.items():
+                    current = self._pending.get(device_id)
+                    if current is None or current < timestamp:
+                        self._pending[device_id] = timestamp
+            raise
+        return len(items)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='last-sync-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self._interval()):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush device last_sync times; will retry.')
+
+    def close(self):
+        self._wakeup.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush device last_sync times on shutdown.')
+
+
+last_sync_buffer = LastSyncBuffer()
+atexit.register(last_sync_buffer.close)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum
+
+from energy_dashboard.models import CommunityEnergyGoal
+
+KEEPALIVE_SECONDS = 15
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch_progress(goal_ids):
+    # One query for every goal watched in this process
+    goals = CommunityEnergyGoal.objects.filter(pk__in=goal_ids).annotate(shard_progress=Sum('progress_shards__amount'))
+    return {
+        goal.pk: {
+            'id': goal.pk,
+            'current_progress': goal.get_total_progress(),
+            'target_energy_reduction': goal.target_energy_reduction,
+        }
+        for goal in goals
+    }
+
+
+class Subscription:
+    # Holds only the latest payload, so a slow client skips intermediate
+    # updates instead of queueing them.
+    def __init__(self):
+        self._event = asyncio.Event()
+        self._payload = None
+
+    def push(self, payload):
+        self._payload = payload
+        self._event.set()
+
+    async def next(self, timeout):
+        await asyncio.wait_for(self._event.wait(), timeout)
+        self._event.clear()
+        return self._payload
+
+
+class ProgressHub:
+    # In-process broadcast of community goal progress. A single poller task
+    # reads all watched goals at a fixed interval and fans changes out to
+    # every subscriber; it stops when the last subscriber leaves.
+    def __init__(self, poll_interval=None):
+        self.poll_interval = poll_interval
+        self._subscribers = defaultdict(set)
+        self._latest = {}
+        self._poller = None
+
+    def subscribe(self, goal_id):
+        subscription = Subscription()
+        self._subscribers[goal_id].add(subscription)
+        if goal_id in self._latest:
+            subscription.push(self._latest[goal_id])
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, goal_id, subscription):
+        subscribers = self._subscribers.get(goal_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[goal_id]
+            self._latest.pop(goal_id, None)
+
+    def publish(self, progress):
+        for goal_id in list(self._subscribers):
+            # A goal missing from the result was deleted; None ends its streams
+            payload = progress.get(goal_id)
+            if goal_id in self._latest and self._latest[goal_id] == payload:
+                continue
+            self._latest[goal_id] = payload
+            for subscription in list(self._subscribers.get(goal_id, ())):
+                subscription.push(payload)
+
+    async def _poll(self):
+        while self._subscribers:
+            # A failed read (e.g. a dropped database connection) is retried on
+            # the next tick rather than ending the poller for every stream
+            try:
+                progress = await sync_to_async(_fetch_progress)(list(self._subscribers))
+            except Exception:
+                logger.exception('Failed to read community goal progress')
+            else:
+                self.publish(progress)
+            await asyncio.sleep(self.poll_interval or settings.COMMUNITY_PROGRESS_POLL_SECONDS)
+
+
+progress_hub = ProgressHub()
+
+
+async def progress_events(goal_id, hub=progress_hub):
+    # Server-sent events for one goal: a `progress` event per change, comment
+    # lines as keep-alives, and `closed` once the goal is deleted.
+    subscription = hub.subscribe(goal_id)
+    try:
+        while True:
+            try:
+                payload = await subscription.next(KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if payload is None:
+                yield 'event: closed\ndata: {}\n\n'
+                return
+            yield f'event: progress\ndata: {json.dumps(payload)}\n\n'
+    finally:
+        hub.unsubscribe(goal_id, subscription)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from energy_dashboard import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves whole months of old energy readings (live rows or detached partitions) into columnar archive files. '
+        'Series keep reading them from the archive; aggregates use the rollups.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-months', type=int, default=settings.ENERGY_ARCHIVE_AFTER_MONTHS, help='Archive months that ended more than this many months ago.')
+
+    def handle(self, *args, **options):
+        if options['older_than_months'] < 1:
+            raise CommandError('--older-than-months must be at least 1.')
+
+        self.stdout.write('Archiving old energy readings...')
+        try:
+            months, moved = archive.archive(options['older_than_months'])
+        except archive.ArchiveError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Archived {months} month(s), moved {moved} reading(s)'))
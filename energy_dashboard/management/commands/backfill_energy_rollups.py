@@ -0,0 +1,33 @@
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from energy_dashboard import rollups
+
+
+def parse_day(value):
+    try:
+        return datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.min, tzinfo=dt_timezone.utc)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds hourly and daily energy usage rollups from raw readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD). Defaults to the oldest reading.')
+        parser.add_argument('--end', help='Day to stop before (YYYY-MM-DD). Defaults to the day after the newest reading.')
+        parser.add_argument('--chunk-days', type=int, default=rollups.BACKFILL_CHUNK_DAYS, help='Days rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        start = parse_day(options['start']) if options['start'] else None
+        end = parse_day(options['end']) if options['end'] else None
+        if start and end and start >= end:
+            raise CommandError('--start must be before --end.')
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1.')
+
+        self.stdout.write('Rebuilding energy usage rollups...')
+        chunks = rollups.backfill(start=start, end=end, chunk_days=options['chunk_days'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt energy usage rollups in {chunks} chunk(s)'))
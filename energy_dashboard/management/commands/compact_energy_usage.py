@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from energy_dashboard import retention
+
+
+class Command(BaseCommand):
+    help = 'Folds old raw energy readings into rollups, verifies the totals and deletes the raw rows in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.ENERGY_RAW_RETENTION_DAYS, help='Compact raw readings older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=settings.ENERGY_RETENTION_BATCH_SIZE, help='Rows deleted per transaction.')
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 1:
+            raise CommandError('--older-than-days must be at least 1.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        self.stdout.write('Compacting raw energy readings...')
+        try:
+            days, deleted = retention.compact(options['older_than_days'], batch_size=options['batch_size'])
+        except retention.CompactionError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Compacted {days} day(s), deleted {deleted} raw reading(s)'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from energy_dashboard import analysis
+
+
+class Command(BaseCommand):
+    help = 'Analyzes hourly consumption of every active device and creates device-specific energy-saving recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookback-days', type=int, default=analysis.LOOKBACK_DAYS, help='Days of history to analyze.')
+        parser.add_argument('--batch-size', type=int, default=analysis.DEVICE_BATCH_SIZE, help='Devices analyzed per batch.')
+
+    def handle(self, *args, **options):
+        if options['lookback_days'] <= analysis.BASELINE_DAYS:
+            raise CommandError(f'--lookback-days must be greater than {analysis.BASELINE_DAYS}.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        self.stdout.write('Analyzing device energy consumption...')
+        created = analysis.detect_anomalies(lookback_days=options['lookback_days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {created} candidate recommendation(s)'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from energy_dashboard import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Generates energy-saving recommendations for every user with smart devices, skipping ones they already have'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=recommendations.USER_BATCH_SIZE, help='Users processed per batch.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        self.stdout.write('Generating energy-saving recommendations...')
+        generated = recommendations.generate_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {generated} candidate recommendation(s)'))
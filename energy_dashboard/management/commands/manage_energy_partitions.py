@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from django.utils import timezone
+
+from energy_dashboard import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates upcoming monthly energy usage partitions and detaches old ones. '
+        'Detached months are no longer returned by EnergyUsage queries; their rollups are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Convert the EnergyUsage table to a partitioned table (PostgreSQL).')
+        parser.add_argument('--premake', type=int, default=settings.ENERGY_USAGE_PARTITION_PREMAKE_MONTHS, help='Number of future months to create partitions for.')
+        parser.add_argument('--detach-after', type=int, default=settings.ENERGY_USAGE_PARTITION_DETACH_AFTER_MONTHS, help='Detach partitions older than this many months (0 keeps everything attached).')
+
+    def handle(self, *args, **options):
+        if not settings.ENERGY_USAGE_PARTITIONING:
+            raise CommandError('Energy usage partitioning is disabled. Set ENERGY_USAGE_PARTITIONING=True to enable it.')
+        if options['premake'] < 0 or options['detach_after'] < 0:
+            raise CommandError('--premake and --detach-after must not be negative.')
+
+        backend = partitions.get_backend()
+        if not backend.is_enabled():
+            if not options['convert']:
+                raise CommandError('The energy usage table is not partitioned yet. Run again with --convert.')
+            self.stdout.write('Converting the energy usage table to a partitioned table...')
+            backend.enable()
+            self.stdout.write(self.style.SUCCESS('Energy usage table converted'))
+
+        current = partitions.month_start(timezone.now())
+        if backend.native:
+            for offset in range(options['premake'] + 1):
+                month = partitions.add_months(current, offset)
+                try:
+                    if backend.create_partition(month):
+                        self.stdout.write(self.style.SUCCESS(f'Created partition {partitions.partition_name(month)}'))
+                except DatabaseError as exc:
+                    self.stderr.write(self.style.WARNING(f'Could not create partition {partitions.partition_name(month)}: {exc}'))
+
+        if options['detach_after']:
+            cutoff = partitions.add_months(current, -options['detach_after'])
+            for month in backend.attached_months():
+                if month < cutoff and backend.detach_partition(month):
+                    self.stdout.write(self.style.SUCCESS(f'Detached partition {partitions.partition_name(month)}'))
+
+        partitions.writable_months.invalidate()
+        self.stdout.write(self.style.SUCCESS('Energy usage partitions are up to date'))
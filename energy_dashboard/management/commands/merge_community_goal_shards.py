@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from energy_dashboard import community
+
+
+class Command(BaseCommand):
+    help = 'Folds sharded community goal contributions into each goal\'s current progress'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Merging community goal progress shards...')
+        merged = community.merge_progress_shards()
+        self.stdout.write(self.style.SUCCESS(f'Merged shards of {merged} goal(s)'))
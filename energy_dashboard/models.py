@@ -1,4 +1,8 @@
+import hashlib
+import random
+
 from django.db import models
+from django.db.models import F, Sum
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -27,19 +31,100 @@ class EnergyUsage(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['device', 'timestamp']),
+            models.Index(fields=['timestamp', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.device.device_name} - {self.energy_consumed} kWh at {self.timestamp}"
 
+class EnergyRollup(models.Model):
+    PERIOD_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the hour or day (UTC) covered by this rollup")
+    energy_sum = models.FloatField(default=0.0, help_text="Total energy consumed in kWh")
+    reading_count = models.PositiveIntegerField(default=0)
+    energy_min = models.FloatField(null=True, blank=True)
+    energy_max = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+class DeviceEnergyRollup(EnergyRollup):
+    device = models.ForeignKey(SmartHomeDevice, on_delete=models.CASCADE, related_name='energy_rollups')
+
+    class Meta:
+        unique_together = ('device', 'period', 'bucket')
+
+    def __str__(self):
+        return f"{self.device.device_name} - {self.period} {self.bucket} - {self.energy_sum} kWh"
+
+class UserEnergyRollup(EnergyRollup):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='energy_rollups')
+
+    class Meta:
+        unique_together = ('user', 'period', 'bucket')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.period} {self.bucket} - {self.energy_sum} kWh"
+
+class CompactedEnergyDay(models.Model):
+    day = models.DateTimeField(unique=True, help_text="Start of the UTC day whose raw readings were compacted into rollups")
+    reading_count = models.PositiveIntegerField()
+    energy_total = models.FloatField(help_text="Verified total in kWh at compaction time")
+    compacted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['day']
+
+    def __str__(self):
+        return f"Compacted {self.day:%Y-%m-%d} - {self.reading_count} readings"
+
+class ArchivedEnergyMonth(models.Model):
+    month = models.DateField(unique=True, help_text="First day of the UTC month whose readings were moved to the columnar archive")
+    path = models.CharField(max_length=255, help_text="Storage prefix of the month's array files")
+    reading_count = models.PositiveIntegerField()
+    energy_total = models.FloatField(help_text="Total in kWh of the archived readings")
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['month']
+
+    def __str__(self):
+        return f"Archived {self.month:%Y-%m} - {self.reading_count} readings"
+
 class EnergySavingRecommendation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='energy_recommendations')
+    device = models.ForeignKey(SmartHomeDevice, on_delete=models.CASCADE, null=True, blank=True, related_name='energy_recommendations')
     recommendation_text = models.TextField()
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_hash'], name='unique_energy_recommendation_content'),
+        ]
+
     def __str__(self):
         return f"Recommendation for {self.user.username} at {self.created_at}"
 
+    @staticmethod
+    def make_content_hash(user_id, device_id, key):
+        return hashlib.sha256(f"{user_id}:{device_id or ''}:{key}".encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        # Only new rows; rows from before the hash existed may be duplicates
+        # of each other, and hashing them on a later save would collide
+        if self._state.adding and self.content_hash is None:
+            self.content_hash = self.make_content_hash(self.user_id, self.device_id, self.recommendation_text)
+        super().save(*args, **kwargs)
+
 class CommunityEnergyGoal(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
@@ -47,13 +132,51 @@ class CommunityEnergyGoal(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     current_progress = models.FloatField(default=0.0, help_text="Current energy reduction in kWh")
+    sharded_progress = models.BooleanField(default=False, help_text="Spread contributions over counter shards (for very popular goals)")
+    threshold_reached_at = models.DateTimeField(null=True, blank=True, help_text="When progress first reached 75% of the target")
 
     def __str__(self):
         return self.title
 
     def update_progress(self, energy_reduced):
-        self.current_progress += energy_reduced
-        self.save()
+        if self.sharded_progress:
+            CommunityGoalProgressShard.increment(self.pk, energy_reduced)
+        else:
+            CommunityEnergyGoal.objects.filter(pk=self.pk).update(current_progress=F('current_progress') + energy_reduced)
+
+    def get_total_progress(self):
+        # Merged progress plus contributions still sitting in shards; list
+        # views annotate shard_progress to avoid a query per goal.
+        shard_progress = getattr(self, 'shard_progress', None)
+        if shard_progress is None:
+            if not self.sharded_progress:
+                return self.current_progress
+            shard_progress = self.progress_shards.aggregate(total=Sum('amount'))['total'] or 0.0
+        return self.current_progress + shard_progress
+
+class CommunityGoalProgressShard(models.Model):
+    SHARD_COUNT = 16
+
+    community_goal = models.ForeignKey(CommunityEnergyGoal, on_delete=models.CASCADE, related_name='progress_shards')
+    shard = models.PositiveSmallIntegerField()
+    amount = models.FloatField(default=0.0, help_text="Unmerged energy reduction in kWh")
+
+    class Meta:
+        unique_together = ('community_goal', 'shard')
+
+    def __str__(self):
+        return f"{self.community_goal.title} - shard {self.shard} - {self.amount} kWh"
+
+    @classmethod
+    def increment(cls, community_goal_id, amount):
+        shard = random.randrange(cls.SHARD_COUNT)
+        shards = cls.objects.filter(community_goal_id=community_goal_id, shard=shard)
+        if not shards.update(amount=F('amount') + amount):
+            cls.objects.bulk_create(
+                [cls(community_goal_id=community_goal_id, shard=number) for number in range(cls.SHARD_COUNT)],
+                ignore_conflicts=True,
+            )
+            shards.update(amount=F('amount') + amount)
 
 class UserCommunityProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='community_progress')
@@ -0,0 +1,288 @@
+import re
+import threading
+from datetime import date, datetime, time, timezone as dt_timezone
+from time import monotonic
+
+from django.db import connection, models, transaction
+from django.db.models import Max, Min
+
+from energy_dashboard.models import SmartHomeDevice, EnergyUsage
+
+TABLE = EnergyUsage._meta.db_table
+COLUMNS = 'id, device_id, timestamp, energy_consumed'
+PARTITION_PATTERN = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+_partition_models = {}
+
+WRITABLE_MONTHS_TTL = 60
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    start = datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+    end = datetime.combine(add_months(month, 1), time.min, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def parse_partition_name(name):
+    match = PARTITION_PATTERN.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def partition_model(month):
+    # Unmanaged model bound to one month's table, so detached partitions can
+    # be read with the ORM like the live table.
+    name = partition_name(month)
+    model = _partition_models.get(name)
+    if model is None:
+        meta = type('Meta', (), {
+            'db_table': name,
+            'managed': False,
+            'app_label': EnergyUsage._meta.app_label,
+            'indexes': [models.Index(fields=['device', 'timestamp'], name=f'eu_p{month:%Y_%m}_dev_ts')],
+        })
+        model = type(f'EnergyUsagePartition{month:%Y%m}', (models.Model,), {
+            '__module__': __name__,
+            'Meta': meta,
+            'device': models.ForeignKey(SmartHomeDevice, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False),
+            'timestamp': models.DateTimeField(),
+            'energy_consumed': models.FloatField(),
+        })
+        _partition_models[name] = model
+    return model
+
+
+class PostgresPartitionBackend:
+    # Native declarative range partitioning on EnergyUsage.timestamp. enable()
+    # spreads the existing rows over one partition per month and creates no
+    # DEFAULT partition, so detaching can run CONCURRENTLY.
+    native = True
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _fetch(self, sql, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def is_enabled(self):
+        return bool(self._fetch(
+            'SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s',
+            [TABLE],
+        ))
+
+    def _create_month(self, cursor, month):
+        start, end = month_bounds(month)
+        quote = self.connection.ops.quote_name
+        cursor.execute(
+            f'CREATE TABLE {quote(partition_name(month))} PARTITION OF {quote(TABLE)} '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+
+    def enable(self):
+        # Copies every row into its month's partition while the table is
+        # locked, so run it in a maintenance window on large tables.
+        if self.is_enabled():
+            return False
+
+        quote = self.connection.ops.quote_name
+        table = quote(TABLE)
+        legacy = quote(f'{TABLE}_legacy')
+        device_table = quote(SmartHomeDevice._meta.db_table)
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) + 1, MIN("timestamp"), MAX("timestamp") FROM {table}')
+            next_id, first, last = cursor.fetchone()
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+            cursor.execute(
+                f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+                f'PARTITION BY RANGE ("timestamp")'
+            )
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)", [TABLE, next_id])
+            cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "timestamp")')
+            cursor.execute(
+                f'ALTER TABLE {table} ADD FOREIGN KEY (device_id) REFERENCES {device_table} (id) '
+                f'DEFERRABLE INITIALLY DEFERRED'
+            )
+            cursor.execute(f'CREATE INDEX ON {table} (device_id, "timestamp")')
+            cursor.execute(f'CREATE INDEX ON {table} ("timestamp", id)')
+
+            # One partition for every month from the oldest reading to the
+            # newest (or the current month), so no row is left without one
+            current = month_start(datetime.now(dt_timezone.utc))
+            month = month_start(first.astimezone(dt_timezone.utc)) if first else current
+            last_month = max(month_start(last.astimezone(dt_timezone.utc)), current) if last else current
+            while month <= last_month:
+                self._create_month(cursor, month)
+                month = add_months(month, 1)
+            cursor.execute(f'INSERT INTO {table} ({COLUMNS}) SELECT {COLUMNS} FROM {legacy}')
+            cursor.execute(f'DROP TABLE {legacy}')
+        return True
+
+    def attached_months(self):
+        rows = self._fetch(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [TABLE],
+        )
+        return sorted(month for month in (parse_partition_name(row[0]) for row in rows) if month)
+
+    def detached_months(self):
+        attached = set(self.attached_months())
+        names = self.connection.introspection.table_names()
+        return sorted(
+            month for month in (parse_partition_name(name) for name in names)
+            if month and month not in attached
+        )
+
+    def create_partition(self, month):
+        if month in self.attached_months():
+            return False
+        with self.connection.cursor() as cursor:
+            self._create_month(cursor, month)
+        return True
+
+    def detach_partition(self, month):
+        if month not in self.attached_months():
+            return False
+        quote = self.connection.ops.quote_name
+        # CONCURRENTLY avoids blocking readers and writers of the parent table,
+        # but needs PostgreSQL 14+ and cannot run inside a transaction block
+        concurrently = self.connection.pg_version >= 140000 and not self.connection.in_atomic_block
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(partition_name(month))}'
+                f'{" CONCURRENTLY" if concurrently else ""}'
+            )
+        return True
+
+
+class TablePerMonthBackend:
+    # Fallback for databases without declarative partitioning (e.g. SQLite in
+    # local development): the live EnergyUsage table holds every attached
+    # month, and detaching a month moves its rows into a table of its own.
+    native = False
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def is_enabled(self):
+        return True
+
+    def enable(self):
+        return False
+
+    def attached_months(self):
+        bounds = EnergyUsage.objects.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+        if bounds['first'] is None:
+            return []
+        months = []
+        month = month_start(bounds['first'].astimezone(dt_timezone.utc))
+        last = month_start(bounds['last'].astimezone(dt_timezone.utc))
+        while month <= last:
+            months.append(month)
+            month = add_months(month, 1)
+        return months
+
+    def detached_months(self):
+        names = self.connection.introspection.table_names()
+        return sorted(month for month in (parse_partition_name(name) for name in names) if month)
+
+    def create_partition(self, month):
+        return False
+
+    def detach_partition(self, month):
+        model = partition_model(month)
+        if month not in self.detached_months():
+            # SQLite cannot alter its schema inside a transaction block
+            with self.connection.schema_editor() as schema_editor:
+                schema_editor.create_model(model)
+
+        start, end = month_bounds(month)
+        rows = EnergyUsage.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by()
+        select_sql, params = rows.values_list('id', 'device_id', 'timestamp', 'energy_consumed').query.sql_with_params()
+        quote = self.connection.ops.quote_name
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO {quote(model._meta.db_table)} ({COLUMNS}) {select_sql}', params)
+                moved = cursor.rowcount
+            # Raw delete, without the signals that would take the month out of
+            # its rollups (see rollups.delete_sealed_readings)
+            rows._raw_delete(rows.db)
+        return moved > 0
+
+
+class WritableMonths:
+    # Months a new reading can be stored in. A natively partitioned table has
+    # no DEFAULT partition, so a reading outside its attached months would
+    # fail the insert; ingestion checks timestamps here first. None means any
+    # month (table not partitioned). Cached for WRITABLE_MONTHS_TTL seconds,
+    # as partitions only change when manage_energy_partitions runs.
+    def __init__(self, ttl=WRITABLE_MONTHS_TTL):
+        self.ttl = ttl
+        self._months = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._loaded_at is not None and monotonic() - self._loaded_at <= self.ttl:
+                return self._months
+        backend = get_backend()
+        months = frozenset(backend.attached_months()) if backend.native and backend.is_enabled() else None
+        with self._lock:
+            self._months = months
+            self._loaded_at = monotonic()
+        return months
+
+    def accepts(self, timestamp):
+        months = self.get()
+        return months is None or month_start(timestamp.astimezone(dt_timezone.utc)) in months
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+writable_months = WritableMonths()
+
+
+def get_backend(using_connection=None):
+    using_connection = using_connection or connection
+    if using_connection.vendor == 'postgresql':
+        return PostgresPartitionBackend(using_connection)
+    return TablePerMonthBackend(using_connection)
+
+
+def models_for_range(start, end, backend=None):
+    # Routes a [start, end) window to the tables holding it: EnergyUsage for
+    # attached months, plus the partition model of each detached month.
+    backend = backend or get_backend()
+    first = month_start(start)
+    last = month_start(end)
+    detached = set(backend.detached_months())
+    months = []
+    month = first
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    routes = [partition_model(month) for month in months if month in detached]
+    if any(month not in detached for month in months):
+        routes.insert(0, EnergyUsage)
+    return routes
@@ -0,0 +1,70 @@
+from django.db.models import Sum
+
+from energy_dashboard import rollups
+from energy_dashboard.models import SmartHomeDevice, UserEnergyRollup, EnergySavingRecommendation
+
+BULK_BATCH_SIZE = 1000
+USER_BATCH_SIZE = 5000
+HIGH_USAGE_THRESHOLD_KWH = 100
+
+HIGH_USAGE_TEXT = "Consider using energy-efficient appliances to reduce your consumption."
+THERMOSTAT_TEXT = "Optimize your thermostat settings to save energy during peak hours."
+NO_THERMOSTAT_TEXT = "Consider installing a smart thermostat for better energy management."
+
+
+def build(user_id, text, device_id=None, dedup_key=None):
+    # dedup_key identifies the advice when its text carries changing numbers;
+    # by default the text itself is hashed.
+    return EnergySavingRecommendation(
+        user_id=user_id,
+        device_id=device_id,
+        recommendation_text=text,
+        content_hash=EnergySavingRecommendation.make_content_hash(user_id, device_id, dedup_key or text),
+    )
+
+
+def emit(recommendations):
+    # Inserts recommendations, silently skipping any the user already has
+    EnergySavingRecommendation.objects.bulk_create(recommendations, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+    return len(recommendations)
+
+
+def generate_for_users(user_ids):
+    # Two grouped queries for the whole batch of users instead of per-user
+    # aggregates and device iteration.
+    high_usage = set(
+        UserEnergyRollup.objects
+        .filter(user_id__in=user_ids, period=rollups.DAY)
+        .values('user_id')
+        .annotate(total=Sum('energy_sum'))
+        .filter(total__gt=HIGH_USAGE_THRESHOLD_KWH)
+        .values_list('user_id', flat=True)
+    )
+    with_thermostat = set(
+        SmartHomeDevice.objects
+        .filter(user_id__in=user_ids, device_type='thermostat')
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+
+    recommendations = []
+    for user_id in user_ids:
+        if user_id in high_usage:
+            recommendations.append(build(user_id, HIGH_USAGE_TEXT))
+        recommendations.append(build(user_id, THERMOSTAT_TEXT if user_id in with_thermostat else NO_THERMOSTAT_TEXT))
+    return recommendations
+
+
+def generate_all(batch_size=USER_BATCH_SIZE):
+    # Covers every user with at least one smart device, in id-ordered batches.
+    # Returns the number of candidate recommendations (duplicates are skipped
+    # on insert).
+    owners = SmartHomeDevice.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    generated = 0
+    last_user_id = 0
+    while True:
+        user_ids = list(owners.filter(user_id__gt=last_user_id)[:batch_size])
+        if not user_ids:
+            return generated
+        last_user_id = user_ids[-1]
+        generated += emit(generate_for_users(user_ids))
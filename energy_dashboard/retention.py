@@ -0,0 +1,102 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from energy_dashboard import partitions, rollups
+from energy_dashboard.models import EnergyUsage, DeviceEnergyRollup, UserEnergyRollup, CompactedEnergyDay, ArchivedEnergyMonth
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+class CompactionError(Exception):
+    pass
+
+
+def raw_horizon(older_than_days):
+    # Raw readings before this UTC midnight are eligible for compaction
+    return rollups.bucket_start(timezone.now() - timedelta(days=older_than_days), rollups.DAY)
+
+
+def _totals_match(raw, rolled):
+    if raw['count'] != (rolled['count'] or 0):
+        return False
+    return math.isclose(raw['total'] or 0.0, rolled['total'] or 0.0, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def _rollups_match(day, raw):
+    # Both the device and the user rollups must account for every reading
+    return all(
+        _totals_match(raw, model.objects.filter(period=rollups.DAY, bucket=day).aggregate(
+            total=Sum('energy_sum'), count=Sum('reading_count'),
+        ))
+        for model in (DeviceEnergyRollup, UserEnergyRollup)
+    )
+
+
+def _verified_totals(day, day_end):
+    raw = EnergyUsage.objects.filter(timestamp__gte=day, timestamp__lt=day_end).aggregate(
+        total=Sum('energy_consumed'), count=Count('id'),
+    )
+    if _rollups_match(day, raw):
+        return raw
+
+    # Rollups are missing readings (e.g. rows written before rollups
+    # existed), so fold the day again from its raw readings.
+    rollups.backfill(day, day_end)
+    if not _rollups_match(day, raw):
+        raise CompactionError(f'Rollup totals for {day:%Y-%m-%d} do not match its raw readings.')
+    return raw
+
+
+def _waits_for_archive(day, archived_months):
+    # With archiving enabled, raw readings are kept until their month has
+    # been archived, so series can still read them from the archive
+    return settings.ENERGY_ARCHIVE_AFTER_MONTHS > 0 and partitions.month_start(day) not in archived_months
+
+
+def compact_day(day, batch_size=DEFAULT_BATCH_SIZE):
+    # Seals one UTC day once its rollups are verified against the raw
+    # readings, then deletes those readings in short, bounded transactions.
+    day_end = day + timedelta(days=1)
+    if not CompactedEnergyDay.objects.filter(day=day).exists():
+        totals = _verified_totals(day, day_end)
+        CompactedEnergyDay.objects.get_or_create(
+            day=day, defaults={'reading_count': totals['count'], 'energy_total': totals['total'] or 0.0},
+        )
+
+    raw = EnergyUsage.objects.filter(timestamp__gte=day, timestamp__lt=day_end).order_by()
+    deleted = 0
+    while True:
+        ids = list(raw.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted += rollups.delete_sealed_readings(EnergyUsage.objects.filter(id__in=ids))
+
+
+def compact(older_than_days, batch_size=DEFAULT_BATCH_SIZE):
+    # Compacts every day of raw readings older than the horizon, oldest
+    # first, skipping months still waiting for the archive. Returns (days
+    # compacted, readings deleted).
+    horizon = raw_horizon(older_than_days)
+    first = EnergyUsage.objects.filter(timestamp__lt=horizon).aggregate(first=Min('timestamp'))['first']
+    if first is None:
+        return 0, 0
+
+    archived_months = set(ArchivedEnergyMonth.objects.values_list('month', flat=True))
+    days = 0
+    deleted = 0
+    day = rollups.bucket_start(first, rollups.DAY)
+    while day < horizon:
+        if (
+            not _waits_for_archive(day, archived_months)
+            and EnergyUsage.objects.filter(timestamp__gte=day, timestamp__lt=day + timedelta(days=1)).exists()
+        ):
+            deleted += compact_day(day, batch_size=batch_size)
+            days += 1
+        day += timedelta(days=1)
+    return days, deleted
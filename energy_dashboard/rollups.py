@@ -0,0 +1,359 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, QuerySet, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.db.models.functions import TruncDay, TruncHour
+
+from energy_dashboard import partitions
+from energy_dashboard.models import (
+    SmartHomeDevice, EnergyUsage, DeviceEnergyRollup, UserEnergyRollup, CompactedEnergyDay, ArchivedEnergyMonth
+)
+
+HOUR = 'hour'
+DAY = 'day'
+PERIODS = (HOUR, DAY)
+
+BULK_BATCH_SIZE = 1000
+BACKFILL_CHUNK_DAYS = 7
+
+_TRUNC_FUNCTIONS = {
+    HOUR: TruncHour,
+    DAY: TruncDay,
+}
+
+_PERIOD_LENGTHS = {
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1),
+}
+
+
+def bucket_start(timestamp, period):
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    if period == HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _accumulate(deltas, key, energy_sum, reading_count, energy_min, energy_max):
+    stats = deltas.get(key)
+    if stats is None:
+        deltas[key] = [energy_sum, reading_count, energy_min, energy_max]
+        return
+    stats[0] += energy_sum
+    stats[1] += reading_count
+    stats[2] = min(stats[2], energy_min)
+    stats[3] = max(stats[3], energy_max)
+
+
+def _merge_deltas(model, owner_field, deltas):
+    # Upserts rollup rows: missing rows are inserted empty, then every row the
+    # batch touches is locked, merged in Python and written back in bulk.
+    owner_attname = f'{owner_field}_id'
+    by_period = {}
+    for key in deltas:
+        by_period.setdefault(key[1], []).append(key)
+
+    for period, keys in by_period.items():
+        model.objects.bulk_create(
+            [model(**{owner_attname: owner_id, 'period': period, 'bucket': bucket}) for owner_id, _, bucket in keys],
+            batch_size=BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+        rows = model.objects.select_for_update().filter(**{
+            f'{owner_attname}__in': {owner_id for owner_id, _, _ in keys},
+            'period': period,
+            'bucket__gte': min(bucket for _, _, bucket in keys),
+            'bucket__lte': max(bucket for _, _, bucket in keys),
+        })
+
+        changed = []
+        for row in rows:
+            stats = deltas.get((getattr(row, owner_attname), row.period, row.bucket))
+            if stats is None:
+                continue
+            row.energy_sum += stats[0]
+            row.reading_count += stats[1]
+            row.energy_min = stats[2] if row.energy_min is None else min(row.energy_min, stats[2])
+            row.energy_max = stats[3] if row.energy_max is None else max(row.energy_max, stats[3])
+            changed.append(row)
+
+        model.objects.bulk_update(
+            changed, ['energy_sum', 'reading_count', 'energy_min', 'energy_max'], batch_size=BULK_BATCH_SIZE
+        )
+
+
+def apply_readings(readings):
+    # readings: iterable of (device_id, user_id, timestamp, energy_consumed)
+    device_deltas = {}
+    user_deltas = {}
+    for device_id, user_id, timestamp, energy_consumed in readings:
+        for period in PERIODS:
+            bucket = bucket_start(timestamp, period)
+            _accumulate(device_deltas, (device_id, period, bucket), energy_consumed, 1, energy_consumed, energy_consumed)
+            _accumulate(user_deltas, (user_id, period, bucket), energy_consumed, 1, energy_consumed, energy_consumed)
+
+    if not device_deltas:
+        return
+
+    with transaction.atomic():
+        _merge_deltas(DeviceEnergyRollup, 'device', device_deltas)
+        _merge_deltas(UserEnergyRollup, 'user', user_deltas)
+
+
+def _extremes(model, period, owner_ids, first, last):
+    # {(owner_id, bucket): (min, max)} recomputed from the level below: raw
+    # readings for device rollups, device rollups for user rollups
+    if model is DeviceEnergyRollup:
+        rows = (
+            EnergyUsage.objects
+            .filter(device_id__in=owner_ids, timestamp__gte=first, timestamp__lt=last + _PERIOD_LENGTHS[period])
+            .annotate(owner_id=F('device_id'), rollup_bucket=_TRUNC_FUNCTIONS[period]('timestamp', tzinfo=dt_timezone.utc))
+            .values('owner_id', 'rollup_bucket')
+            .annotate(minimum=Min('energy_consumed'), maximum=Max('energy_consumed'))
+            .order_by()
+        )
+    else:
+        rows = (
+            DeviceEnergyRollup.objects
+            .filter(device__user_id__in=owner_ids, period=period, bucket__gte=first, bucket__lte=last)
+            .annotate(owner_id=F('device__user_id'), rollup_bucket=F('bucket'))
+            .values('owner_id', 'rollup_bucket')
+            .annotate(minimum=Min('energy_min'), maximum=Max('energy_max'))
+            .order_by()
+        )
+    return {(row['owner_id'], row['rollup_bucket']): (row['minimum'], row['maximum']) for row in rows}
+
+
+def _subtract_deltas(model, owner_field, deltas):
+    # Takes {(owner_id, period, bucket): [energy_sum, reading_count]} out of
+    # the rollup rows. A min/max cannot be undone, so the touched rows get
+    # theirs recomputed; rows left without readings are deleted.
+    owner_attname = f'{owner_field}_id'
+    by_period = {}
+    for key in deltas:
+        by_period.setdefault(key[1], []).append(key)
+
+    for period, keys in by_period.items():
+        owner_ids = {owner_id for owner_id, _, _ in keys}
+        first = min(bucket for _, _, bucket in keys)
+        last = max(bucket for _, _, bucket in keys)
+        rows = model.objects.select_for_update().filter(**{
+            f'{owner_attname}__in': owner_ids, 'period': period, 'bucket__gte': first, 'bucket__lte': last,
+        })
+
+        changed = []
+        emptied = []
+        for row in rows:
+            stats = deltas.get((getattr(row, owner_attname), row.period, row.bucket))
+            if stats is None:
+                continue
+            row.energy_sum -= stats[0]
+            row.reading_count -= stats[1]
+            (emptied if row.reading_count <= 0 else changed).append(row)
+
+        model.objects.filter(pk__in=[row.pk for row in emptied]).delete()
+        if not changed:
+            continue
+        extremes = _extremes(model, period, owner_ids, first, last)
+        for row in changed:
+            # Buckets whose raw readings are sealed keep their stored extremes
+            row.energy_min, row.energy_max = extremes.get(
+                (getattr(row, owner_attname), row.bucket), (row.energy_min, row.energy_max),
+            )
+        model.objects.bulk_update(
+            changed, ['energy_sum', 'reading_count', 'energy_min', 'energy_max'], batch_size=BULK_BATCH_SIZE
+        )
+
+
+def remove_readings(readings):
+    # Reverses apply_readings for readings that were changed or deleted;
+    # readings: iterable of (device_id, user_id, timestamp, energy_consumed)
+    device_deltas = {}
+    user_deltas = {}
+    for device_id, user_id, timestamp, energy_consumed in readings:
+        for period in PERIODS:
+            bucket = bucket_start(timestamp, period)
+            for deltas, key in ((device_deltas, (device_id, period, bucket)), (user_deltas, (user_id, period, bucket))):
+                stats = deltas.setdefault(key, [0.0, 0])
+                stats[0] += energy_consumed
+                stats[1] += 1
+
+    if not device_deltas:
+        return
+
+    with transaction.atomic():
+        # Device rows first: the user extremes are recomputed from them
+        _subtract_deltas(DeviceEnergyRollup, 'device', device_deltas)
+        _subtract_deltas(UserEnergyRollup, 'user', user_deltas)
+
+
+def delete_sealed_readings(readings):
+    # Deletes raw readings whose rollups stay the source of truth (compacted,
+    # archived or detached), without the signals that would take them out
+    # of the rollups. Returns the number of readings deleted.
+    return readings._raw_delete(readings.db)
+
+
+def _rebuild_chunk(start, end):
+    readings = EnergyUsage.objects.filter(timestamp__gte=start, timestamp__lt=end)
+
+    with transaction.atomic():
+        DeviceEnergyRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+        UserEnergyRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+
+        for period in PERIODS:
+            trunc = _TRUNC_FUNCTIONS[period]
+            rows = (
+                readings
+                .annotate(rollup_bucket=trunc('timestamp', tzinfo=dt_timezone.utc))
+                .values('device_id', 'device__user_id', 'rollup_bucket')
+                .annotate(
+                    total=Sum('energy_consumed'), count=Count('id'),
+                    minimum=Min('energy_consumed'), maximum=Max('energy_consumed'),
+                )
+                .order_by()
+            )
+
+            device_rollups = []
+            user_deltas = {}
+            for row in rows.iterator(chunk_size=BULK_BATCH_SIZE):
+                device_rollups.append(DeviceEnergyRollup(
+                    device_id=row['device_id'], period=period, bucket=row['rollup_bucket'],
+                    energy_sum=row['total'], reading_count=row['count'],
+                    energy_min=row['minimum'], energy_max=row['maximum'],
+                ))
+                _accumulate(
+                    user_deltas, (row['device__user_id'], row['rollup_bucket']),
+                    row['total'], row['count'], row['minimum'], row['maximum'],
+                )
+
+            DeviceEnergyRollup.objects.bulk_create(device_rollups, batch_size=BULK_BATCH_SIZE)
+            UserEnergyRollup.objects.bulk_create(
+                [
+                    UserEnergyRollup(
+                        user_id=user_id, period=period, bucket=bucket,
+                        energy_sum=stats[0], reading_count=stats[1],
+                        energy_min=stats[2], energy_max=stats[3],
+                    )
+                    for (user_id, bucket), stats in user_deltas.items()
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+
+def sealed_days(start, end):
+    # Days whose raw readings are no longer in EnergyUsage (compacted,
+    # archived or in a detached partition), so their rollups are the source
+    # of truth and must not be rebuilt.
+    sealed = set(CompactedEnergyDay.objects.filter(day__gte=start, day__lt=end).values_list('day', flat=True))
+    months = set(
+        ArchivedEnergyMonth.objects
+        .filter(month__gte=partitions.month_start(start), month__lte=partitions.month_start(end))
+        .values_list('month', flat=True)
+    )
+    if settings.ENERGY_USAGE_PARTITIONING:
+        months.update(partitions.get_backend().detached_months())
+    for month in months:
+        month_first, month_end = partitions.month_bounds(month)
+        day = max(month_first, start)
+        while day < min(month_end, end):
+            sealed.add(day)
+            day += timedelta(days=1)
+    return sealed
+
+
+def _unsealed_ranges(start, end):
+    sealed = sealed_days(start, end)
+    ranges = []
+    range_start = None
+    day = start
+    while day < end:
+        if day in sealed:
+            if range_start is not None:
+                ranges.append((range_start, day))
+                range_start = None
+        elif range_start is None:
+            range_start = day
+        day += timedelta(days=1)
+    if range_start is not None:
+        ranges.append((range_start, end))
+    return ranges
+
+
+def backfill(start=None, end=None, chunk_days=BACKFILL_CHUNK_DAYS):
+    # Rebuilds rollups for [start, end) from the raw readings, one chunk of
+    # whole days per transaction. Returns the number of chunks processed.
+    if start is None or end is None:
+        bounds = EnergyUsage.objects.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+        if bounds['first'] is None:
+            return 0
+        start = start or bounds['first']
+        end = end or bounds['last'] + timedelta(days=1)
+
+    start = bucket_start(start, DAY)
+    end = bucket_start(end - timedelta(microseconds=1), DAY) + timedelta(days=1)
+
+    chunks = 0
+    for range_start, range_end in _unsealed_ranges(start, end):
+        chunk_start = range_start
+        while chunk_start < range_end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days), range_end)
+            _rebuild_chunk(chunk_start, chunk_end)
+            chunk_start = chunk_end
+            chunks += 1
+    return chunks
+
+
+# Imported from EnergyDashboardConfig.ready so the receivers are always
+# connected. Bulk inserts bypass these; energy_dashboard.ingest applies its
+# own readings, and queryset.update() needs a backfill of the days touched.
+@receiver(pre_save, sender=EnergyUsage)
+def remember_previous_reading(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk is not None:
+        instance._rollup_previous = (
+            EnergyUsage.objects.filter(pk=instance.pk)
+            .values_list('device_id', 'device__user_id', 'timestamp', 'energy_consumed').first()
+        )
+
+
+@receiver(post_save, sender=EnergyUsage)
+def roll_up_saved_reading(sender, instance, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    user_id = SmartHomeDevice.objects.values_list('user_id', flat=True).get(pk=instance.device_id)
+    with transaction.atomic():
+        if previous is not None:
+            remove_readings([previous])
+        apply_readings([(instance.device_id, user_id, instance.timestamp, instance.energy_consumed)])
+
+
+@receiver(post_delete, sender=EnergyUsage)
+def remove_deleted_reading(sender, instance, origin=None, **kwargs):
+    # Readings deleted along with their device are handled by
+    # remove_device_rollups in one pass
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not EnergyUsage:
+        return
+    user_id = SmartHomeDevice.objects.values_list('user_id', flat=True).filter(pk=instance.device_id).first()
+    if user_id is not None:
+        remove_readings([(instance.device_id, user_id, instance.timestamp, instance.energy_consumed)])
+
+
+@receiver(pre_delete, sender=SmartHomeDevice)
+def remove_device_rollups(sender, instance, **kwargs):
+    # The device's rollups (sealed days included) are taken out of its
+    # user's rollups before they and its readings are deleted by the cascade
+    with transaction.atomic():
+        device_rollups = DeviceEnergyRollup.objects.filter(device_id=instance.pk)
+        deltas = {
+            (instance.user_id, period, bucket): [energy_sum, reading_count]
+            for period, bucket, energy_sum, reading_count
+            in device_rollups.values_list('period', 'bucket', 'energy_sum', 'reading_count')
+        }
+        device_rollups.delete()
+        if deltas:
+            _subtract_deltas(UserEnergyRollup, 'user', deltas)
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils import timezone
+from energy_dashboard import partitions
+from energy_dashboard.ingest import TIMESTAMP_NOT_STORED_ERROR
 from energy_dashboard.models import (
     SmartHomeDevice, EnergyUsage, EnergySavingRecommendation,
     CommunityEnergyGoal, UserCommunityProgress
@@ -13,6 +16,14 @@ class SmartHomeDeviceSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'device_name', 'device_type', 'device_identifier', 'is_active', 'last_sync']
         read_only_fields = ['id', 'user', 'last_sync']
 
+    def update(self, instance, validated_data):
+        # Only write the edited columns; last_sync is kept current by
+        # energy_dashboard.last_sync and the loaded value may already be stale
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 class EnergyUsageSerializer(serializers.ModelSerializer):
     device = serializers.ReadOnlyField(source='device.device_name')
 
@@ -21,18 +32,34 @@ class EnergyUsageSerializer(serializers.ModelSerializer):
         fields = ['id', 'device', 'timestamp', 'energy_consumed']
         read_only_fields = ['id', 'device', 'timestamp']
 
+    def validate(self, data):
+        # Readings are stamped now; the month must have a partition to land in
+        data['timestamp'] = timezone.now()
+        if not partitions.writable_months.accepts(data['timestamp']):
+            raise serializers.ValidationError({'error': TIMESTAMP_NOT_STORED_ERROR})
+        return data
+
 class EnergySavingRecommendationSerializer(serializers.ModelSerializer):
     class Meta:
         model = EnergySavingRecommendation
-        fields = ['id', 'user', 'recommendation_text', 'created_at', 'is_read']
-        read_only_fields = ['id', 'user', 'recommendation_text', 'created_at']
+        fields = ['id', 'user', 'device', 'recommendation_text', 'created_at', 'is_read']
+        read_only_fields = ['id', 'user', 'device', 'recommendation_text', 'created_at']
 
 class CommunityEnergyGoalSerializer(serializers.ModelSerializer):
+    current_progress = serializers.FloatField(source='get_total_progress', read_only=True)
+
     class Meta:
         model = CommunityEnergyGoal
-        fields = ['id', 'title', 'description', 'target_energy_reduction', 'start_date', 'end_date', 'current_progress']
+        fields = ['id', 'title', 'description', 'target_energy_reduction', 'start_date', 'end_date', 'current_progress', 'sharded_progress']
         read_only_fields = ['id', 'current_progress']
 
+    def update(self, instance, validated_data):
+        # Only write the edited columns so concurrent progress increments are kept
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 class UserCommunityProgressSerializer(serializers.ModelSerializer):
     community_goal = serializers.ReadOnlyField(source='community_goal.title')
     user = serializers.ReadOnlyField(source='user.username')
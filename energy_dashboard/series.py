@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from energy_dashboard import archive, partitions, rollups
+from energy_dashboard.models import EnergyUsage, DeviceEnergyRollup, CompactedEnergyDay
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+DEFAULT_RANGE = timedelta(days=7)
+SECONDS_PER_DAY = 86400
+
+BUCKET = 'bucket'
+LTTB = 'lttb'
+METHODS = (BUCKET, LTTB)
+
+
+def _parse_datetime_param(value, name):
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 datetime.')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_series_params(params):
+    # Returns (start, end, points, method) from query parameters
+    end = _parse_datetime_param(params['end'], 'end') if params.get('end') else timezone.now()
+    start = _parse_datetime_param(params['start'], 'start') if params.get('start') else end - DEFAULT_RANGE
+    if start >= end:
+        raise ValueError('start must be before end.')
+
+    try:
+        points = int(params.get('points', DEFAULT_POINTS))
+    except (TypeError, ValueError):
+        raise ValueError('points must be an integer.')
+    if not (3 <= points <= MAX_POINTS):
+        raise ValueError(f'points must be between 3 and {MAX_POINTS}.')
+
+    method = params.get('method', BUCKET)
+    if method not in METHODS:
+        raise ValueError(f'method must be one of: {", ".join(METHODS)}.')
+
+    return start, end, points, method
+
+
+def _to_arrays(rows):
+    timestamps = np.fromiter((row[0].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    values = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return timestamps, values
+
+
+def load_device_series(device_id, start, end):
+    # Fetches (epoch seconds, kWh) pairs for [start, end) as two NumPy arrays,
+    # reading detached monthly partitions too when partitioning is enabled,
+    # and archived months from their memory-mapped files.
+    sources = [EnergyUsage]
+    if settings.ENERGY_USAGE_PARTITIONING:
+        sources = partitions.models_for_range(start, end)
+
+    rows = []
+    for model in sources:
+        rows.extend(
+            model.objects
+            .filter(device_id=device_id, timestamp__gte=start, timestamp__lt=end)
+            .order_by('timestamp')
+            .values_list('timestamp', 'energy_consumed')
+        )
+    timestamps, values = _to_arrays(rows)
+    needs_sort = len(sources) > 1
+
+    archived_t, archived_v = archive.load_device_readings(device_id, start, end)
+    if len(archived_t):
+        timestamps = np.concatenate([timestamps, archived_t])
+        values = np.concatenate([values, archived_v])
+        needs_sort = True
+
+    # Compacted days only survive as rollups, so they contribute hourly points
+    sealed_days = CompactedEnergyDay.objects.filter(
+        day__gte=rollups.bucket_start(start, rollups.DAY), day__lt=end,
+    ).values_list('day', flat=True)
+    sealed = np.array([day.timestamp() for day in sealed_days], dtype=np.float64)
+    if len(sealed):
+        keep = ~np.isin(timestamps // SECONDS_PER_DAY * SECONDS_PER_DAY, sealed)
+        hourly_t, hourly_v = _to_arrays(list(
+            DeviceEnergyRollup.objects
+            .filter(device_id=device_id, period=rollups.HOUR, bucket__gte=start, bucket__lt=end)
+            .order_by('bucket')
+            .values_list('bucket', 'energy_sum')
+        ))
+        hourly_keep = np.isin(hourly_t // SECONDS_PER_DAY * SECONDS_PER_DAY, sealed)
+        timestamps = np.concatenate([timestamps[keep], hourly_t[hourly_keep]])
+        values = np.concatenate([values[keep], hourly_v[hourly_keep]])
+        needs_sort = True
+
+    if needs_sort:
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+    return timestamps, values
+
+
+def bucket_series(timestamps, values, start, end, points):
+    # Sums readings into equal-width buckets, dropping empty ones
+    start_s = start.timestamp()
+    width = (end.timestamp() - start_s) / points
+    indexes = np.clip(((timestamps - start_s) // width).astype(np.int64), 0, points - 1)
+    sums = np.bincount(indexes, weights=values, minlength=points)
+    counts = np.bincount(indexes, minlength=points)
+    occupied = np.nonzero(counts)[0]
+    return start_s + occupied * width, sums[occupied]
+
+
+def lttb_series(timestamps, values, points):
+    # Largest-Triangle-Three-Buckets: keeps the points that best preserve the
+    # visual shape of the curve. Triangle areas are computed per bucket in
+    # vectorized form; only the walk across buckets is sequential.
+    size = len(timestamps)
+    if size <= points:
+        return timestamps, values
+
+    edges = np.linspace(1, size - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+
+    previous = 0
+    for bucket in range(points - 2):
+        lower, upper = edges[bucket], edges[bucket + 1]
+        next_lower = upper
+        next_upper = edges[bucket + 2] if bucket + 2 < len(edges) else size
+        if next_lower >= next_upper:
+            next_lower, next_upper = size - 1, size
+        next_t = timestamps[next_lower:next_upper].mean()
+        next_v = values[next_lower:next_upper].mean()
+
+        bucket_t = timestamps[lower:upper]
+        bucket_v = values[lower:upper]
+        areas = np.abs(
+            (timestamps[previous] - next_t) * (bucket_v - values[previous])
+            - (timestamps[previous] - bucket_t) * (next_v - values[previous])
+        )
+        previous = lower + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return timestamps[selected], values[selected]
+
+
+def device_series(device_id, start, end, points=DEFAULT_POINTS, method=BUCKET):
+    timestamps, values = load_device_series(device_id, start, end)
+    if method == LTTB:
+        timestamps, values = lttb_series(timestamps, values, points)
+    elif len(timestamps):
+        timestamps, values = bucket_series(timestamps, values, start, end, points)
+
+    return {
+        'device': device_id,
+        'start': start,
+        'end': end,
+        'method': method,
+        'timestamps': [datetime.fromtimestamp(ts, tz=dt_timezone.utc) for ts in timestamps.tolist()],
+        'values': values.tolist(),
+    }
@@ -0,0 +1,28 @@
+from django.conf import settings
+
+from energy_dashboard import analysis, archive, community, recommendations, retention
+
+# Entry points for periodic jobs. Call them from cron, Celery beat or any
+# other scheduler; each one is safe to re-run.
+
+
+def compact_energy_usage():
+    return retention.compact(settings.ENERGY_RAW_RETENTION_DAYS, batch_size=settings.ENERGY_RETENTION_BATCH_SIZE)
+
+
+def archive_energy_usage():
+    if settings.ENERGY_ARCHIVE_AFTER_MONTHS < 1:
+        return 0, 0
+    return archive.archive(settings.ENERGY_ARCHIVE_AFTER_MONTHS)
+
+
+def detect_energy_anomalies():
+    return analysis.detect_anomalies()
+
+
+def generate_energy_recommendations():
+    return recommendations.generate_all()
+
+
+def merge_community_goal_shards():
+    return community.merge_progress_shards()
@@ -1,3 +1,720 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from threading import Barrier, Thread
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage, Storage
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from energy_dashboard import (
+    archive, community, device_cache as device_cache_module, forecasting, live, partitions, retention, rollups, series,
+)
+from energy_dashboard.device_cache import DeviceLookupCache
+from energy_dashboard.last_sync import LastSyncBuffer, last_sync_buffer
+from energy_dashboard.models import (
+    ArchivedEnergyMonth, CommunityEnergyGoal, CompactedEnergyDay, DeviceEnergyRollup, EnergySavingRecommendation,
+    EnergyUsage, SmartHomeDevice, UserCommunityProgress, UserEnergyRollup,
+)
+from energy_dashboard.serializers import SmartHomeDeviceSerializer
+
+
+def create_goal(target=10, sharded=False):
+    now = timezone.now()
+    return CommunityEnergyGoal.objects.create(
+        title='Winter savings', description='Cut usage this winter', target_energy_reduction=target,
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=30), sharded_progress=sharded,
+    )
+
+
+class CommunityGoalThresholdTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{index}', password='pass') for index in range(3)]
+
+    def contribute(self, user, goal, amount):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(f'/api/community-progress/update/{goal.id}/', {'energy_reduced': amount})
+        self.assertEqual(response.status_code, 200)
+
+    def notified(self):
+        return list(
+            EnergySavingRecommendation.objects
+            .filter(recommendation_text=community.THRESHOLD_TEXT)
+            .values_list('user__username', flat=True)
+        )
+
+    def test_threshold_is_claimed_once(self):
+        for sharded in (False, True):
+            with self.subTest(sharded=sharded):
+                EnergySavingRecommendation.objects.all().delete()
+                goal = create_goal(sharded=sharded)
+
+                self.contribute(self.users[0], goal, 5)
+                self.assertEqual(self.notified(), [])
+                self.contribute(self.users[1], goal, 3)
+                goal.refresh_from_db()
+                claimed_at = goal.threshold_reached_at
+                self.contribute(self.users[2], goal, 2)
+                self.contribute(self.users[1], goal, 1)
+
+                goal.refresh_from_db()
+                self.assertIsNotNone(claimed_at)
+                self.assertEqual(goal.threshold_reached_at, claimed_at)
+                self.assertEqual(goal.get_total_progress(), 11)
+                self.assertEqual(self.notified(), ['user1'])
+
+    def test_contributions_are_summed_per_user(self):
+        goal = create_goal(target=100)
+        self.contribute(self.users[0], goal, 2)
+        self.contribute(self.users[0], goal, 3)
+
+        progress = UserCommunityProgress.objects.get(user=self.users[0], community_goal=goal)
+        self.assertEqual(progress.energy_contributed, 5)
+
+    def test_threshold_check_after_it_was_claimed_does_not_notify_again(self):
+        goal = create_goal()
+        community.contribute(self.users[0], goal, 8)
+        # Another process read the goal before the threshold was claimed
+        stale = CommunityEnergyGoal.objects.get(pk=goal.pk)
+        stale.threshold_reached_at = None
+
+        community.contribute(self.users[1], stale, 1)
+        self.assertEqual(self.notified(), ['user0'])
+
+
+class LastSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.device = SmartHomeDevice.objects.create(
+            user=self.user, device_name='Heater', device_type='thermostat', device_identifier='aa:bb:cc:dd:ee:ff',
+        )
+        self.now = timezone.now()
+
+    def last_sync(self):
+        return SmartHomeDevice.objects.values_list('last_sync', flat=True).get(pk=self.device.pk)
+
+    def test_buffer_keeps_the_latest_time(self):
+        buffer = LastSyncBuffer(flush_interval=60)
+        buffer.record([self.device.pk], self.now)
+        buffer.record([self.device.pk], self.now - timedelta(minutes=5))
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.last_sync(), self.now)
+
+    def test_flush_never_moves_last_sync_backwards(self):
+        SmartHomeDevice.objects.filter(pk=self.device.pk).update(last_sync=self.now)
+        buffer = LastSyncBuffer(flush_interval=0)
+
+        buffer.record([self.device.pk], self.now - timedelta(minutes=5))
+        self.assertEqual(self.last_sync(), self.now)
+        buffer.record([self.device.pk], self.now + timedelta(minutes=5))
+        self.assertEqual(self.last_sync(), self.now + timedelta(minutes=5))
+
+    def test_device_edit_does_not_write_back_a_stale_last_sync(self):
+        loaded = SmartHomeDevice.objects.get(pk=self.device.pk)
+        LastSyncBuffer(flush_interval=0).record([self.device.pk], self.now)
+
+        serializer = SmartHomeDeviceSerializer(loaded, data={'device_name': 'Living room heater'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        self.assertEqual(self.last_sync(), self.now)
+        self.assertEqual(SmartHomeDevice.objects.get(pk=self.device.pk).device_name, 'Living room heater')
+
+    def test_readings_update_last_sync_on_commit(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        SmartHomeDevice.objects.filter(pk=self.device.pk).update(last_sync=self.now + timedelta(days=1))
+
+        # Written immediately instead of by the background flusher
+        with mock.patch.object(last_sync_buffer, 'flush_interval', 0):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post('/api/energy-usages/', {'device_id': self.device.pk, 'energy_consumed': 1.5}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.last_sync(), self.now + timedelta(days=1))
+
+            SmartHomeDevice.objects.filter(pk=self.device.pk).update(last_sync=None)
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post('/api/energy-usages/', {'device_id': self.device.pk, 'energy_consumed': 1.5}, format='json')
+        self.assertGreaterEqual(self.last_sync(), self.now)
+
+
+class PartitionedIngestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.device = SmartHomeDevice.objects.create(
+            user=self.user, device_name='Thermostat', device_type='thermostat', device_identifier='th-1',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now()
+
+    def partitioned(self, *months):
+        return mock.patch.object(partitions.writable_months, 'get', return_value=frozenset(months))
+
+    def test_batch_rejects_readings_outside_the_stored_months(self):
+        current = partitions.month_start(self.now)
+        older = self.now - timedelta(days=400)
+        with self.partitioned(current):
+            response = self.client.post('/api/energy-usages/batch/', [
+                {'device_id': self.device.pk, 'energy_consumed': 1, 'timestamp': self.now.isoformat()},
+                {'device_id': self.device.pk, 'energy_consumed': 1, 'timestamp': older.isoformat()},
+            ], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['results'][1]['error'], 'timestamp falls in a month that is not stored.')
+        self.assertEqual(EnergyUsage.objects.count(), 1)
+
+    def test_single_reading_without_a_partition_is_rejected(self):
+        with self.partitioned(partitions.add_months(partitions.month_start(self.now), 1)):
+            response = self.client.post('/api/energy-usages/', {'device_id': self.device.pk, 'energy_consumed': 1}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(EnergyUsage.objects.exists())
+
+    def test_unpartitioned_table_accepts_any_month(self):
+        self.assertIsNone(partitions.writable_months.get())
+        self.assertTrue(partitions.writable_months.accepts(self.now - timedelta(days=4000)))
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_new_recommendations_are_deduplicated(self):
+        EnergySavingRecommendation.objects.create(user=self.user, recommendation_text='Turn off idle devices.')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            EnergySavingRecommendation.objects.create(user=self.user, recommendation_text='Turn off idle devices.')
+
+    def test_marking_legacy_duplicates_read(self):
+        # Rows created before content hashes existed repeat the same text
+        EnergySavingRecommendation.objects.bulk_create([
+            EnergySavingRecommendation(user=self.user, recommendation_text='Turn off idle devices.')
+            for _ in range(2)
+        ])
+
+        for recommendation in EnergySavingRecommendation.objects.all():
+            response = self.client.post(f'/api/energy-recommendations/mark-read/{recommendation.id}/')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(EnergySavingRecommendation.objects.filter(is_read=True, content_hash=None).count(), 2)
+
+
+class DeviceLookupCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.devices = [
+            SmartHomeDevice.objects.create(
+                user=self.user, device_name=f'Plug {index}', device_type='plug', device_identifier=f'plug-{index}',
+            )
+            for index in range(3)
+        ]
+
+    def test_hits_are_served_without_a_query(self):
+        cache = DeviceLookupCache(max_size=10, ttl=60)
+        cache.resolve_many(['plug-0', 'plug-1'])
+
+        with self.assertNumQueries(0):
+            refs = cache.resolve_many(['plug-0', 'plug-1'])
+        self.assertEqual(refs['plug-0'].pk, self.devices[0].pk)
+        self.assertEqual(refs['plug-1'].user_id, self.user.id)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = DeviceLookupCache(max_size=2, ttl=60)
+        cache.resolve('plug-0')
+        cache.resolve('plug-1')
+        cache.resolve('plug-0')
+        cache.resolve('plug-2')
+
+        with self.assertNumQueries(0):
+            cache.resolve_many(['plug-0', 'plug-2'])
+        with self.assertNumQueries(1):
+            cache.resolve('plug-1')
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = DeviceLookupCache(max_size=10, ttl=60)
+        with mock.patch.object(device_cache_module.time, 'monotonic', return_value=1000.0):
+            cache.resolve('plug-0')
+        with mock.patch.object(device_cache_module.time, 'monotonic', return_value=1059.0), self.assertNumQueries(0):
+            cache.resolve('plug-0')
+        with mock.patch.object(device_cache_module.time, 'monotonic', return_value=1061.0), self.assertNumQueries(1):
+            cache.resolve('plug-0')
+
+    def test_unknown_identifiers_are_not_cached(self):
+        cache = DeviceLookupCache(max_size=10, ttl=60)
+        self.assertIsNone(cache.resolve('plug-new'))
+        # Registered by another process, so no signal reaches this cache
+        SmartHomeDevice.objects.bulk_create([
+            SmartHomeDevice(user=self.user, device_name='New plug', device_type='plug', device_identifier='plug-new'),
+        ])
+
+        self.assertIsNotNone(cache.resolve('plug-new'))
+
+    def test_device_changes_invalidate_entries(self):
+        cache = DeviceLookupCache(max_size=10, ttl=60)
+        with mock.patch.object(device_cache_module, 'device_cache', cache):
+            self.assertTrue(cache.resolve('plug-0').is_active)
+            device = self.devices[0]
+            device.is_active = False
+            device.save()
+            self.assertFalse(cache.resolve('plug-0').is_active)
+
+            device.device_identifier = 'plug-renamed'
+            device.save()
+            self.assertIsNone(cache.resolve('plug-0'))
+            device.delete()
+            self.assertIsNone(cache.resolve('plug-renamed'))
+
+    def test_lookup_racing_an_invalidation_is_not_cached(self):
+        cache = DeviceLookupCache(max_size=10, ttl=60)
+        fetch = cache._fetch
+
+        def fetch_then_invalidate(identifiers):
+            found = fetch(identifiers)
+            cache.invalidate(pk=self.devices[0].pk, identifier='plug-0')
+            return found
+
+        with mock.patch.object(cache, '_fetch', side_effect=fetch_then_invalidate):
+            self.assertIsNotNone(cache.resolve('plug-0'))
+        with self.assertNumQueries(1):
+            cache.resolve('plug-0')
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.device = SmartHomeDevice.objects.create(
+            user=self.user, device_name='Plug', device_type='plug', device_identifier='plug-1',
+        )
+        self.end = rollups.bucket_start(timezone.now(), rollups.HOUR)
+
+    def record_history(self, hours, usage):
+        # usage(timestamp) -> kWh for each of the `hours` hours before now
+        rollups.apply_readings(
+            (self.device.pk, self.user.id, self.end - timedelta(hours=hour), usage(self.end - timedelta(hours=hour)))
+            for hour in range(1, hours + 1)
+        )
+
+    def forecast(self):
+        return forecasting.ForecastCache().forecasts([self.device.pk])[self.device.pk]
+
+    def test_weekday_and_weekend_usage_is_forecast_for_the_week(self):
+        self.record_history(forecasting.FIT_WEEKS * 7 * 24, lambda moment: 3.0 if moment.weekday() >= 5 else 1.0)
+
+        forecast = self.forecast()
+        self.assertAlmostEqual(forecast['next_week_kwh'], 5 * 24 * 1.0 + 2 * 24 * 3.0, delta=5)
+        self.assertEqual(len(forecast['hourly']), 168)
+        for point in forecast['hourly']:
+            expected = 3.0 if point['timestamp'].weekday() >= 5 else 1.0
+            self.assertAlmostEqual(point['energy_consumed'], expected, delta=0.25)
+
+    def test_daily_shape_is_forecast(self):
+        self.record_history(4 * 7 * 24, lambda moment: 2.0 if 18 <= moment.hour < 22 else 0.5)
+
+        forecast = self.forecast()
+        self.assertAlmostEqual(forecast['next_day_kwh'], 4 * 2.0 + 20 * 0.5, delta=0.5)
+        self.assertAlmostEqual(forecast['next_week_kwh'], 7 * (4 * 2.0 + 20 * 0.5), delta=3)
+
+    def test_short_history_has_no_weekly_forecast(self):
+        self.record_history(10 * 24, lambda moment: 1.0)
+
+        forecast = self.forecast()
+        self.assertIsNone(forecast['next_week_kwh'])
+        self.assertEqual(len(forecast['hourly']), 24)
+        self.assertAlmostEqual(forecast['next_day_kwh'], 24.0, delta=0.5)
+
+    def test_device_without_history_is_not_refit_on_every_request(self):
+        cache = forecasting.ForecastCache()
+        with mock.patch.object(forecasting, 'fit', wraps=forecasting.fit) as fit:
+            self.assertEqual(cache.forecasts([self.device.pk]), {})
+            self.assertEqual(cache.forecasts([self.device.pk]), {})
+        self.assertEqual(fit.call_count, 1)
+
+
+class SeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.device = SmartHomeDevice.objects.create(user=self.user, device_name='Plug', device_type='plug', device_identifier='plug')
+        self.start = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bucket_series_sums_equal_width_buckets(self):
+        start = self.start.timestamp()
+        timestamps = np.array([start, start + 10, start + 20, start + 70, start + 299])
+        values = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+
+        bucket_t, bucket_v = series.bucket_series(timestamps, values, self.start, self.start + timedelta(seconds=300), 5)
+
+        # The third and fourth buckets are empty and dropped
+        self.assertEqual(bucket_t.tolist(), [start, start + 60, start + 240])
+        self.assertEqual(bucket_v.tolist(), [6.0, 4.0, 5.0])
+
+    def test_lttb_keeps_the_ends_and_the_peaks(self):
+        timestamps = np.arange(1000, dtype=np.float64)
+        values = np.zeros(1000)
+        values[[137, 512, 871]] = [40.0, -25.0, 60.0]
+
+        sampled_t, sampled_v = series.lttb_series(timestamps, values, 20)
+
+        self.assertEqual(len(sampled_t), 20)
+        self.assertEqual((sampled_t[0], sampled_t[-1]), (0.0, 999.0))
+        self.assertTrue(np.all(np.diff(sampled_t) > 0))
+        self.assertTrue({137.0, 512.0, 871.0} <= set(sampled_t.tolist()))
+
+    def test_lttb_returns_short_series_unchanged(self):
+        timestamps, values = np.arange(5, dtype=np.float64), np.arange(5, dtype=np.float64)
+
+        sampled_t, sampled_v = series.lttb_series(timestamps, values, 10)
+
+        self.assertEqual(sampled_t.tolist(), timestamps.tolist())
+        self.assertEqual(sampled_v.tolist(), values.tolist())
+
+    def test_series_endpoint(self):
+        for minutes, energy_consumed in ((0, 1.0), (30, 2.0), (125, 4.0)):
+            EnergyUsage.objects.create(device=self.device, timestamp=self.start + timedelta(minutes=minutes), energy_consumed=energy_consumed)
+        url = f'/api/smart-devices/{self.device.pk}/series/'
+        params = {'start': self.start.isoformat(), 'end': (self.start + timedelta(hours=3)).isoformat(), 'points': 3}
+
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['values'], [3.0, 4.0])
+        self.assertEqual(response.data['timestamps'], [self.start, self.start + timedelta(hours=2)])
+
+        response = self.client.get(url, {**params, 'method': 'lttb'})
+        self.assertEqual(response.data['values'], [1.0, 2.0, 4.0])
+        self.assertEqual(self.client.get(url, {**params, 'points': 2}).status_code, 400)
+        self.assertEqual(self.client.get(url, {**params, 'method': 'mean'}).status_code, 400)
+
+    def test_other_users_devices_are_not_found(self):
+        self.client.force_authenticate(User.objects.create_user('bob', password='pass'))
+
+        self.assertEqual(self.client.get(f'/api/smart-devices/{self.device.pk}/series/').status_code, 404)
+
+
+class ProgressStreamTests(SimpleTestCase):
+    def stream(self, progress, steps, goal_id=1):
+        # Runs progress_events against a hub reading from the `progress`
+        # list, one entry per poll, and returns the first `steps` events
+        reads = iter(progress)
+
+        def fetch(goal_ids):
+            return next(reads, progress[-1])
+
+        async def collect():
+            hub = live.ProgressHub(poll_interval=0.01)
+            events = live.progress_events(goal_id, hub=hub)
+            collected = [await events.__anext__() for _ in range(steps)]
+            await events.aclose()
+            await asyncio.sleep(0.05)
+            return collected, hub
+
+        with mock.patch.object(live, '_fetch_progress', fetch):
+            return asyncio.run(collect())
+
+    def test_changes_are_streamed_until_the_goal_is_deleted(self):
+        first = {1: {'id': 1, 'current_progress': 1.0, 'target_energy_reduction': 10.0}}
+        second = {1: {'id': 1, 'current_progress': 3.0, 'target_energy_reduction': 10.0}}
+
+        events, hub = self.stream([first, first, second, {}], 3)
+
+        self.assertEqual(events, [
+            f'event: progress\ndata: {json.dumps(first[1])}\n\n',
+            f'event: progress\ndata: {json.dumps(second[1])}\n\n',
+            'event: closed\ndata: {}\n\n',
+        ])
+        self.assertFalse(hub._subscribers)
+        self.assertTrue(hub._poller.done())
+
+    def test_idle_streams_get_keepalives(self):
+        progress = {1: {'id': 1, 'current_progress': 1.0, 'target_energy_reduction': 10.0}}
+        with mock.patch.object(live, 'KEEPALIVE_SECONDS', 0.05):
+            events, _ = self.stream([progress], 3)
+
+        self.assertEqual(events[1:], [': keepalive\n\n', ': keepalive\n\n'])
+
+    def test_failed_reads_are_retried(self):
+        progress = {1: {'id': 1, 'current_progress': 1.0, 'target_energy_reduction': 10.0}}
+        calls = []
+
+        def fetch(goal_ids):
+            calls.append(goal_ids)
+            if len(calls) == 1:
+                raise RuntimeError('connection lost')
+            return progress
+
+        async def first_event():
+            hub = live.ProgressHub(poll_interval=0.01)
+            subscription = hub.subscribe(1)
+            try:
+                return await subscription.next(1)
+            finally:
+                hub.unsubscribe(1, subscription)
+
+        with mock.patch.object(live, '_fetch_progress', fetch), self.assertLogs('energy_dashboard.live', 'ERROR'):
+            self.assertEqual(asyncio.run(first_event()), progress[1])
+
+    def test_slow_subscribers_only_get_the_latest_payload(self):
+        async def latest():
+            subscription = live.Subscription()
+            for payload in ({'current_progress': 1.0}, {'current_progress': 2.0}):
+                subscription.push(payload)
+            return await subscription.next(1)
+
+        self.assertEqual(asyncio.run(latest()), {'current_progress': 2.0})
+
+
+@override_settings(COMMUNITY_PROGRESS_POLL_SECONDS=0.01)
+class ProgressStreamEndpointTests(TransactionTestCase):
+    def test_stream_requires_a_user_and_an_existing_goal(self):
+        user = User.objects.create_user('alice', password='pass')
+        goal = create_goal()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+        async def requests():
+            client = AsyncClient()
+            anonymous = await client.get(f'/api/community-energy-goals/{goal.pk}/stream/')
+            missing = await client.get(f'/api/community-energy-goals/{goal.pk + 1}/stream/', headers=headers)
+            response = await client.get(f'/api/community-energy-goals/{goal.pk}/stream/', headers=headers)
+            events = response.streaming_content.__aiter__()
+            first = (await events.__anext__()).decode()
+            await events.aclose()
+            return anonymous.status_code, missing.status_code, response, first
+
+        anonymous, missing, response, first = asyncio.run(requests())
+
+        self.assertEqual((anonymous, missing), (401, 404))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(first.startswith('event: progress\n'))
+        self.assertEqual(json.loads(first.split('data: ', 1)[1])['id'], goal.pk)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.devices = [
+            SmartHomeDevice.objects.create(
+                user=self.user, device_name=f'Plug {number}', device_type='plug', device_identifier=f'plug-{number}',
+            )
+            for number in range(2)
+        ]
+        self.day = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+
+    def record(self, device, hour, energy_consumed):
+        return EnergyUsage.objects.create(device=device, timestamp=self.day + timedelta(hours=hour), energy_consumed=energy_consumed)
+
+    def rollup_rows(self):
+        return (
+            sorted(DeviceEnergyRollup.objects.values_list('device_id', 'period', 'bucket', 'energy_sum', 'reading_count', 'energy_min', 'energy_max')),
+            sorted(UserEnergyRollup.objects.values_list('user_id', 'period', 'bucket', 'energy_sum', 'reading_count', 'energy_min', 'energy_max')),
+        )
+
+    def assertMatchesBackfill(self):
+        rows = self.rollup_rows()
+        rollups.backfill(self.day, self.day + timedelta(days=2))
+        self.assertEqual(rows, self.rollup_rows())
+
+    def user_day(self):
+        return UserEnergyRollup.objects.values_list('energy_sum', 'reading_count', 'energy_min', 'energy_max').get(
+            period=rollups.DAY, bucket=self.day,
+        )
+
+    def test_saved_readings_are_rolled_up(self):
+        self.record(self.devices[0], 1, 2.0)
+        self.record(self.devices[1], 1, 5.0)
+
+        self.assertEqual(self.user_day(), (7.0, 2, 2.0, 5.0))
+        self.assertMatchesBackfill()
+
+    def test_updated_reading_moves_between_buckets(self):
+        reading = self.record(self.devices[0], 1, 2.0)
+        self.record(self.devices[0], 1, 4.0)
+
+        reading.timestamp = self.day + timedelta(hours=26)
+        reading.energy_consumed = 3.0
+        reading.save()
+
+        self.assertEqual(self.user_day(), (4.0, 1, 4.0, 4.0))
+        self.assertMatchesBackfill()
+
+    def test_deleted_reading_is_removed(self):
+        reading = self.record(self.devices[0], 1, 2.0)
+        self.record(self.devices[0], 3, 6.0)
+
+        reading.delete()
+        self.assertEqual(self.user_day(), (6.0, 1, 6.0, 6.0))
+        self.assertFalse(DeviceEnergyRollup.objects.filter(period=rollups.HOUR, bucket=self.day + timedelta(hours=1)).exists())
+        self.assertMatchesBackfill()
+
+    def test_deleting_a_device_removes_its_share(self):
+        self.record(self.devices[0], 1, 2.0)
+        self.record(self.devices[0], 2, 9.0)
+        self.record(self.devices[1], 1, 5.0)
+
+        self.devices[0].delete()
+
+        self.assertEqual(self.user_day(), (5.0, 1, 5.0, 5.0))
+        self.assertMatchesBackfill()
+
+    def test_compaction_keeps_the_rollups(self):
+        self.record(self.devices[0], 1, 2.0)
+        rows = self.rollup_rows()
+
+        retention.compact_day(self.day)
+
+        self.assertFalse(EnergyUsage.objects.exists())
+        self.assertEqual(rows, self.rollup_rows())
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('alice', password='pass')
+        self.device = SmartHomeDevice.objects.create(user=user, device_name='Plug', device_type='plug', device_identifier='plug')
+        self.day = rollups.bucket_start(timezone.now() - timedelta(days=400), rollups.DAY)
+        EnergyUsage.objects.create(device=self.device, timestamp=self.day + timedelta(hours=1), energy_consumed=2.0)
+        EnergyUsage.objects.create(device=self.device, timestamp=self.day + timedelta(hours=5), energy_consumed=3.0)
+
+    def user_day_total(self):
+        return UserEnergyRollup.objects.values_list('energy_sum', flat=True).get(period=rollups.DAY, bucket=self.day)
+
+    @override_settings(ENERGY_ARCHIVE_AFTER_MONTHS=12)
+    def test_readings_wait_for_their_month_to_be_archived(self):
+        self.assertEqual(retention.compact(90), (0, 0))
+        self.assertEqual(EnergyUsage.objects.count(), 2)
+
+        ArchivedEnergyMonth.objects.create(month=partitions.month_start(self.day), path='x', reading_count=0, energy_total=0.0)
+        self.assertEqual(retention.compact(90), (1, 2))
+
+    @override_settings(ENERGY_ARCHIVE_AFTER_MONTHS=0)
+    def test_readings_are_compacted_without_an_archive(self):
+        self.assertEqual(retention.compact(90), (1, 2))
+        self.assertEqual(self.user_day_total(), 5.0)
+
+    def test_user_rollups_are_verified_before_deleting(self):
+        UserEnergyRollup.objects.filter(bucket=self.day).update(energy_sum=1.0)
+
+        self.assertEqual(retention.compact_day(self.day), 2)
+        self.assertEqual(self.user_day_total(), 5.0)
+
+    def test_unverified_day_keeps_its_readings(self):
+        with mock.patch.object(rollups, 'backfill'):
+            UserEnergyRollup.objects.filter(bucket=self.day).update(reading_count=1)
+            with self.assertRaises(retention.CompactionError):
+                retention.compact_day(self.day)
+
+        self.assertEqual(EnergyUsage.objects.count(), 2)
+        self.assertFalse(CompactedEnergyDay.objects.exists())
+
+
+class RemoteStorage(Storage):
+    # A storage without local paths, like an object store
+    def __init__(self, location):
+        self._files = FileSystemStorage(location=location)
+
+    def _open(self, name, mode='rb'):
+        return self._files.open(name, mode)
+
+    def _save(self, name, content):
+        return self._files.save(name, content)
+
+    def exists(self, name):
+        return self._files.exists(name)
+
+    def delete(self, name):
+        self._files.delete(name)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        settings_override = override_settings(ENERGY_ARCHIVE_DIR=self.archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(archive._mapped.clear)
+
+        user = User.objects.create_user('alice', password='pass')
+        self.device = SmartHomeDevice.objects.create(user=user, device_name='Plug', device_type='plug', device_identifier='plug')
+        self.month = partitions.add_months(partitions.month_start(timezone.now()), -14)
+        self.start, self.end = partitions.month_bounds(self.month)
+        self.readings = [(self.start + timedelta(days=day, hours=3), float(day)) for day in (0, 5, 9)]
+        for timestamp, energy_consumed in self.readings:
+            EnergyUsage.objects.create(device=self.device, timestamp=timestamp, energy_consumed=energy_consumed)
+
+    def assertReadsBack(self):
+        timestamps, values = archive.load_device_readings(self.device.pk, self.start, self.end)
+        self.assertEqual(timestamps.tolist(), [timestamp.timestamp() for timestamp, _ in self.readings])
+        self.assertEqual(values.tolist(), [energy_consumed for _, energy_consumed in self.readings])
+
+    def test_archived_month_reads_back(self):
+        self.assertEqual(archive.archive_month(self.month), 3)
+
+        self.assertFalse(EnergyUsage.objects.exists())
+        self.assertEqual(ArchivedEnergyMonth.objects.get(month=self.month).reading_count, 3)
+        self.assertReadsBack()
+        empty_timestamps, _ = archive.load_device_readings(self.device.pk + 1, self.start, self.end)
+        self.assertEqual(len(empty_timestamps), 0)
+
+    def test_remote_archive_is_copied_locally(self):
+        remote_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, remote_dir)
+        with mock.patch.object(archive, 'get_storage', return_value=RemoteStorage(location=remote_dir)):
+            archive.archive_month(self.month)
+            archive._mapped.clear()
+            self.assertReadsBack()
+
+        path = ArchivedEnergyMonth.objects.get(month=self.month).path
+        for array in archive.ARRAYS:
+            self.assertTrue(os.path.exists(os.path.join(self.archive_dir, archive._file_name(path, array))))
+
+    def test_mapped_months_are_bounded(self):
+        archive.archive_month(self.month)
+        next_month = partitions.add_months(self.month, 1)
+        EnergyUsage.objects.create(device=self.device, timestamp=partitions.month_bounds(next_month)[0], energy_consumed=1.0)
+        archive.archive_month(next_month)
+        paths = list(ArchivedEnergyMonth.objects.order_by('month').values_list('path', flat=True))
+
+        with mock.patch.object(archive, 'MAPPED_MONTHS', 1):
+            archive._mapped.clear()
+            for path in paths:
+                archive.load_month(path)
+            self.assertEqual(list(archive._mapped), [paths[1]])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'concurrent writers need PostgreSQL')
+class ConcurrentCommunityGoalTests(TransactionTestCase):
+    def test_concurrent_contributions_claim_the_threshold_once(self):
+        workers = 8
+        users = [User.objects.create_user(f'user{index}', password='pass') for index in range(workers)]
+        goal = create_goal(target=workers)
+        barrier = Barrier(workers)
+
+        def contribute(user):
+            try:
+                barrier.wait()
+                community.contribute(user, CommunityEnergyGoal.objects.get(pk=goal.pk), 1)
+            finally:
+                connections.close_all()
+
+        threads = [Thread(target=contribute, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        goal.refresh_from_db()
+        self.assertEqual(goal.current_progress, workers)
+        self.assertIsNotNone(goal.threshold_reached_at)
+        self.assertEqual(EnergySavingRecommendation.objects.filter(recommendation_text=community.THRESHOLD_TEXT).count(), 1)
@@ -1,9 +1,11 @@
 from django.urls import path, include
 from energy_dashboard.views import (
-    SmartHomeDeviceListCreateView, SmartHomeDeviceDetailView,
-    EnergyUsageListCreateView, EnergySavingRecommendationListView,
+    SmartHomeDeviceListCreateView, SmartHomeDeviceDetailView, SmartHomeDeviceSeriesView,
+    SmartHomeDeviceForecastView, EnergyForecastView,
+    EnergyUsageListCreateView, EnergyUsageBatchIngestView, EnergyUsageExportView,
+    EnergySavingRecommendationListView,
     EnergySavingRecommendationMarkReadView, CommunityEnergyGoalListCreateView,
-    CommunityEnergyGoalDetailView, UserCommunityProgressListView,
+    CommunityEnergyGoalDetailView, CommunityEnergyGoalStreamView, UserCommunityProgressListView,
     UserCommunityProgressUpdateView, GenerateEnergySavingRecommendationsView,
 )
 
@@ -11,11 +13,17 @@ urlpatterns = [
        # Sustainable Energy Dashboard URLs
         path('smart-devices/', SmartHomeDeviceListCreateView.as_view(), name='smart_device_list_create'),
         path('smart-devices/<int:pk>/', SmartHomeDeviceDetailView.as_view(), name='smart_device_detail'),
+        path('smart-devices/<int:pk>/series/', SmartHomeDeviceSeriesView.as_view(), name='smart_device_series'),
+        path('smart-devices/<int:pk>/forecast/', SmartHomeDeviceForecastView.as_view(), name='smart_device_forecast'),
+        path('energy-forecast/', EnergyForecastView.as_view(), name='energy_forecast'),
         path('energy-usages/', EnergyUsageListCreateView.as_view(), name='energy_usage_list_create'),
+        path('energy-usages/batch/', EnergyUsageBatchIngestView.as_view(), name='energy_usage_batch_ingest'),
+        path('energy-usages/export/', EnergyUsageExportView.as_view(), name='energy_usage_export'),
         path('energy-recommendations/', EnergySavingRecommendationListView.as_view(), name='energy_recommendation_list'),
         path('energy-recommendations/mark-read/<int:recommendation_id>/', EnergySavingRecommendationMarkReadView.as_view(), name='energy_recommendation_mark_read'),
         path('community-energy-goals/', CommunityEnergyGoalListCreateView.as_view(), name='community_energy_goal_list_create'),
         path('community-energy-goals/<int:pk>/', CommunityEnergyGoalDetailView.as_view(), name='community_energy_goal_detail'),
+        path('community-energy-goals/<int:pk>/stream/', CommunityEnergyGoalStreamView.as_view(), name='community_energy_goal_stream'),
         path('community-progress/', UserCommunityProgressListView.as_view(), name='user_community_progress_list'),
         path('community-progress/update/<int:community_goal_id>/', UserCommunityProgressUpdateView.as_view(), name='user_community_progress_update'),
         path('generate-recommendations/', GenerateEnergySavingRecommendationsView.as_view(), name='generate_energy_recommendations'),
@@ -2,12 +2,21 @@ from django.shortcuts import render
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework.response import Response
 from energy_dashboard.models import (
     SmartHomeDevice,
@@ -19,6 +28,14 @@ from energy_dashboard.serializers import (
     EnergyUsageSerializer, EnergySavingRecommendationSerializer,
     CommunityEnergyGoalSerializer, UserCommunityProgressSerializer,
 )
+from energy_dashboard import community, forecasting, live, series
+from energy_dashboard.device_cache import device_cache
+from energy_dashboard.ingest import DEVICE_INACTIVE_ERROR, DEVICE_NOT_FOUND_ERROR, MAX_BATCH_READINGS, ingest_readings
+from energy_dashboard.last_sync import last_sync_buffer
+from core.exports import streaming_export
+from core.pagination import TimestampKeysetPagination
+from core.parsers import NDJSONParser
+from core.renderers import CSVRenderer, NDJSONRenderer
 from core.permissions import (
     IsAdminOrModerator, IsOwnerOrReadOnly, IsAdminUser, IsAuthorOrReadOnly
 )
@@ -46,25 +63,122 @@ class SmartHomeDeviceDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = SmartHomeDeviceSerializer
     permission_classes = [IsOwnerOrReadOnly]
 
+class SmartHomeDeviceSeriesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        user = request.user
+        devices = SmartHomeDevice.objects.all()
+        if not user.groups.filter(name__in=['Admin', 'Moderator']).exists():
+            devices = devices.filter(user=user)
+        if not devices.filter(pk=pk).exists():
+            return Response({'error': 'Smart Home Device not found or not owned by the user.'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            start, end, points, method = series.parse_series_params(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(series.device_series(pk, start, end, points=points, method=method), status=status.HTTP_200_OK)
+
+class SmartHomeDeviceForecastView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        user = request.user
+        devices = SmartHomeDevice.objects.all()
+        if not user.groups.filter(name__in=['Admin', 'Moderator']).exists():
+            devices = devices.filter(user=user)
+        if not devices.filter(pk=pk).exists():
+            return Response({'error': 'Smart Home Device not found or not owned by the user.'}, status=status.HTTP_404_NOT_FOUND)
+
+        forecast = forecasting.device_forecast(pk)
+        if forecast is None:
+            return Response({'error': 'Not enough energy usage history to forecast this device.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(forecast, status=status.HTTP_200_OK)
+
+class EnergyForecastView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        device_ids = list(
+            SmartHomeDevice.objects.filter(user=request.user, is_active=True).order_by('id').values_list('id', flat=True)
+        )
+        return Response(forecasting.user_forecast(request.user, device_ids), status=status.HTTP_200_OK)
+
 # EnergyUsage Views
 class EnergyUsageListCreateView(generics.ListCreateAPIView):
     queryset = EnergyUsage.objects.all()
     serializer_class = EnergyUsageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TimestampKeysetPagination
 
     def perform_create(self, serializer):
-        device_id = self.request.data.get('device_id')
-        try:
-            device = SmartHomeDevice.objects.get(id=device_id, user=self.request.user)
-        except SmartHomeDevice.DoesNotExist:
-            return Response({'error': 'Smart Home Device not found or not owned by the user.'}, status=status.HTTP_404_NOT_FOUND)
-        serializer.save(device=device)
+        device_identifier = self.request.data.get('device_identifier')
+        if device_identifier:
+            # Resolved through the in-process cache, without a device query
+            device = device_cache.resolve(str(device_identifier))
+            if device is None or device.user_id != self.request.user.id:
+                raise NotFound(DEVICE_NOT_FOUND_ERROR)
+            device_id, is_active = device.pk, device.is_active
+        else:
+            device_id = self.request.data.get('device_id')
+            try:
+                device_id, is_active = SmartHomeDevice.objects.values_list('id', 'is_active').get(id=device_id, user=self.request.user)
+            except (SmartHomeDevice.DoesNotExist, ValueError, TypeError):
+                raise NotFound(DEVICE_NOT_FOUND_ERROR)
+        # Same rule as the batch endpoint
+        if not is_active:
+            raise ValidationError({'error': DEVICE_INACTIVE_ERROR})
+        with transaction.atomic():
+            # The reading is rolled up by the EnergyUsage post_save receiver
+            serializer.save(device_id=device_id)
+            last_sync_buffer.record_on_commit([device_id], timezone.now())
 
     def get_queryset(self):
         user = self.request.user
+        usages = EnergyUsage.objects.select_related('device')
         if user.groups.filter(name__in=['Admin', 'Moderator']).exists():
-            return EnergyUsage.objects.all()
-        return EnergyUsage.objects.filter(device__user=user)
+            return usages
+        return usages.filter(device__user=user)
+
+class EnergyUsageBatchIngestView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        readings = request.data
+        if isinstance(readings, dict):
+            readings = readings.get('readings')
+
+        if not isinstance(readings, list) or not readings:
+            return Response({'error': 'Please provide a non-empty list of readings.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(readings) > MAX_BATCH_READINGS:
+            return Response({'error': f'A batch may contain at most {MAX_BATCH_READINGS} readings.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        report = ingest_readings(request.user, readings)
+        response_status = status.HTTP_201_CREATED if report['accepted'] else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=response_status)
+
+class EnergyUsageExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+
+    def get(self, request):
+        user = request.user
+        usages = EnergyUsage.objects.order_by('timestamp', 'id')
+        if not user.groups.filter(name__in=['Admin', 'Moderator']).exists():
+            usages = usages.filter(device__user=user)
+
+        columns = [
+            ('id', 'id'),
+            ('device_id', 'device_id'),
+            ('device', 'device__device_name'),
+            ('timestamp', 'timestamp'),
+            ('energy_consumed', 'energy_consumed'),
+        ]
+        return streaming_export(usages, columns, request.accepted_renderer.format, 'energy-usage')
 
 # EnergySavingRecommendation Views
 class EnergySavingRecommendationListView(generics.ListAPIView):
@@ -84,12 +198,12 @@ class EnergySavingRecommendationMarkReadView(APIView):
             return Response({'error': 'Recommendation not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         recommendation.is_read = True
-        recommendation.save()
+        recommendation.save(update_fields=['is_read'])
         return Response({'message': 'Recommendation marked as read.'}, status=status.HTTP_200_OK)
 
 # CommunityEnergyGoal Views
 class CommunityEnergyGoalListCreateView(generics.ListCreateAPIView):
-    queryset = CommunityEnergyGoal.objects.all()
+    queryset = CommunityEnergyGoal.objects.annotate(shard_progress=Sum('progress_shards__amount')).order_by('id')
     serializer_class = CommunityEnergyGoalSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAdminOrModerator]
 
@@ -97,10 +211,34 @@ class CommunityEnergyGoalListCreateView(generics.ListCreateAPIView):
         serializer.save()
 
 class CommunityEnergyGoalDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = CommunityEnergyGoal.objects.all()
+    queryset = CommunityEnergyGoal.objects.annotate(shard_progress=Sum('progress_shards__amount'))
     serializer_class = CommunityEnergyGoalSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAdminOrModerator]
 
+class CommunityEnergyGoalStreamView(View):
+    # Plain async Django view (DRF views are sync-only) streaming progress as
+    # server-sent events from the shared in-process hub. Serve it over ASGI.
+    async def get(self, request, pk):
+        user = await sync_to_async(_authenticate_stream)(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+        if not await CommunityEnergyGoal.objects.filter(pk=pk).aexists():
+            return JsonResponse({'error': 'Community Energy Goal not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(live.progress_events(pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+def _authenticate_stream(request):
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
 # UserCommunityProgress Views
 class UserCommunityProgressListView(generics.ListAPIView):
     serializer_class = UserCommunityProgressSerializer
@@ -131,20 +269,7 @@ class UserCommunityProgressUpdateView(APIView):
         except ValueError:
             return Response({'error': 'energy_reduced must be a positive number.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Update or create UserCommunityProgress
-        user_progress, created = UserCommunityProgress.objects.get_or_create(user=user, community_goal=community_goal)
-        user_progress.energy_contributed += energy_reduced
-        user_progress.save()
-
-        # Update CommunityEnergyGoal progress
-        community_goal.update_progress(energy_reduced)
-
-        # Optionally, create EnergySavingRecommendation based on progress
-        if community_goal.current_progress >= (0.75 * community_goal.target_energy_reduction):
-            EnergySavingRecommendation.objects.create(
-                user=user,
-                recommendation_text="Great job! You're helping the community reach 75% of our energy reduction goal. Keep it up!"
-            )
+        community.contribute(user, community_goal, energy_reduced)
 
         return Response({'message': 'Energy contribution updated successfully.'}, status=status.HTTP_200_OK)
 
@@ -153,25 +278,8 @@ class GenerateEnergySavingRecommendationsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        # Example logic: Analyze user's energy usage and generate recommendations
-        # This can be enhanced with AI/ML models for better recommendations
-
-        total_energy = EnergyUsage.objects.filter(device__user=user).aggregate(Sum('energy_consumed'))['energy_consumed__sum'] or 0
-
-        recommendations = []
-        if total_energy > 100:
-            recommendations.append("Consider using energy-efficient appliances to reduce your consumption.")
-        if any(device.device_type == 'thermostat' for device in user.smart_devices.all()):
-            recommendations.append("Optimize your thermostat settings to save energy during peak hours.")
-        else:
-            recommendations.append("Consider installing a smart thermostat for better energy management.")
-
-        for rec in recommendations:
-            EnergySavingRecommendation.objects.create(
-                user=user,
-                recommendation_text=rec
-            )
-
-        serialized_recs = EnergySavingRecommendationSerializer(EnergySavingRecommendation.objects.filter(user=user, is_read=False), many=True)
+        # Recommendations are computed offline by the generate_energy_recommendations
+        # and detect_energy_anomalies commands; this only reads the unread ones.
+        unread = EnergySavingRecommendation.objects.filter(user=request.user, is_read=False).order_by('-created_at')
+        serialized_recs = EnergySavingRecommendationSerializer(unread, many=True)
         return Response(serialized_recs.data, status=status.HTTP_200_OK)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MarketplaceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'marketplace'
+
+    def ready(self):
+        # Connects the signals that maintain Resource rating counters and add
+        # the booking overlap constraint on PostgreSQL
+        from marketplace import bookings, ratings
+        post_migrate.connect(bookings.ensure_overlap_constraint, sender=self)
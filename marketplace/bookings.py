@@ -0,0 +1,95 @@
+import logging
+
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Resource, Booking
+
+logger = logging.getLogger(__name__)
+
+OVERLAP_CONSTRAINT = 'marketplace_booking_no_overlap'
+
+
+class BookingConflict(Exception):
+    pass
+
+
+def overlapping(start_time, end_time):
+    # Bookings intersecting [start_time, end_time); back-to-back bookings do
+    # not overlap. Served by the (resource, start_time, end_time) index.
+    return Booking.objects.filter(start_time__lt=end_time, end_time__gt=start_time)
+
+
+def create_booking(serializer, user, resource):
+    # Locks the resource row so concurrent requests for it are checked one
+    # at a time. On PostgreSQL the exclusion constraint also rejects overlaps
+    # at the database level.
+    start_time = serializer.validated_data['start_time']
+    end_time = serializer.validated_data['end_time']
+    with transaction.atomic():
+        list(Resource.objects.select_for_update().filter(pk=resource.pk).values_list('pk', flat=True))
+        if overlapping(start_time, end_time).filter(resource=resource).exists():
+            raise BookingConflict()
+        try:
+            with transaction.atomic():
+                return serializer.save(user=user, resource=resource)
+        except IntegrityError:
+            raise BookingConflict()
+
+
+def available_resources(queryset, start_time, end_time):
+    # Resources marked available with no booking overlapping the window, as
+    # one anti-join against the booking index
+    busy = overlapping(start_time, end_time).filter(resource=OuterRef('pk'))
+    return queryset.filter(available=True).exclude(Exists(busy))
+
+
+def _parse_datetime_param(value, name):
+    try:
+        parsed = parse_datetime(value or '')
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 datetime.')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_window_params(params):
+    # Returns (start, end) from the required ?start= and ?end= parameters
+    start_time = _parse_datetime_param(params.get('start'), 'start')
+    end_time = _parse_datetime_param(params.get('end'), 'end')
+    if start_time >= end_time:
+        raise ValueError('start must be before end.')
+    return start_time, end_time
+
+
+def ensure_overlap_constraint(using='default', **kwargs):
+    # post_migrate handler: adds the PostgreSQL exclusion constraint that
+    # makes overlapping bookings of a resource impossible. Other databases
+    # rely on the locked check in create_booking.
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    table = Booking._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_constraint WHERE conname = %s', [OVERLAP_CONSTRAINT])
+        if cursor.fetchone():
+            return
+    quote = connection.ops.quote_name
+    try:
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                # btree_gist provides the gist equality operator for resource_id
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+                cursor.execute(
+                    f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(OVERLAP_CONSTRAINT)} '
+                    f"EXCLUDE USING gist (resource_id WITH =, tstzrange(start_time, end_time, '[)') WITH &&)"
+                )
+    except DatabaseError:
+        # Missing privileges for the extension, or overlapping rows that must
+        # be resolved first; bookings are still checked under a row lock
+        logger.exception('Could not add the %s constraint', OVERLAP_CONSTRAINT)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from marketplace import ratings
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the rating_count and rating_sum of every resource from its reviews. '
+        'Must be run once after deploying the counters: until then existing resources show no ratings, '
+        'since reviews only recount a resource when its counters would go negative. Also usable for repairs.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding resource ratings...')
+        updated = ratings.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} resource(s)'))
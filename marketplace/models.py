@@ -15,14 +15,16 @@ class Resource(models.Model):
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained from Review signals by marketplace.ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
     def get_average_rating(self):
-        reviews = self.reviews.all()
-        if reviews.exists():
-            return reviews.aggregate(models.Avg('rating'))['rating__avg']
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
 
 class Booking(models.Model):
@@ -37,6 +39,9 @@ class Booking(models.Model):
 
     class Meta:
         unique_together = ('resource', 'start_time', 'end_time')
+        indexes = [
+            models.Index(fields=['resource', 'start_time', 'end_time']),
+        ]
 
 class Review(models.Model):
     resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='reviews')
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Resource, Review
+
+
+def apply_rating(resource_id, count, total):
+    # F() update, so concurrent reviews of a resource never lose each other.
+    # Counters that would go negative were never backfilled (reviews older
+    # than the counters), so the resource is recounted from its reviews.
+    if count or total:
+        updated = Resource.objects.filter(pk=resource_id, rating_count__gte=-count, rating_sum__gte=-total).update(
+            rating_count=F('rating_count') + count, rating_sum=F('rating_sum') + total,
+        )
+        if not updated:
+            recount(resource_id)
+
+
+def recount(resource_id):
+    totals = Review.objects.filter(resource_id=resource_id).aggregate(count=Count('id'), total=Sum('rating'))
+    Resource.objects.filter(pk=resource_id).update(rating_count=totals['count'], rating_sum=totals['total'] or 0)
+
+
+def rebuild():
+    # Recomputes every resource's counters from its reviews in one UPDATE.
+    # Returns the number of resources updated.
+    reviews = Review.objects.filter(resource=OuterRef('pk')).order_by().values('resource')
+    return Resource.objects.update(
+        rating_count=Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+    )
+
+
+# Imported from MarketplaceConfig.ready so the receivers are always connected
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk is not None:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('resource_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def count_saved_review(sender, instance, **kwargs):
+    with transaction.atomic():
+        previous = getattr(instance, '_previous_rating', None)
+        if previous is not None and previous[0] != instance.resource_id:
+            apply_rating(previous[0], -1, -previous[1])
+            previous = None
+        if previous is None:
+            apply_rating(instance.resource_id, 1, instance.rating)
+        else:
+            apply_rating(instance.resource_id, 0, instance.rating - previous[1])
+
+
+@receiver(post_delete, sender=Review)
+def count_deleted_review(sender, instance, **kwargs):
+    apply_rating(instance.resource_id, -1, -instance.rating)
@@ -10,7 +10,15 @@ class ResourceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Resource
-        fields = ['id', 'name', 'description', 'category', 'available', 'owner', 'created_at', 'average_rating']
+        fields = ['id', 'name', 'description', 'category', 'available', 'owner', 'created_at', 'average_rating', 'rating_count']
+
+    def update(self, instance, validated_data):
+        # Only write the edited columns; the rating counters are maintained by
+        # marketplace.ratings and the loaded values may already be stale
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
 
 class BookingSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
@@ -1,3 +1,146 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from threading import Barrier, Thread
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from marketplace import bookings
+from marketplace.models import Booking, Resource, Review
+from marketplace.serializers import BookingSerializer, ResourceSerializer
+
+START = datetime(2026, 6, 1, 9, tzinfo=dt_timezone.utc)
+
+
+def at(hours):
+    return START + timedelta(hours=hours)
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pass')
+        self.user = User.objects.create_user('alice', password='pass')
+        self.resource = Resource.objects.create(name='Drill', description='Cordless drill', owner=self.owner, category='tool')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, start, end, resource=None):
+        return self.client.post('/api/bookings/', {
+            'resource_id': (resource or self.resource).id,
+            'start_time': at(start).isoformat(),
+            'end_time': at(end).isoformat(),
+        }, format='json')
+
+    def test_overlapping_booking_is_rejected(self):
+        self.assertEqual(self.book(0, 2).status_code, 201)
+
+        for start, end in ((1, 3), (-1, 1), (0, 2), (-1, 3), (0.5, 1.5)):
+            with self.subTest(start=start, end=end):
+                response = self.book(start, end)
+                self.assertEqual(response.status_code, 409)
+                self.assertIn('error', response.data)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_back_to_back_bookings_succeed(self):
+        self.assertEqual(self.book(2, 4).status_code, 201)
+        self.assertEqual(self.book(0, 2).status_code, 201)
+        self.assertEqual(self.book(4, 6).status_code, 201)
+        self.assertEqual(Booking.objects.filter(resource=self.resource).count(), 3)
+
+    def test_other_resources_can_be_booked_at_the_same_time(self):
+        other = Resource.objects.create(name='Ladder', description='3m ladder', owner=self.owner, category='tool')
+
+        self.assertEqual(self.book(0, 2).status_code, 201)
+        self.assertEqual(self.book(0, 2, resource=other).status_code, 201)
+
+    def test_invalid_bookings_are_rejected(self):
+        self.assertEqual(self.book(2, 1).status_code, 400)
+        response = self.client.post('/api/bookings/', {
+            'resource_id': self.resource.id + 100, 'start_time': at(0).isoformat(), 'end_time': at(1).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_available_resources_exclude_booked_ones(self):
+        other = Resource.objects.create(name='Ladder', description='3m ladder', owner=self.owner, category='tool')
+        self.book(0, 2)
+
+        def available(start, end):
+            response = self.client.get('/api/resources/available/', {'start': at(start).isoformat(), 'end': at(end).isoformat()})
+            self.assertEqual(response.status_code, 200)
+            results = response.data['results'] if isinstance(response.data, dict) else response.data
+            return sorted(resource['name'] for resource in results)
+
+        self.assertEqual(available(1, 3), ['Ladder'])
+        self.assertEqual(available(2, 4), ['Drill', 'Ladder'])
+        self.assertEqual(self.client.get('/api/resources/available/').status_code, 400)
+
+
+class RatingCounterTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pass')
+        self.resource = Resource.objects.create(name='Drill', description='Cordless drill', owner=self.owner, category='tool')
+
+    def counters(self):
+        self.resource.refresh_from_db()
+        return self.resource.rating_count, self.resource.rating_sum
+
+    def test_counters_follow_reviews(self):
+        first = Review.objects.create(resource=self.resource, user=self.owner, rating=4, comment='Good')
+        Review.objects.create(resource=self.resource, user=User.objects.create_user('bob'), rating=2, comment='Ok')
+        first.rating = 5
+        first.save()
+        self.assertEqual(self.counters(), (2, 7))
+
+        first.delete()
+        self.assertEqual(self.counters(), (1, 2))
+
+    def test_resource_edit_keeps_counters(self):
+        loaded = Resource.objects.get(pk=self.resource.pk)
+        Review.objects.create(resource=self.resource, user=self.owner, rating=4, comment='Good')
+
+        serializer = ResourceSerializer(loaded, data={'name': 'Hammer drill'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertEqual(self.counters(), (1, 4))
+        self.assertEqual(self.resource.name, 'Hammer drill')
+
+    def test_deleting_a_review_older_than_the_counters(self):
+        review = Review.objects.create(resource=self.resource, user=self.owner, rating=4, comment='Good')
+        Resource.objects.filter(pk=self.resource.pk).update(rating_count=0, rating_sum=0)
+
+        review.delete()
+        self.assertEqual(self.counters(), (0, 0))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'concurrent writers need PostgreSQL')
+class ConcurrentBookingTests(TransactionTestCase):
+    def test_concurrent_overlapping_bookings_create_one(self):
+        owner = User.objects.create_user('owner', password='pass')
+        resource = Resource.objects.create(name='Drill', description='Cordless drill', owner=owner, category='tool')
+        workers = 8
+        barrier = Barrier(workers)
+        results = []
+
+        def book(offset):
+            try:
+                serializer = BookingSerializer(data={'start_time': at(offset / 10), 'end_time': at(2 + offset / 10)})
+                serializer.is_valid(raise_exception=True)
+                barrier.wait()
+                try:
+                    bookings.create_booking(serializer, owner, resource)
+                    results.append(True)
+                except bookings.BookingConflict:
+                    results.append(False)
+            finally:
+                connections.close_all()
+
+        threads = [Thread(target=book, args=(offset,)) for offset in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * (workers - 1) + [True])
+        self.assertEqual(Booking.objects.filter(resource=resource).count(), 1)
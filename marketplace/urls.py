@@ -1,6 +1,6 @@
 from django.urls import path, include
 from marketplace.views import (
-    ResourceListCreateView, ResourceDetailView,
+    ResourceListCreateView, ResourceDetailView, ResourceAvailableView,
     BookingListCreateView, ReviewListCreateView,
     CreateCheckoutSessionView, stripe_webhook,
 )
@@ -8,6 +8,7 @@ from marketplace.views import (
 urlpatterns = [
         # Resource Sharing Marketplace URLs
         path('resources/', ResourceListCreateView.as_view(), name='resource_list_create'),
+        path('resources/available/', ResourceAvailableView.as_view(), name='resource_available'),
         path('resources/<int:pk>/', ResourceDetailView.as_view(), name='resource_detail'),
         path('bookings/', BookingListCreateView.as_view(), name='booking_list_create'),
         path('reviews/<int:resource_id>/', ReviewListCreateView.as_view(), name='review_list_create'),
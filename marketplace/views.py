@@ -5,16 +5,18 @@ from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
 from django.utils import timezone
+from django.db.models import Case, F, FloatField, When
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from marketplace.models import (
     Resource, Booking, Review
 )
+from marketplace import bookings
 from marketplace.serializers import (
     ResourceSerializer, BookingSerializer, ReviewSerializer,
 )
@@ -29,12 +31,20 @@ logger = logging.getLogger(__name__)
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 class ResourceListCreateView(generics.ListCreateAPIView):
-    queryset = Resource.objects.all()
+    # Ratings come from the stored counters; ?ordering=-rating sorts by average
+    queryset = Resource.objects.select_related('owner').annotate(
+        rating=Case(
+            When(rating_count=0, then=0.0),
+            default=F('rating_sum') * 1.0 / F('rating_count'),
+            output_field=FloatField(),
+        ),
+    )
     serializer_class = ResourceSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [SearchFilter, DjangoFilterBackend]
+    filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
     search_fields = ['name', 'description', 'category']
     filterset_fields = ['category', 'available']
+    ordering_fields = ['created_at', 'name', 'rating', 'rating_count']
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -44,15 +54,51 @@ class ResourceDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ResourceSerializer
     permission_classes = [IsOwnerOrReadOnly | IsAdminOrModerator]
 
+class ResourceAvailableView(generics.ListAPIView):
+    # Resources free for the whole of ?start= to ?end=, with the same search
+    # and filters as the resource list
+    queryset = ResourceListCreateView.queryset
+    serializer_class = ResourceSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filter_backends = ResourceListCreateView.filter_backends
+    search_fields = ResourceListCreateView.search_fields
+    filterset_fields = ResourceListCreateView.filterset_fields
+    ordering_fields = ResourceListCreateView.ordering_fields
+
+    def list(self, request, *args, **kwargs):
+        try:
+            self.window = bookings.parse_window_params(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return bookings.available_resources(super().get_queryset(), *self.window)
+
 class BookingListCreateView(generics.ListCreateAPIView):
-    queryset = Booking.objects.all()
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def perform_create(self, serializer):
-        resource_id = self.request.data.get('resource_id')
-        resource = Resource.objects.get(id=resource_id)
-        serializer.save(user=self.request.user, resource=resource)
+    def get_queryset(self):
+        # Users can see their own bookings; Admins can see all
+        user = self.request.user
+        booking_list = Booking.objects.select_related('user')
+        if user.groups.filter(name__in=['Admin', 'Moderator']).exists():
+            return booking_list
+        return booking_list.filter(user=user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            resource = Resource.objects.get(id=request.data.get('resource_id'))
+        except (Resource.DoesNotExist, ValueError, TypeError):
+            return Response({'error': 'Resource not found.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            bookings.create_booking(serializer, request.user, resource)
+        except bookings.BookingConflict:
+            return Response({'error': 'The resource is already booked for part of that time.'}, status=status.HTTP_409_CONFLICT)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class ReviewListCreateView(generics.ListCreateAPIView):
     serializer_class = ReviewSerializer
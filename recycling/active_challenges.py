@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recycling.models import EcoChallenge
+
+ACTIVE = 'active'
+UPCOMING = 'upcoming'
+EXPIRED = 'expired'
+STATUSES = (ACTIVE, UPCOMING, EXPIRED)
+
+
+def filter_by_status(queryset, status, now=None):
+    # Range conditions on start_date/end_date, served by their indexes
+    now = now or timezone.now()
+    if status == ACTIVE:
+        return queryset.filter(start_date__lte=now, end_date__gte=now)
+    if status == UPCOMING:
+        return queryset.filter(start_date__gt=now)
+    return queryset.filter(end_date__lt=now)
+
+
+def get_active(challenge_id, now=None):
+    # The challenge if it is active at `now`, otherwise None. One primary key
+    # lookup against the database, so completions never act on a stale cache.
+    return filter_by_status(EcoChallenge.objects.filter(pk=challenge_id), ACTIVE, now).first()
+
+
+class ActiveChallengeCache:
+    # In-process set of the challenges running right now. It is valid until
+    # the next boundary (the earliest end of an active challenge or start of
+    # an upcoming one), is dropped by EcoChallenge save/delete signals in this
+    # process, and reloaded every ACTIVE_CHALLENGE_CACHE_TTL seconds to pick
+    # up other processes' writes.
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._challenges = None
+        self._starts_at = None
+        self._valid_until = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, now):
+        ttl = self.ttl if self.ttl is not None else settings.ACTIVE_CHALLENGE_CACHE_TTL
+        return (
+            self._challenges is not None
+            and time.monotonic() - self._loaded_at <= ttl
+            and self._starts_at <= now
+            and (self._valid_until is None or now < self._valid_until)
+        )
+
+    def _load(self, now):
+        challenges = list(filter_by_status(EcoChallenge.objects.all(), ACTIVE, now).order_by('pk'))
+        next_start = EcoChallenge.objects.filter(start_date__gt=now).aggregate(next_start=Min('start_date'))['next_start']
+        # end_date is inclusive, so an active challenge drops out just after it
+        boundaries = [challenge.end_date for challenge in challenges if challenge.end_date > now]
+        if next_start is not None:
+            boundaries.append(next_start)
+        with self._lock:
+            self._challenges = challenges
+            self._starts_at = now
+            self._valid_until = min(boundaries) if boundaries else None
+            self._loaded_at = time.monotonic()
+
+    def _current(self, now):
+        with self._lock:
+            if self._is_fresh(now):
+                return self._challenges
+        self._load(now)
+        with self._lock:
+            return self._challenges
+
+    def active(self, now=None):
+        # Active challenges ordered by id
+        return list(self._current(now or timezone.now()))
+
+    def invalidate(self):
+        with self._lock:
+            self._challenges = None
+
+
+active_challenges = ActiveChallengeCache()
+
+
+# Imported from RecyclingConfig.ready so the receivers are always connected
+@receiver(post_save, sender=EcoChallenge)
+@receiver(post_delete, sender=EcoChallenge)
+def invalidate_active_challenges(sender, **kwargs):
+    # Again on commit, in case another thread reloaded before the write was visible
+    active_challenges.invalidate()
+    transaction.on_commit(active_challenges.invalidate)
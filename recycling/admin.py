@@ -1,11 +1,17 @@
 from django.contrib import admin
 from .models import (
-    WasteEntry, RecyclingCenter,
-    EcoChallenge, UserChallenge, Leaderboard
+    WasteEntry, WasteDailyTotal, CommunityWasteDailyTotal, RecyclingCenter,
+    EcoChallenge, UserChallenge, Leaderboard,
+    LeaderboardWindowEntry, LeaderboardSnapshot, LeaderboardSnapshotEntry
 )
 
 admin.site.register(WasteEntry)
+admin.site.register(WasteDailyTotal)
+admin.site.register(CommunityWasteDailyTotal)
 admin.site.register(RecyclingCenter)
 admin.site.register(EcoChallenge)
 admin.site.register(UserChallenge)
 admin.site.register(Leaderboard)
+admin.site.register(LeaderboardWindowEntry)
+admin.site.register(LeaderboardSnapshot)
+admin.site.register(LeaderboardSnapshotEntry)
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from recycling.models import CommunityWasteDailyTotal, RecyclingCenter, WasteEntry
+from recycling.waste_totals import PERIODS, parse_date_param
+
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 5 * 366
+TREND_PERIODS = ('day',) + tuple(PERIODS)
+WASTE_TYPES = [choice for choice, _ in WasteEntry.WASTE_TYPE_CHOICES]
+NO_REGION = 'none'
+
+
+def parse_analytics_params(params):
+    # Returns (start, end, period, region, waste_type) from query parameters.
+    # Days are UTC and inclusive; region is a RecyclingCenter id, or 0 for
+    # entries without a region (?region=none).
+    end = parse_date_param(params['end'], 'end') if params.get('end') else timezone.now().date()
+    start = (
+        parse_date_param(params['start'], 'start') if params.get('start')
+        else end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    )
+    if start > end:
+        raise ValueError('start must not be after end.')
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'The date range may span at most {MAX_RANGE_DAYS} days.')
+
+    period = params.get('period', 'day')
+    if period not in TREND_PERIODS:
+        raise ValueError(f'period must be one of: {", ".join(TREND_PERIODS)}.')
+
+    region = params.get('region') or None
+    if region == NO_REGION:
+        region = 0
+    elif region is not None:
+        try:
+            region = int(region)
+        except ValueError:
+            raise ValueError(f'region must be a recycling center id or "{NO_REGION}".')
+
+    waste_type = params.get('waste_type') or None
+    if waste_type is not None and waste_type not in WASTE_TYPES:
+        raise ValueError(f'waste_type must be one of: {", ".join(WASTE_TYPES)}.')
+
+    return start, end, period, region, waste_type
+
+
+def _totals(start, end, region=None, waste_type=None):
+    totals = CommunityWasteDailyTotal.objects.filter(day__gte=start, day__lte=end, entry_count__gt=0)
+    if region is not None:
+        totals = totals.filter(region=region)
+    if waste_type is not None:
+        totals = totals.filter(waste_type=waste_type)
+    return totals
+
+
+def _sums(totals, *fields):
+    return totals.values(*fields).annotate(total_quantity=Sum('quantity'), entry_count=Sum('entry_count'))
+
+
+def community_analytics(start, end, period='day', region=None, waste_type=None):
+    # Community-wide totals over [start, end] with a trend line, each waste
+    # type's share and the split by region, all read from the daily rollup
+    totals = _totals(start, end, region=region, waste_type=waste_type)
+    overall = totals.aggregate(total_quantity=Sum('quantity'), entry_count=Sum('entry_count'))
+    total_quantity = overall['total_quantity'] or 0.0
+
+    # The range of the same length just before, for the change figure
+    previous_end = start - timedelta(days=1)
+    previous_start = previous_end - (end - start)
+    previous_quantity = _totals(previous_start, previous_end, region=region, waste_type=waste_type).aggregate(
+        total=Sum('quantity'),
+    )['total'] or 0.0
+
+    bucket = F('day') if period == 'day' else PERIODS[period]('day')
+    trend = list(_sums(totals.annotate(period_start=bucket), 'period_start').order_by('period_start'))
+
+    by_type = list(_sums(totals, 'waste_type').order_by('-total_quantity'))
+    for row in by_type:
+        row['share'] = row['total_quantity'] / total_quantity if total_quantity else 0.0
+
+    by_region = list(_sums(totals, 'region').order_by('-total_quantity'))
+    names = dict(
+        RecyclingCenter.objects.filter(pk__in=[row['region'] for row in by_region]).values_list('pk', 'name')
+    )
+    for row in by_region:
+        row['region'] = row['region'] or None
+        row['region_name'] = names.get(row['region'])
+
+    return {
+        'start': start,
+        'end': end,
+        'period': period,
+        'total_quantity': total_quantity,
+        'entry_count': overall['entry_count'] or 0,
+        'previous_total_quantity': previous_quantity,
+        'change': (total_quantity - previous_quantity) / previous_quantity if previous_quantity else None,
+        'trend': trend,
+        'by_type': by_type,
+        'by_region': by_region,
+    }
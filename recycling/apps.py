@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RecyclingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recycling'
+
+    def ready(self):
+        # Connects the signals that maintain the daily waste counters and
+        # invalidate the active challenge cache
+        from recycling import active_challenges, waste_totals
@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recycling import windows
+from recycling.leaderboard import rank_index
+from recycling.models import UserChallenge, Leaderboard
+
+BULK_BATCH_SIZE = 1000
+
+
+def award_points(points_by_user):
+    # Adds points to many users' leaderboard rows: one insert for missing
+    # rows, then one F() increment per distinct amount. Call inside a
+    # transaction; the rank index is updated once it commits.
+    if not points_by_user:
+        return
+    Leaderboard.objects.bulk_create(
+        [Leaderboard(user_id=user_id) for user_id in points_by_user],
+        batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+    )
+    users_by_amount = defaultdict(list)
+    for user_id, points in points_by_user.items():
+        users_by_amount[points].append(user_id)
+    for points, user_ids in users_by_amount.items():
+        Leaderboard.objects.filter(user_id__in=user_ids).update(points=F('points') + points)
+
+    totals = Leaderboard.objects.filter(user_id__in=list(points_by_user)).values_list('user_id', 'points')
+    changes = [(user_id, points - points_by_user[user_id], points) for user_id, points in totals]
+    transaction.on_commit(lambda: [rank_index.update(*change) for change in changes])
+
+
+def complete(user, challenge, now=None):
+    # Marks the challenge completed for the user and awards its points.
+    # Returns False, without awarding anything, if it was already completed.
+    now = now or timezone.now()
+    with transaction.atomic():
+        completed = UserChallenge.objects.filter(user=user, challenge=challenge, completed=False).update(
+            completed=True, completed_at=now,
+        )
+        if not completed:
+            try:
+                with transaction.atomic():
+                    UserChallenge.objects.create(user=user, challenge=challenge, completed=True, completed_at=now)
+            except IntegrityError:
+                return False
+        award_points({user.id: challenge.points})
+        windows.record(challenge, [user.id], now)
+    return True
+
+
+def complete_many(challenge, user_ids, now=None):
+    # Bulk version of complete() for moderators and event check-ins. Returns
+    # the ids of the users who completed the challenge with this call.
+    now = now or timezone.now()
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        UserChallenge.objects.bulk_create(
+            [UserChallenge(user_id=user_id, challenge=challenge) for user_id in user_ids],
+            batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+        )
+        pending = list(
+            UserChallenge.objects
+            .select_for_update()
+            .filter(challenge=challenge, user_id__in=user_ids, completed=False)
+            .values_list('id', 'user_id')
+        )
+        UserChallenge.objects.filter(id__in=[row_id for row_id, _ in pending]).update(completed=True, completed_at=now)
+        completed_user_ids = [user_id for _, user_id in pending]
+        award_points({user_id: challenge.points for user_id in completed_user_ids})
+        windows.record(challenge, completed_user_ids, now)
+    return completed_user_ids
@@ -0,0 +1,153 @@
+import math
+
+from django.conf import settings
+from django.db.models import Q
+
+GEOHASH_PRECISION = 12
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 500
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+REGION_CHUNK_SIZE = 1000
+# Most cells a nearest-center query searches before using a coarser precision
+MAX_COVERING_CELLS = 24
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        coordinate, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size_km(precision, latitude):
+    # (height, width) of a geohash cell at the given latitude
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    height = 180.0 / 2 ** lat_bits * KM_PER_DEGREE
+    width = 360.0 / 2 ** lon_bits * KM_PER_DEGREE * math.cos(math.radians(latitude))
+    return height, width
+
+
+def covering_prefixes(latitude, longitude, radius_km):
+    # Geohash prefixes of the cells around the point that cover the whole
+    # search circle: three rows of cells at least radius_km tall, and as many
+    # columns either side as the circle needs at its latitude farthest from
+    # the equator (all of them when it reaches a pole). Uses the finest
+    # precision needing at most MAX_COVERING_CELLS cells, clamped to
+    # one-character prefixes near the poles. None only when the radius is
+    # taller than those (a full scan).
+    edge_latitude = min(abs(latitude) + radius_km / KM_PER_DEGREE, 90.0)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size_km(precision, edge_latitude)
+        if height < radius_km:
+            continue
+        columns = 2 ** (5 * precision - 5 * precision // 2)
+        reach = columns // 2
+        if width > 0:
+            reach = min(math.ceil(radius_km / width), reach)
+        if 3 * (2 * reach + 1) <= MAX_COVERING_CELLS or precision == 1:
+            break
+    else:
+        return None
+
+    dlat = height / KM_PER_DEGREE
+    dlon = 360.0 / columns
+    prefixes = set()
+    for row in (-1, 0, 1):
+        for column in range(-reach, reach + 1):
+            lat = min(max(latitude + row * dlat, -90.0), 90.0)
+            lon = (longitude + column * dlon + 180.0) % 360.0 - 180.0
+            prefixes.add(encode(lat, lon, precision))
+    return sorted(prefixes)
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # Haversine great-circle distance
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearest_centers(latitude, longitude, radius_km=DEFAULT_RADIUS_KM, limit=DEFAULT_LIMIT):
+    # Centers within radius_km, closest first, as (center, distance) pairs.
+    # Candidates come from index range scans on the geohash prefixes around
+    # the point; exact distances are only computed for those.
+    from recycling.models import RecyclingCenter  # models imports this module
+
+    centers = RecyclingCenter.objects.all()
+    prefixes = covering_prefixes(latitude, longitude, radius_km)
+    if prefixes is not None:
+        query = Q()
+        for prefix in prefixes:
+            query |= Q(geohash__startswith=prefix)
+        centers = centers.filter(query)
+
+    matches = []
+    for center in centers:
+        distance = distance_km(latitude, longitude, float(center.latitude), float(center.longitude))
+        if distance <= radius_km:
+            matches.append((center, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches[:limit]
+
+
+def region_for(latitude, longitude):
+    # Id of the recycling center a location belongs to: the nearest one
+    # within WASTE_REGION_RADIUS_KM, or None
+    if latitude is None or longitude is None:
+        return None
+    matches = nearest_centers(float(latitude), float(longitude), radius_km=settings.WASTE_REGION_RADIUS_KM, limit=1)
+    return matches[0][0].pk if matches else None
+
+
+def assign_regions():
+    # Recomputes the region of every located waste entry, e.g. after recycling
+    # centers were added or moved. Entries are updated with queryset.update(),
+    # so the waste counters must be rebuilt afterwards. Returns the number of
+    # entries whose region changed.
+    from recycling.models import WasteEntry
+
+    regions = {}
+    moved = {}
+    rows = (
+        WasteEntry.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .values_list('id', 'latitude', 'longitude', 'region_id')
+        .iterator(chunk_size=REGION_CHUNK_SIZE)
+    )
+    for pk, latitude, longitude, region_id in rows:
+        # Entries logged at the same place share one lookup
+        location = (latitude, longitude)
+        if location not in regions:
+            regions[location] = region_for(latitude, longitude)
+        if regions[location] != region_id:
+            moved.setdefault(regions[location], []).append(pk)
+
+    for region_id, ids in moved.items():
+        for start in range(0, len(ids), REGION_CHUNK_SIZE):
+            WasteEntry.objects.filter(pk__in=ids[start:start + REGION_CHUNK_SIZE]).update(region_id=region_id)
+    return sum(len(ids) for ids in moved.values())
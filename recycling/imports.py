@@ -0,0 +1,118 @@
+import csv
+import math
+from contextlib import nullcontext
+from datetime import datetime, time
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from recycling import waste_totals
+from recycling.models import WasteEntry
+
+IMPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+REQUIRED_COLUMNS = {'waste_type', 'quantity'}
+WASTE_TYPES = {choice for choice, _ in WasteEntry.WASTE_TYPE_CHOICES}
+
+
+class WasteImportError(Exception):
+    pass
+
+
+def _parse_date(value, now):
+    if not value:
+        return now
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValueError('date must be an ISO 8601 date or datetime.')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_row(row, now, dates):
+    # Same rules as WasteEntrySerializer, without building a serializer per row.
+    # Import files repeat the same few dates, so each is parsed once.
+    waste_type = (row.get('waste_type') or '').strip().lower()
+    if waste_type not in WASTE_TYPES:
+        raise ValueError(f'waste_type must be one of: {", ".join(sorted(WASTE_TYPES))}.')
+    try:
+        quantity = float(row.get('quantity') or '')
+    except ValueError:
+        raise ValueError('quantity must be a number.')
+    if not math.isfinite(quantity) or quantity <= 0:
+        raise ValueError('quantity must be a positive number.')
+    value = (row.get('date') or '').strip()
+    date = dates.get(value)
+    if date is None:
+        date = dates[value] = _parse_date(value, now)
+    return waste_type, quantity, date
+
+
+def _insert(entries):
+    # bulk_create sends no signals, so the daily counters are updated here
+    deltas = {}
+    for entry in entries:
+        waste_totals.add_entry(deltas, entry.user_id, entry.waste_type, entry.date, entry.quantity)
+    with transaction.atomic():
+        WasteEntry.objects.bulk_create(entries, batch_size=IMPORT_CHUNK_SIZE)
+        waste_totals.apply(deltas)
+
+
+def import_waste_entries(user, lines, max_rows=None):
+    # Imports CSV rows (header: waste_type, quantity and optionally date) for
+    # the user, reading `lines` incrementally and inserting valid rows in
+    # chunks. Invalid rows are skipped and reported by their line number.
+    reader = csv.DictReader(lines)
+    # A byte order mark survives decoding of raw text/csv bodies
+    fieldnames = [name.strip().lstrip('\ufeff').lower() for name in reader.fieldnames or []]
+    if not REQUIRED_COLUMNS <= set(fieldnames):
+        raise WasteImportError(f'CSV header must include: {", ".join(sorted(REQUIRED_COLUMNS))}.')
+    reader.fieldnames = fieldnames
+
+    # With a row limit the whole file is one transaction, so a file over the
+    # limit imports nothing. Unlimited imports (the management command)
+    # commit chunk by chunk.
+    with transaction.atomic() if max_rows is not None else nullcontext():
+        return _import_rows(user, reader, max_rows)
+
+
+def _import_rows(user, reader, max_rows):
+    now = timezone.now()
+    dates = {}
+    imported = 0
+    rejected = 0
+    errors = []
+    entries = []
+    rows = 0
+    for row in reader:
+        rows += 1
+        if max_rows is not None and rows > max_rows:
+            raise WasteImportError(f'A file may contain at most {max_rows} rows; no rows were imported.')
+        try:
+            waste_type, quantity, date = _parse_row(row, now, dates)
+        except ValueError as exc:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': reader.line_num, 'error': str(exc)})
+            continue
+        entries.append(WasteEntry(user_id=user.id, waste_type=waste_type, quantity=quantity, date=date))
+        if len(entries) == IMPORT_CHUNK_SIZE:
+            _insert(entries)
+            imported += len(entries)
+            entries = []
+    if entries:
+        _insert(entries)
+        imported += len(entries)
+
+    return {'imported': imported, 'rejected': rejected, 'errors': errors}
@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+LOAD_CHUNK_SIZE = 10000
+BLOCK_SIZE = 1000
+
+# Entries are stored as single ints ordered by points descending, then user
+# id, which keeps a million participants in compact sorted blocks.
+POINTS_LIMIT = 2 ** 31
+USER_ID_BITS = 32
+USER_ID_MASK = (1 << USER_ID_BITS) - 1
+
+
+def _encode(user_id, points):
+    return ((POINTS_LIMIT - points) << USER_ID_BITS) | user_id
+
+
+def _decode(key):
+    return key & USER_ID_MASK, POINTS_LIMIT - (key >> USER_ID_BITS)
+
+
+class SortedKeys:
+    # Sorted ints split into blocks of about BLOCK_SIZE, so an insert or
+    # delete moves one block instead of the whole list
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._blocks = [keys[start:start + BLOCK_SIZE] for start in range(0, len(keys), BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._offsets = None
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def _block_offsets(self):
+        # Number of keys before each block, rebuilt after a change
+        if self._offsets is None:
+            self._offsets = [0, *accumulate(len(block) for block in self._blocks)]
+        return self._offsets
+
+    def _offset(self, block):
+        return self._block_offsets()[block]
+
+    def bisect_left(self, key):
+        block = bisect_left(self._maxes, key)
+        if block == len(self._blocks):
+            return self._len
+        return self._offset(block) + bisect_left(self._blocks[block], key)
+
+    def bisect_right(self, key):
+        block = bisect_right(self._maxes, key)
+        if block == len(self._blocks):
+            return self._len
+        return self._offset(block) + bisect_right(self._blocks[block], key)
+
+    def add(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+        else:
+            block = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+            keys = self._blocks[block]
+            insort(keys, key)
+            self._maxes[block] = keys[-1]
+            if len(keys) > 2 * BLOCK_SIZE:
+                self._blocks[block:block + 1] = [keys[:BLOCK_SIZE], keys[BLOCK_SIZE:]]
+                self._maxes[block:block + 1] = [keys[BLOCK_SIZE - 1], keys[-1]]
+        self._offsets = None
+        self._len += 1
+
+    def discard(self, key):
+        block = bisect_left(self._maxes, key)
+        if block == len(self._blocks):
+            return
+        keys = self._blocks[block]
+        position = bisect_left(keys, key)
+        if keys[position] != key:
+            return
+        del keys[position]
+        if keys:
+            self._maxes[block] = keys[-1]
+        else:
+            del self._blocks[block]
+            del self._maxes[block]
+        self._offsets = None
+        self._len -= 1
+
+    def slice(self, start, stop):
+        stop = min(stop, self._len)
+        if start >= stop:
+            return []
+        block = bisect_right(self._block_offsets(), start) - 1
+        position = start - self._offset(block)
+        keys = []
+        while len(keys) < stop - start:
+            keys.extend(self._blocks[block][position:position + stop - start - len(keys)])
+            block += 1
+            position = 0
+        return keys
+
+
+class RankIndex:
+    # In-process sorted index of leaderboard points. Ranks are competition
+    # ranks (ties share a rank) found by binary search. challenges.award_points
+    # keeps it current within this process once its transaction commits. Every
+    # LEADERBOARD_INDEX_TTL seconds it is reloaded from the database in a
+    # background thread to pick up other processes' writes; requests keep
+    # reading the current index meanwhile, and updates made during the reload
+    # are replayed onto the new one.
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._keys = None
+        self._loaded_at = 0.0
+        # {user_id: (points values seen during the reload, latest points)}
+        # while a reload runs, otherwise None
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def _keys_or_load(self):
+        ttl = self.ttl if self.ttl is not None else settings.LEADERBOARD_INDEX_TTL
+        with self._lock:
+            keys, expired = self._keys, time.monotonic() - self._loaded_at > ttl
+            start = expired and self._pending is None
+            if start and keys is not None:
+                self._pending = {}
+        if keys is None:
+            # Nothing to serve yet, so the first load runs in the request
+            self.reload()
+        elif start:
+            threading.Thread(target=self._background_reload, daemon=True).start()
+        with self._lock:
+            return self._keys
+
+    def _background_reload(self):
+        try:
+            self._load()
+        except Exception:
+            logger.exception('Failed to reload the leaderboard index')
+            with self._lock:
+                self._pending = None
+                # Retry after another TTL rather than on every request
+                self._loaded_at = time.monotonic()
+        finally:
+            connection.close()
+
+    def reload(self):
+        with self._lock:
+            if self._pending is None:
+                self._pending = {}
+        try:
+            self._load()
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _load(self):
+        from recycling.models import Leaderboard
+
+        rows = Leaderboard.objects.values_list('user_id', 'points').iterator(chunk_size=LOAD_CHUNK_SIZE)
+        keys = SortedKeys(_encode(user_id, points) for user_id, points in rows)
+        with self._lock:
+            # The rows read may or may not include an update made meanwhile,
+            # so drop every value the user had during the reload and keep the
+            # latest one
+            for user_id, (seen, points) in (self._pending or {}).items():
+                for value in seen:
+                    keys.discard(_encode(user_id, value))
+                if points is not None:
+                    keys.add(_encode(user_id, points))
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+            self._pending = None
+
+    def clear(self):
+        with self._lock:
+            self._keys = None
+
+    def update(self, user_id, old_points, new_points):
+        with self._lock:
+            if self._pending is not None:
+                seen, _ = self._pending.get(user_id, (set(), None))
+                seen.update(points for points in (old_points, new_points) if points is not None)
+                self._pending[user_id] = (seen, new_points)
+            if self._keys is None:
+                return
+            if old_points is not None:
+                self._keys.discard(_encode(user_id, old_points))
+            if new_points is not None:
+                self._keys.add(_encode(user_id, new_points))
+
+    def __len__(self):
+        keys = self._keys_or_load()
+        with self._lock:
+            return len(keys)
+
+    def rank(self, points):
+        # 1 + the number of participants with more points
+        keys = self._keys_or_load()
+        with self._lock:
+            return keys.bisect_left(_encode(0, points)) + 1
+
+    def _entries(self, keys, start, stop):
+        # Called with the lock held
+        entries = []
+        for key in keys.slice(start, stop):
+            user_id, points = _decode(key)
+            entries.append({'rank': keys.bisect_left(_encode(0, points)) + 1, 'user_id': user_id, 'points': points})
+        return entries
+
+    def top(self, limit):
+        keys = self._keys_or_load()
+        with self._lock:
+            return self._entries(keys, 0, limit)
+
+    def around(self, user_id, points, window):
+        # Entries up to `window` places above and below the user
+        keys = self._keys_or_load()
+        with self._lock:
+            key = _encode(user_id, points)
+            position = keys.bisect_left(key)
+            if keys.bisect_right(key) == position:
+                position = keys.bisect_right(_encode(USER_ID_MASK, points))
+            return self._entries(keys, max(position - window, 0), position + window + 1)
+
+
+rank_index = RankIndex()
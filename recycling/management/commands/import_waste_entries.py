@@ -0,0 +1,31 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from recycling.imports import WasteImportError, import_waste_entries
+
+
+class Command(BaseCommand):
+    help = 'Imports waste entries for a user from a CSV file with waste_type, quantity and optional date columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import.')
+        parser.add_argument('--user', required=True, help='Username the entries belong to.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        self.stdout.write(f'Importing waste entries from {options["path"]}...')
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+                report = import_waste_entries(user, csv_file)
+        except (OSError, UnicodeDecodeError, WasteImportError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report['errors']:
+            self.stderr.write(f'Line {error["line"]}: {error["error"]}')
+        if report['rejected'] > len(report['errors']):
+            self.stderr.write(f'... and {report["rejected"] - len(report["errors"])} more rejected row(s)')
+        self.stdout.write(self.style.SUCCESS(f'Imported {report["imported"]} entry(ies), rejected {report["rejected"]} row(s)'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recycling import geo
+from recycling.models import RecyclingCenter
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the geohash of every recycling center (e.g. after bulk coordinate updates or when the column is first added)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding recycling center geohashes...')
+        centers = []
+        for center in RecyclingCenter.objects.only('id', 'latitude', 'longitude', 'geohash').iterator():
+            geohash = geo.encode(float(center.latitude), float(center.longitude))
+            if center.geohash != geohash:
+                center.geohash = geohash
+                centers.append(center)
+        RecyclingCenter.objects.bulk_update(centers, ['geohash'], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f'Updated {len(centers)} recycling center(s)'))
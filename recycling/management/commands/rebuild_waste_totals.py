@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recycling import geo, waste_totals
+
+
+class Command(BaseCommand):
+    help = 'Reassigns waste entry regions to the nearest recycling center and recomputes the daily waste counters from the raw waste entries (initial backfill, repair, or after centers were added or moved)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write('Reassigning waste entry regions...')
+            moved = geo.assign_regions()
+            self.stdout.write(f'Moved {moved} waste entry(ies) to a new region')
+            self.stdout.write('Rebuilding daily waste totals...')
+            rows = waste_totals.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} daily total row(s)'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recycling import windows
+
+
+class Command(BaseCommand):
+    help = 'Seals ended weekly, monthly and per-challenge leaderboard windows into immutable snapshots (run periodically, e.g. hourly)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Sealing ended leaderboard windows...')
+        sealed = windows.seal()
+        self.stdout.write(self.style.SUCCESS(f'Sealed {sealed} leaderboard window(s)'))
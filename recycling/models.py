@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from recycling import geo
+
 class Event(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
@@ -22,10 +24,80 @@ class WasteEntry(models.Model):
     waste_type = models.CharField(max_length=50, choices=WASTE_TYPE_CHOICES)
     quantity = models.FloatField(help_text="Quantity in kilograms")
     date = models.DateTimeField(default=timezone.now)
+    # Where the waste was logged; the region is the nearest recycling center
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    region = models.ForeignKey(
+        'RecyclingCenter', on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='waste_entries', editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'id']),
+            models.Index(fields=['date', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.waste_type} - {self.quantity}kg"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_location = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The nearest-center lookup only runs when the location changed;
+        # rebuild_waste_totals reassigns regions after centers change
+        update_fields = kwargs.get('update_fields')
+        location = (self.latitude, self.longitude)
+        located = update_fields is None or 'latitude' in update_fields or 'longitude' in update_fields
+        if located and (self._state.adding or location != getattr(self, '_saved_location', None)):
+            self.region_id = geo.region_for(self.latitude, self.longitude)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'region'}
+        super().save(*args, **kwargs)
+        self._saved_location = location
+
+class WasteDailyTotal(models.Model):
+    # Per-user, per-type, per-day (UTC) counters kept in step with WasteEntry
+    # by recycling.waste_totals, so summaries never scan the raw entries
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waste_daily_totals')
+    waste_type = models.CharField(max_length=50, choices=WasteEntry.WASTE_TYPE_CHOICES)
+    day = models.DateField()
+    quantity = models.FloatField(default=0)
+    entry_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'waste_type', 'day')
+        indexes = [
+            models.Index(fields=['user', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.waste_type} - {self.day}: {self.quantity}kg"
+
+class CommunityWasteDailyTotal(models.Model):
+    # Community-wide counters per UTC day, type and region, maintained
+    # alongside WasteDailyTotal. `region` is the RecyclingCenter id, or 0 for
+    # entries logged without a location (a plain column, so the no-region
+    # row stays unique).
+    day = models.DateField()
+    waste_type = models.CharField(max_length=50, choices=WasteEntry.WASTE_TYPE_CHOICES)
+    region = models.PositiveIntegerField(default=0)
+    quantity = models.FloatField(default=0)
+    entry_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'waste_type', 'region')
+        indexes = [
+            models.Index(fields=['region', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.waste_type} - region {self.region}: {self.quantity}kg"
+
 class RecyclingCenter(models.Model):
     name = models.CharField(max_length=100)
     address = models.TextField()
@@ -33,10 +105,19 @@ class RecyclingCenter(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     contact_email = models.EmailField()
     contact_phone = models.CharField(max_length=20, blank=True, null=True)
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, db_index=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Keeps the spatial index column in step with the coordinates
+        self.geohash = geo.encode(float(self.latitude), float(self.longitude))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('latitude' in update_fields or 'longitude' in update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
 class EcoChallenge(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
@@ -44,6 +125,12 @@ class EcoChallenge(models.Model):
     end_date = models.DateTimeField()
     points = models.PositiveIntegerField(default=10)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_date', 'end_date']),
+            models.Index(fields=['end_date']),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -53,16 +140,76 @@ class UserChallenge(models.Model):
     completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        unique_together = ('user', 'challenge')
+
     def __str__(self):
         return f"{self.user.username} - {self.challenge.title}"
 
 class Leaderboard(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='leaderboard')
-    points = models.PositiveIntegerField(default=0)
+    points = models.PositiveIntegerField(default=0, db_index=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.points} Points"
 
-    def update_points(self, additional_points):
-        self.points += additional_points
-        self.save()
+class LeaderboardWindowEntry(models.Model):
+    # Points a user earned within one leaderboard window: an ISO week
+    # ('2026-W07'), a month ('2026-02') or a single challenge (its id).
+    # Maintained by recycling.windows as challenges are completed, and moved
+    # into a LeaderboardSnapshot once the window has ended.
+    WEEK = 'week'
+    MONTH = 'month'
+    CHALLENGE = 'challenge'
+    PERIOD_CHOICES = [
+        (WEEK, 'Weekly'),
+        (MONTH, 'Monthly'),
+        (CHALLENGE, 'Per challenge'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    window = models.CharField(max_length=20)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_window_entries')
+    points = models.PositiveIntegerField(default=0)
+    reached_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('period', 'window', 'user')
+        indexes = [
+            models.Index(fields=['period', 'window', '-points', 'reached_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.period} {self.window} - {self.points} Points"
+
+class LeaderboardSnapshot(models.Model):
+    # Final standings of an ended window; its entries are written once. Points
+    # earned after a window was sealed produce a new revision, and earlier
+    # revisions are kept unchanged.
+    period = models.CharField(max_length=10, choices=LeaderboardWindowEntry.PERIOD_CHOICES)
+    window = models.CharField(max_length=20)
+    revision = models.PositiveIntegerField(default=1)
+    participants = models.PositiveIntegerField(default=0)
+    sealed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('period', 'window', 'revision')
+
+    def __str__(self):
+        return f"{self.period} {self.window} r{self.revision} ({self.participants} participants)"
+
+class LeaderboardSnapshotEntry(models.Model):
+    snapshot = models.ForeignKey(LeaderboardSnapshot, on_delete=models.CASCADE, related_name='entries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_snapshot_entries')
+    rank = models.PositiveIntegerField()
+    points = models.PositiveIntegerField()
+    reached_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('snapshot', 'user')
+        indexes = [
+            models.Index(fields=['snapshot', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.snapshot} - #{self.rank} {self.user.username}"
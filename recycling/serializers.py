@@ -10,8 +10,17 @@ class WasteEntrySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = WasteEntry
-        fields = ['id', 'user', 'waste_type', 'quantity', 'date']
-        read_only_fields = ['id', 'user', 'date']
+        fields = ['id', 'user', 'waste_type', 'quantity', 'date', 'latitude', 'longitude', 'region']
+        read_only_fields = ['id', 'user', 'date', 'region']
+
+    def validate(self, data):
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError('Provide both latitude and longitude, or neither.')
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise serializers.ValidationError('latitude must be between -90 and 90 and longitude between -180 and 180.')
+        return data
 
 class RecyclingCenterSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,3 +1,708 @@
-from django.test import TestCase
+import math
+import random
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from threading import Barrier, Event, Thread
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recycling import active_challenges, challenges, geo, imports, leaderboard, waste_totals, windows
+from recycling.active_challenges import ActiveChallengeCache
+from recycling.leaderboard import RankIndex, SortedKeys
+from recycling.models import (
+    CommunityWasteDailyTotal, EcoChallenge, Leaderboard, LeaderboardSnapshot, LeaderboardWindowEntry, RecyclingCenter, UserChallenge,
+    WasteDailyTotal, WasteEntry,
+)
+
+
+def create_challenge(points=15, started=timedelta(days=1), remaining=timedelta(days=1)):
+    now = timezone.now()
+    return EcoChallenge.objects.create(
+        title='Plastic-free week', description='No single-use plastic',
+        start_date=now - started, end_date=now + remaining, points=points,
+    )
+
+
+class ChallengeCompletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.challenge = create_challenge()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def complete_url(self, challenge_id):
+        return f'/api/user-challenges/complete/{challenge_id}/'
+
+    def test_completing_twice_awards_points_once(self):
+        first = self.client.post(self.complete_url(self.challenge.id))
+        second = self.client.post(self.complete_url(self.challenge.id))
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['points_awarded'], 15)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['message'], 'Challenge already completed.')
+        self.assertEqual(Leaderboard.objects.get(user=self.user).points, 15)
+        self.assertEqual(UserChallenge.objects.filter(user=self.user, completed=True).count(), 1)
+        self.assertEqual(
+            LeaderboardWindowEntry.objects.get(period=LeaderboardWindowEntry.CHALLENGE, user=self.user).points, 15,
+        )
+
+    def test_pending_completion_row_is_completed_once(self):
+        # Rows created by a bulk completion that had not finished yet
+        UserChallenge.objects.create(user=self.user, challenge=self.challenge)
+
+        self.assertTrue(challenges.complete(self.user, self.challenge))
+        self.assertFalse(challenges.complete(self.user, self.challenge))
+        self.assertEqual(Leaderboard.objects.get(user=self.user).points, 15)
+
+    def test_bulk_completion_skips_users_who_already_completed(self):
+        other = User.objects.create_user('bob', password='pass')
+        challenges.complete(self.user, self.challenge)
+
+        completed = challenges.complete_many(self.challenge, [self.user.id, other.id])
+        repeated = challenges.complete_many(self.challenge, [self.user.id, other.id])
+
+        self.assertEqual(completed, [other.id])
+        self.assertEqual(repeated, [])
+        self.assertEqual(dict(Leaderboard.objects.values_list('user__username', 'points')), {'alice': 15, 'bob': 15})
+
+    def test_bulk_completion_endpoint_awards_each_user_once(self):
+        moderator = User.objects.create_user('mod', password='pass')
+        moderator.groups.add(Group.objects.get_or_create(name='Moderator')[0])
+        other = User.objects.create_user('bob', password='pass')
+        self.client.force_authenticate(moderator)
+        url = self.complete_url(self.challenge.id) + 'bulk/'
+
+        first = self.client.post(url, {'user_ids': [self.user.id], 'usernames': ['bob', 'nobody']}, format='json')
+        second = self.client.post(url, {'user_ids': [self.user.id, other.id]}, format='json')
+
+        self.assertEqual(sorted(first.data['completed']), ['alice', 'bob'])
+        self.assertEqual(first.data['unknown_users'], ['nobody'])
+        self.assertEqual(second.data['completed'], [])
+        self.assertEqual(second.data['already_completed'], 2)
+        self.assertEqual(Leaderboard.objects.get(user=other).points, 15)
+
+    def test_inactive_or_missing_challenge_is_rejected(self):
+        ended = create_challenge(started=timedelta(days=3), remaining=-timedelta(days=1))
+
+        self.assertEqual(self.client.post(self.complete_url(ended.id)).status_code, 400)
+        self.assertEqual(self.client.post(self.complete_url(ended.id + 100)).status_code, 404)
+        self.assertFalse(Leaderboard.objects.filter(user=self.user).exists())
+
+
+class WasteTotalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.day = datetime(2026, 3, 2, 9, tzinfo=dt_timezone.utc)
+        self.center = RecyclingCenter.objects.create(
+            name='Depot', address='1 Main St', latitude='51.500000', longitude='-0.120000', contact_email='info@example.com',
+        )
+
+    def create_entry(self, waste_type='plastic', quantity=2.0, date=None, **location):
+        return WasteEntry.objects.create(user=self.user, waste_type=waste_type, quantity=quantity, date=date or self.day, **location)
+
+    def user_totals(self):
+        return sorted(WasteDailyTotal.objects.values_list('waste_type', 'day', 'quantity', 'entry_count'))
+
+    def community_totals(self):
+        return sorted(CommunityWasteDailyTotal.objects.values_list('waste_type', 'day', 'region', 'quantity', 'entry_count'))
+
+    def assertMatchesRebuild(self):
+        totals = (self.user_totals(), self.community_totals())
+        waste_totals.rebuild()
+        self.assertEqual(totals, (self.user_totals(), self.community_totals()))
+
+    def test_saved_entries_are_counted(self):
+        self.create_entry(quantity=2.0)
+        self.create_entry(quantity=3.0, latitude='51.500100', longitude='-0.120100')
+
+        self.assertEqual(self.user_totals(), [('plastic', self.day.date(), 5.0, 2)])
+        self.assertEqual(self.community_totals(), [
+            ('plastic', self.day.date(), 0, 2.0, 1),
+            ('plastic', self.day.date(), self.center.pk, 3.0, 1),
+        ])
+        self.assertMatchesRebuild()
+
+    def test_updated_entry_moves_between_counters(self):
+        entry = self.create_entry(quantity=2.0)
+        self.create_entry(quantity=1.0)
+
+        entry.waste_type = 'glass'
+        entry.quantity = 4.0
+        entry.date = self.day + timedelta(days=1)
+        entry.save()
+
+        self.assertEqual(self.user_totals(), [
+            ('glass', self.day.date() + timedelta(days=1), 4.0, 1),
+            ('plastic', self.day.date(), 1.0, 1),
+        ])
+        self.assertMatchesRebuild()
+
+    def test_deleting_the_last_entry_drops_its_counters(self):
+        entry = self.create_entry(latitude='51.500100', longitude='-0.120100')
+
+        entry.delete()
+
+        self.assertEqual(self.user_totals(), [])
+        self.assertEqual(self.community_totals(), [])
+
+    def test_deleting_a_center_moves_its_totals_to_no_region(self):
+        self.create_entry(quantity=2.0)
+        self.create_entry(quantity=3.0, latitude='51.500100', longitude='-0.120100')
+
+        self.center.delete()
+
+        self.assertEqual(self.community_totals(), [('plastic', self.day.date(), 0, 5.0, 2)])
+        self.assertFalse(WasteEntry.objects.filter(region__isnull=False).exists())
+        self.assertMatchesRebuild()
+
+
+class CommunityAnalyticsTests(TestCase):
+    def setUp(self):
+        self.center = RecyclingCenter.objects.create(
+            name='Depot', address='1 Main St', latitude='51.500000', longitude='-0.120000', contact_email='info@example.com',
+        )
+        for day, waste_type, region, quantity, count in (
+            (date(2026, 2, 25), 'plastic', self.center.pk, 3.0, 1),
+            (date(2026, 3, 2), 'plastic', self.center.pk, 4.0, 2),
+            (date(2026, 3, 4), 'paper', 0, 2.0, 1),
+            (date(2026, 3, 5), 'glass', 0, 0.0, 0),
+            (date(2026, 3, 10), 'plastic', 0, 6.0, 3),
+        ):
+            CommunityWasteDailyTotal.objects.create(day=day, waste_type=waste_type, region=region, quantity=quantity, entry_count=count)
+        moderator = User.objects.create_user('mod', password='pass')
+        moderator.groups.add(Group.objects.get_or_create(name='Moderator')[0])
+        self.client = APIClient()
+        self.client.force_authenticate(moderator)
+
+    def analytics(self, **params):
+        return self.client.get('/api/waste-analytics/', {'start': '2026-03-02', 'end': '2026-03-15', **params})
+
+    def test_totals_trend_and_change(self):
+        response = self.analytics(period='week')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['total_quantity'], response.data['entry_count']), (12.0, 6))
+        self.assertEqual(response.data['previous_total_quantity'], 3.0)
+        self.assertEqual(response.data['change'], 3.0)
+        self.assertEqual(
+            [(row['period_start'], row['total_quantity'], row['entry_count']) for row in response.data['trend']],
+            [(date(2026, 3, 2), 6.0, 3), (date(2026, 3, 9), 6.0, 3)],
+        )
+        self.assertEqual(
+            [(row['waste_type'], row['share']) for row in response.data['by_type']],
+            [('plastic', 10.0 / 12.0), ('paper', 2.0 / 12.0)],
+        )
+
+    def test_daily_trend_skips_empty_days(self):
+        trend = self.analytics().data['trend']
+
+        self.assertEqual([row['period_start'] for row in trend], [date(2026, 3, 2), date(2026, 3, 4), date(2026, 3, 10)])
+
+    def test_region_split_and_filters(self):
+        by_region = self.analytics().data['by_region']
+        self.assertEqual(
+            [(row['region'], row['region_name'], row['total_quantity']) for row in by_region],
+            [(None, None, 8.0), (self.center.pk, 'Depot', 4.0)],
+        )
+
+        self.assertEqual(self.analytics(region='none').data['total_quantity'], 8.0)
+        center = self.analytics(region=self.center.pk).data
+        self.assertEqual((center['total_quantity'], center['previous_total_quantity']), (4.0, 3.0))
+        self.assertEqual(self.analytics(waste_type='paper').data['total_quantity'], 2.0)
+
+    def test_invalid_parameters_and_permissions(self):
+        for params in ({'period': 'hour'}, {'region': 'north'}, {'waste_type': 'rubber'}, {'start': '2026-03-20'}):
+            self.assertEqual(self.analytics(**params).status_code, 400)
+        self.assertEqual(self.client.get('/api/waste-analytics/', {'start': '2020-01-01', 'end': '2026-01-01'}).status_code, 400)
+
+        self.client.force_authenticate(User.objects.create_user('alice', password='pass'))
+        self.assertEqual(self.analytics().status_code, 403)
+
+
+class WasteImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_csv(self, body):
+        return self.client.generic('POST', '/api/waste-entries/import/', body.encode('utf-8'), content_type='text/csv')
+
+    def test_invalid_rows_are_reported_by_line(self):
+        response = self.post_csv(
+            'waste_type,quantity,date\n'
+            'plastic,1.5,2026-03-02\n'
+            'rubber,2,2026-03-02\n'
+            'paper,-1,\n'
+            'glass,3,yesterday\n'
+            'Metal ,4,2026-03-02T10:00:00Z\n'
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['rejected'], 3)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4, 5])
+        self.assertIn('waste_type', response.data['errors'][0]['error'])
+        self.assertEqual(sorted(WasteEntry.objects.values_list('waste_type', flat=True)), ['metal', 'plastic'])
+        self.assertEqual(WasteDailyTotal.objects.get(waste_type='metal').quantity, 4.0)
+
+    def test_file_over_the_row_limit_imports_nothing(self):
+        lines = ['waste_type,quantity'] + ['plastic,1'] * 10
+
+        with mock.patch.object(imports, 'IMPORT_CHUNK_SIZE', 3):
+            with self.assertRaises(imports.WasteImportError):
+                imports.import_waste_entries(self.user, iter(lines), max_rows=7)
+            self.assertFalse(WasteEntry.objects.exists())
+            self.assertFalse(WasteDailyTotal.objects.exists())
+
+            report = imports.import_waste_entries(self.user, iter(lines), max_rows=10)
+        self.assertEqual(report['imported'], 10)
+        self.assertEqual(WasteDailyTotal.objects.get().entry_count, 10)
+
+    def test_byte_order_mark_is_ignored(self):
+        raw = self.post_csv('\ufeffwaste_type,quantity\nplastic,1\n')
+        upload = SimpleUploadedFile('entries.csv', '\ufeffWaste_Type,Quantity\npaper,2\n'.encode('utf-8'), content_type='text/csv')
+        multipart = self.client.post('/api/waste-entries/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual((raw.status_code, multipart.status_code), (201, 201))
+        self.assertEqual(sorted(WasteEntry.objects.values_list('waste_type', flat=True)), ['paper', 'plastic'])
+
+    def test_missing_columns_or_no_valid_rows_are_rejected(self):
+        missing = self.post_csv('waste_type,amount\nplastic,1\n')
+        self.assertEqual(missing.status_code, 400)
+        self.assertIn('quantity', missing.data['error'])
+
+        invalid = self.post_csv('waste_type,quantity\nplastic,abc\n')
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(invalid.data['errors'], [{'line': 2, 'error': 'quantity must be a number.'}])
+
+
+class SortedKeysTests(TestCase):
+    def test_matches_a_sorted_list_across_blocks(self):
+        rng = random.Random(1)
+        expected = sorted(rng.randrange(10 ** 6) for _ in range(3 * leaderboard.BLOCK_SIZE))
+        keys = SortedKeys(expected)
+        for _ in range(8 * leaderboard.BLOCK_SIZE):
+            if rng.random() < 0.5 or not expected:
+                key = rng.randrange(10 ** 6)
+                keys.add(key)
+                expected.insert(bisect_left(expected, key), key)
+            else:
+                key = expected.pop(rng.randrange(len(expected)))
+                keys.discard(key)
+        keys.discard(-1)
+
+        self.assertEqual(len(keys), len(expected))
+        self.assertEqual(keys.slice(0, len(expected) + 10), expected)
+        for _ in range(200):
+            key = rng.randrange(10 ** 6)
+            self.assertEqual(keys.bisect_left(key), bisect_left(expected, key))
+            self.assertEqual(keys.bisect_right(key), bisect_right(expected, key))
+            start = rng.randrange(len(expected))
+            stop = start + rng.randrange(2 * leaderboard.BLOCK_SIZE)
+            self.assertEqual(keys.slice(start, stop), expected[start:stop])
+
+    def test_empty(self):
+        keys = SortedKeys()
+        keys.discard(3)
+
+        self.assertEqual(len(keys), 0)
+        self.assertEqual(keys.slice(0, 5), [])
+        self.assertEqual(keys.bisect_left(4), 0)
+
+
+class RankIndexTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{number}') for number in range(4)]
+        for user, points in zip(self.users, (30, 20, 20, 10)):
+            Leaderboard.objects.create(user=user, points=points)
+        self.index = RankIndex(ttl=3600)
+
+    def test_ties_share_a_rank(self):
+        self.assertEqual(
+            [(entry['rank'], entry['points']) for entry in self.index.top(4)],
+            [(1, 30), (2, 20), (2, 20), (4, 10)],
+        )
+        self.assertEqual(self.index.rank(20), 2)
+        self.assertEqual(self.index.rank(15), 4)
+        self.assertEqual(len(self.index), 4)
+
+    def test_around_lists_neighbours(self):
+        entries = self.index.around(self.users[3].id, 10, 1)
+
+        self.assertEqual([entry['user_id'] for entry in entries], [self.users[2].id, self.users[3].id])
+
+    def test_updates_move_users(self):
+        self.index.top(1)
+        self.index.update(self.users[3].id, 10, 40)
+
+        self.assertEqual(self.index.top(1)[0]['user_id'], self.users[3].id)
+        self.assertEqual(self.index.rank(30), 2)
+
+    def test_awarded_points_update_the_index_on_commit(self):
+        self.index.top(1)
+        with mock.patch.object(challenges, 'rank_index', self.index), self.captureOnCommitCallbacks(execute=True):
+            challenges.award_points({self.users[3].id: 25})
+
+        self.assertEqual(self.index.top(1)[0], {'rank': 1, 'user_id': self.users[3].id, 'points': 35})
+
+
+class RankIndexReloadTests(TransactionTestCase):
+    def test_updates_during_a_background_reload_are_kept(self):
+        users = [User.objects.create_user(f'user{number}') for number in range(3)]
+        for user, points in zip(users, (30, 20, 10)):
+            Leaderboard.objects.create(user=user, points=points)
+        index = RankIndex(ttl=3600)
+        self.assertEqual(len(index), 3)
+
+        read, updated = Event(), Event()
+        build = SortedKeys
+
+        def slow_build(keys):
+            # The reload has read the rows; updates arrive before it is swapped in
+            keys = list(keys)
+            read.set()
+            updated.wait(5)
+            return build(keys)
+
+        with mock.patch.object(leaderboard, 'SortedKeys', slow_build):
+            index.ttl = 0
+            # Served from the current index while the reload runs
+            self.assertEqual(index.top(1)[0]['user_id'], users[0].id)
+            self.assertTrue(read.wait(5))
+            index.ttl = 3600
+            Leaderboard.objects.create(user=User.objects.create_user('late'), points=5)
+            index.update(users[2].id, 10, 50)
+            updated.set()
+            for _ in range(100):
+                if index._pending is None:
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual([entry['user_id'] for entry in index.top(3)], [users[2].id, users[0].id, users[1].id])
+        self.assertEqual(len(index), 3)
+
+
+def destination(latitude, longitude, bearing, distance_km):
+    # The point distance_km away along a great circle
+    angle = distance_km / geo.EARTH_RADIUS_KM
+    phi, lam, theta = math.radians(latitude), math.radians(longitude), math.radians(bearing)
+    phi2 = math.asin(math.sin(phi) * math.cos(angle) + math.cos(phi) * math.sin(angle) * math.cos(theta))
+    lam2 = lam + math.atan2(math.sin(theta) * math.sin(angle) * math.cos(phi), math.cos(angle) - math.sin(phi) * math.sin(phi2))
+    return math.degrees(phi2), (math.degrees(lam2) + 540) % 360 - 180
+
+
+class GeoTests(TestCase):
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(0.0, 0.0, 1), 's')
+        self.assertEqual(geo.encode(-90.0, -180.0, 2), '00')
+        self.assertEqual(len(geo.encode(10.0, 10.0)), geo.GEOHASH_PRECISION)
+
+    def test_cell_width_shrinks_towards_the_poles(self):
+        height, width = geo.cell_size_km(5, 0.0)
+        self.assertAlmostEqual(height, 4.89, places=2)
+        self.assertAlmostEqual(width, 4.89, places=2)
+        self.assertAlmostEqual(geo.cell_size_km(5, 60.0)[1], width / 2, places=6)
+        self.assertLess(geo.cell_size_km(5, 90.0)[1], 1e-9)
+
+    def assertCovers(self, latitude, longitude, radius_km):
+        prefixes = geo.covering_prefixes(latitude, longitude, radius_km)
+        self.assertLessEqual(len(prefixes), geo.MAX_COVERING_CELLS)
+        for bearing in range(0, 360, 5):
+            for fraction in (0.5, 1.0):
+                point = destination(latitude, longitude, bearing, radius_km * fraction)
+                geohash = geo.encode(*point)
+                self.assertTrue(
+                    any(geohash.startswith(prefix) for prefix in prefixes),
+                    f'{point} is outside {prefixes}',
+                )
+        return prefixes
+
+    def test_prefixes_cover_the_search_circle(self):
+        self.assertEqual(len(self.assertCovers(51.5074, -0.1278, 10)), 9)
+        self.assertCovers(-33.8688, 151.2093, geo.MAX_RADIUS_KM)
+
+    def test_prefixes_wrap_around_the_antimeridian(self):
+        prefixes = self.assertCovers(0.0, 179.99, 300)
+        self.assertTrue(any(prefix.startswith(('0', '2')) for prefix in prefixes))
+
+    def test_prefixes_near_the_poles_are_clamped_to_a_coarse_precision(self):
+        for latitude in (89.5, -89.99, 85.0):
+            prefixes = self.assertCovers(latitude, 10.0, 100)
+            self.assertLess(len(prefixes), 32)
+
+    def test_only_an_oversized_radius_scans_everything(self):
+        self.assertIsNone(geo.covering_prefixes(0.0, 0.0, 6000))
+
+
+class NearestCenterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice', password='pass'))
+
+    def create_center(self, name, latitude, longitude):
+        return RecyclingCenter.objects.create(
+            name=name, address='1 Main St', latitude=latitude, longitude=longitude, contact_email='info@example.com',
+        )
+
+    def nearest(self, **params):
+        return self.client.get('/api/recycling-centers/nearest/', params)
+
+    def test_centers_within_the_radius_closest_first(self):
+        self.create_center('Far', '51.600000', '-0.120000')
+        self.create_center('Near', '51.510000', '-0.130000')
+        self.create_center('Out of range', '52.500000', '-0.120000')
+
+        response = self.nearest(lat=51.5074, lon=-0.1278, radius_km=20)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([center['name'] for center in response.data], ['Near', 'Far'])
+        self.assertLess(response.data[0]['distance_km'], response.data[1]['distance_km'])
+
+    def test_centers_across_the_antimeridian_and_near_a_pole(self):
+        self.create_center('East', '-16.500000', '179.900000')
+        self.create_center('West', '-16.500000', '-179.900000')
+        self.create_center('Polar', '89.900000', '170.000000')
+
+        response = self.nearest(lat=-16.5, lon=179.99, radius_km=50, limit=5)
+        self.assertEqual(sorted(center['name'] for center in response.data), ['East', 'West'])
+        response = self.nearest(lat=89.9, lon=-10.0, radius_km=50)
+        self.assertEqual([center['name'] for center in response.data], ['Polar'])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.nearest(lat=91, lon=0).status_code, 400)
+        self.assertEqual(self.nearest(lat=0, lon=0, radius_km=geo.MAX_RADIUS_KM + 1).status_code, 400)
+        self.assertEqual(self.nearest(lon=0).status_code, 400)
+
+
+class WindowSealingTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pass')
+        self.bob = User.objects.create_user('bob', password='pass')
+        self.carol = User.objects.create_user('carol', password='pass')
+        self.challenge = create_challenge(points=10)
+        self.moment = datetime(2026, 2, 10, 12, tzinfo=dt_timezone.utc)
+        self.week = windows.window_key(windows.WEEK, self.moment)
+
+    def test_window_keys(self):
+        self.assertEqual(self.week, '2026-W07')
+        self.assertEqual(windows.window_key(windows.MONTH, self.moment), '2026-02')
+        # ISO weeks can belong to the previous year
+        self.assertEqual(windows.window_key(windows.WEEK, datetime(2027, 1, 1, tzinfo=dt_timezone.utc)), '2026-W53')
+        self.assertEqual(windows.window_end(windows.MONTH, '2026-12'), datetime(2027, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(windows.parse_window(windows.WEEK, '2026-W7'), '2026-W07')
+        with self.assertRaises(ValueError):
+            windows.parse_window(windows.MONTH, '2026-13')
+
+    def test_live_standings_share_ranks_on_ties(self):
+        windows.record(self.challenge, [self.alice.id, self.bob.id], self.moment)
+        windows.record(self.challenge, [self.carol.id], self.moment + timedelta(hours=1))
+        windows.record(self.challenge, [self.carol.id], self.moment + timedelta(hours=2))
+
+        sealed, entries = windows.top(windows.WEEK, self.week, 10)
+
+        self.assertFalse(sealed)
+        self.assertEqual(
+            [(entry['rank'], entry['user_id'], entry['points']) for entry in entries],
+            [(1, self.carol.id, 20), (2, self.alice.id, 10), (2, self.bob.id, 10)],
+        )
+        self.assertEqual(
+            windows.standing(windows.WEEK, self.week, self.bob.id),
+            {'rank': 2, 'points': 10, 'participants': 3, 'sealed': False},
+        )
+        self.assertIsNone(windows.standing(windows.WEEK, self.week, User.objects.create_user('dave').id))
+
+    def test_sealing_moves_live_entries_into_a_snapshot(self):
+        windows.record(self.challenge, [self.alice.id, self.bob.id], self.moment)
+        windows.record(self.challenge, [self.bob.id], self.moment + timedelta(hours=1))
+
+        snapshot = windows.seal_window(windows.WEEK, self.week)
+
+        self.assertEqual((snapshot.revision, snapshot.participants), (1, 2))
+        self.assertFalse(LeaderboardWindowEntry.objects.filter(period=windows.WEEK, window=self.week).exists())
+        sealed, entries = windows.top(windows.WEEK, self.week, 10)
+        self.assertTrue(sealed)
+        self.assertEqual(
+            [(entry['rank'], entry['user_id'], entry['points']) for entry in entries],
+            [(1, self.bob.id, 20), (2, self.alice.id, 10)],
+        )
+        self.assertEqual(
+            windows.standing(windows.WEEK, self.week, self.alice.id),
+            {'rank': 2, 'points': 10, 'participants': 2, 'sealed': True},
+        )
+
+    def test_late_points_add_a_revision_and_keep_the_earlier_one(self):
+        windows.record(self.challenge, [self.alice.id, self.bob.id], self.moment)
+        windows.record(self.challenge, [self.alice.id], self.moment + timedelta(hours=1))
+        first = windows.seal_window(windows.WEEK, self.week)
+
+        # Completed after the window was sealed, e.g. a moderator backfill
+        windows.record(self.challenge, [self.bob.id], self.moment + timedelta(hours=2))
+        windows.record(self.challenge, [self.bob.id, self.carol.id], self.moment + timedelta(hours=3))
+        second = windows.seal_window(windows.WEEK, self.week)
+
+        self.assertEqual(second.revision, 2)
+        self.assertEqual(second.participants, 3)
+        self.assertEqual(
+            [(entry['rank'], entry['user_id'], entry['points']) for entry in windows.top(windows.WEEK, self.week, 10)[1]],
+            [(1, self.bob.id, 30), (2, self.alice.id, 20), (3, self.carol.id, 10)],
+        )
+        self.assertEqual(
+            list(first.entries.order_by('rank').values_list('user_id', 'points', 'rank')),
+            [(self.alice.id, 20, 1), (self.bob.id, 10, 2)],
+        )
+        self.assertEqual(LeaderboardSnapshot.objects.filter(period=windows.WEEK, window=self.week).count(), 2)
+
+    def test_only_ended_windows_are_sealed(self):
+        ended = create_challenge(started=timedelta(days=3), remaining=-timedelta(days=1))
+        deleted = create_challenge()
+        now = timezone.now()
+        windows.record(ended, [self.alice.id], now - timedelta(days=2))
+        windows.record(self.challenge, [self.alice.id], now)
+        windows.record(deleted, [self.bob.id], now)
+        deleted_window = str(deleted.pk)
+        deleted.delete()
+
+        sealable = windows.sealable_windows(now)
+
+        self.assertIn((windows.CHALLENGE, str(ended.pk)), sealable)
+        self.assertIn((windows.CHALLENGE, deleted_window), sealable)
+        self.assertNotIn((windows.CHALLENGE, str(self.challenge.pk)), sealable)
+        self.assertNotIn((windows.WEEK, windows.window_key(windows.WEEK, now)), sealable)
+        self.assertNotIn((windows.MONTH, windows.window_key(windows.MONTH, now)), sealable)
+
+        self.assertEqual(windows.seal(now), len(sealable))
+        self.assertTrue(windows.top(windows.CHALLENGE, str(ended.pk), 10)[0])
+        self.assertFalse(windows.top(windows.CHALLENGE, str(self.challenge.pk), 10)[0])
+        # The current week keeps collecting points
+        self.assertEqual(windows.standing(windows.WEEK, windows.window_key(windows.WEEK, now), self.bob.id)['points'], 15)
+
+    def test_endpoints_report_sealed_windows(self):
+        windows.record(self.challenge, [self.alice.id, self.bob.id], self.moment)
+        windows.record(self.challenge, [self.alice.id], self.moment + timedelta(hours=1))
+        windows.seal_window(windows.WEEK, self.week)
+        client = APIClient()
+
+        response = client.get('/api/leaderboard/weekly/', {'window': self.week})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['sealed'])
+        self.assertEqual(
+            [(entry['rank'], entry['user'], entry['points']) for entry in response.data['entries']],
+            [(1, 'alice', 20), (2, 'bob', 10)],
+        )
+        self.assertEqual(client.get('/api/leaderboard/weekly/', {'window': 'last week'}).status_code, 400)
+
+        client.force_authenticate(self.bob)
+        response = client.get('/api/leaderboard/weekly/me/', {'window': self.week})
+        self.assertEqual((response.data['rank'], response.data['sealed']), (2, True))
+        client.force_authenticate(self.carol)
+        self.assertEqual(client.get('/api/leaderboard/weekly/me/', {'window': self.week}).status_code, 404)
+
+
+class ActiveChallengeCacheTests(TestCase):
+    def setUp(self):
+        active_challenges.active_challenges.invalidate()
+        moderator = User.objects.create_user('mod', password='pass')
+        moderator.groups.add(Group.objects.get_or_create(name='Moderator')[0])
+        self.client = APIClient()
+        self.client.force_authenticate(moderator)
+
+    def active_titles(self):
+        response = self.client.get('/api/eco-challenges/', {'status': 'active'})
+        self.assertEqual(response.status_code, 200)
+        return [challenge['title'] for challenge in response.data['results']]
+
+    def test_reloads_at_the_next_boundary(self):
+        cache = ActiveChallengeCache(ttl=3600)
+        now = timezone.now()
+        ending = create_challenge(remaining=timedelta(hours=1))
+        starting = create_challenge(started=-timedelta(hours=2), remaining=timedelta(days=1))
+
+        self.assertEqual(cache.active(now), [ending])
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.active(now + timedelta(minutes=59)), [ending])
+        # Past the end of the first challenge and the start of the second
+        with self.assertNumQueries(2):
+            self.assertEqual(cache.active(now + timedelta(hours=3)), [starting])
+
+    def test_reloads_after_the_ttl(self):
+        cache = ActiveChallengeCache(ttl=60)
+        challenge = create_challenge()
+        now = timezone.now()
+        self.assertEqual(cache.active(now), [challenge])
+
+        # A write from another process sends no signal here
+        EcoChallenge.objects.filter(pk=challenge.pk).update(end_date=now - timedelta(minutes=1))
+        self.assertEqual(cache.active(now), [challenge])
+        with mock.patch('recycling.active_challenges.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(cache.active(now), [])
+
+    def test_saves_and_deletes_invalidate_the_list(self):
+        response = self.client.post('/api/eco-challenges/', {
+            'title': 'Cycle to work', 'description': 'Leave the car at home',
+            'start_date': timezone.now() - timedelta(hours=1), 'end_date': timezone.now() + timedelta(days=7),
+            'points': 20,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.active_titles(), ['Cycle to work'])
+
+        challenge = create_challenge()
+        self.assertEqual(self.active_titles(), ['Cycle to work', 'Plastic-free week'])
+        challenge.end_date = timezone.now() - timedelta(minutes=1)
+        challenge.save()
+        self.assertEqual(self.active_titles(), ['Cycle to work'])
+        self.assertEqual(self.client.delete(f"/api/eco-challenges/{response.data['id']}/").status_code, 204)
+        self.assertEqual(self.active_titles(), [])
+
+    def test_invalidated_again_on_commit(self):
+        cache = active_challenges.active_challenges
+        with self.captureOnCommitCallbacks(execute=True):
+            challenge = create_challenge()
+            # Another thread reloading before the write is visible would cache a stale list
+            cache.active()
+        with self.assertNumQueries(2):
+            self.assertEqual(cache.active(), [challenge])
+
+    def test_get_active_ignores_the_cache(self):
+        challenge = create_challenge()
+        self.assertEqual(active_challenges.active_challenges.active(), [challenge])
+        EcoChallenge.objects.filter(pk=challenge.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+
+        self.assertIsNone(active_challenges.get_active(challenge.pk))
+        self.assertEqual(active_challenges.get_active(challenge.pk, now=timezone.now() - timedelta(hours=1)), challenge)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'concurrent writers need PostgreSQL')
+class ConcurrentChallengeCompletionTests(TransactionTestCase):
+    def test_concurrent_completions_award_points_once(self):
+        user = User.objects.create_user('alice', password='pass')
+        challenge = create_challenge()
+        workers = 8
+        barrier = Barrier(workers)
+        results = []
+
+        def complete():
+            try:
+                barrier.wait()
+                results.append(challenges.complete(user, challenge))
+            finally:
+                connections.close_all()
+
+        threads = [Thread(target=complete) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * (workers - 1) + [True])
+        self.assertEqual(Leaderboard.objects.get(user=user).points, 15)
+        self.assertEqual(UserChallenge.objects.filter(user=user, completed=True).count(), 1)
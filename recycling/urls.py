@@ -1,21 +1,36 @@
 from django.urls import path, include
 from recycling.views import (
-    WasteEntryListCreateView, RecyclingCenterListCreateView,
+    WasteEntryListCreateView, WasteEntryImportView, WasteEntryExportView, RecyclingCenterListCreateView,
+    RecyclingCenterNearestView,
     RecyclingCenterDetailView, EcoChallengeListCreateView,
     EcoChallengeDetailView, UserChallengeListView,
-    UserChallengeCompleteView, LeaderboardListView,
-    UserWasteSummaryView, 
+    UserChallengeCompleteView, UserChallengeBulkCompleteView, LeaderboardListView, LeaderboardMeView,
+    LeaderboardAroundMeView, WindowedLeaderboardView, WindowedLeaderboardMeView,
+    UserWasteSummaryView, CommunityWasteAnalyticsView,
 )
 
 urlpatterns = [
         # Waste Reduction and Recycling URLs
         path('waste-entries/', WasteEntryListCreateView.as_view(), name='waste_entry_list_create'),
+        path('waste-entries/import/', WasteEntryImportView.as_view(), name='waste_entry_import'),
+        path('waste-entries/export/', WasteEntryExportView.as_view(), name='waste_entry_export'),
         path('recycling-centers/', RecyclingCenterListCreateView.as_view(), name='recycling_center_list_create'),
+        path('recycling-centers/nearest/', RecyclingCenterNearestView.as_view(), name='recycling_center_nearest'),
         path('recycling-centers/<int:pk>/', RecyclingCenterDetailView.as_view(), name='recycling_center_detail'),
         path('eco-challenges/', EcoChallengeListCreateView.as_view(), name='eco_challenge_list_create'),
         path('eco-challenges/<int:pk>/', EcoChallengeDetailView.as_view(), name='eco_challenge_detail'),
         path('user-challenges/', UserChallengeListView.as_view(), name='user_challenge_list'),
         path('user-challenges/complete/<int:challenge_id>/', UserChallengeCompleteView.as_view(), name='user_challenge_complete'),
+        path('user-challenges/complete/<int:challenge_id>/bulk/', UserChallengeBulkCompleteView.as_view(), name='user_challenge_bulk_complete'),
         path('leaderboard/', LeaderboardListView.as_view(), name='leaderboard_list'),
+        path('leaderboard/me/', LeaderboardMeView.as_view(), name='leaderboard_me'),
+        path('leaderboard/around-me/', LeaderboardAroundMeView.as_view(), name='leaderboard_around_me'),
+        path('leaderboard/weekly/', WindowedLeaderboardView.as_view(period='week'), name='leaderboard_weekly'),
+        path('leaderboard/weekly/me/', WindowedLeaderboardMeView.as_view(period='week'), name='leaderboard_weekly_me'),
+        path('leaderboard/monthly/', WindowedLeaderboardView.as_view(period='month'), name='leaderboard_monthly'),
+        path('leaderboard/monthly/me/', WindowedLeaderboardMeView.as_view(period='month'), name='leaderboard_monthly_me'),
+        path('leaderboard/challenges/<int:challenge_id>/', WindowedLeaderboardView.as_view(period='challenge'), name='leaderboard_challenge'),
+        path('leaderboard/challenges/<int:challenge_id>/me/', WindowedLeaderboardMeView.as_view(period='challenge'), name='leaderboard_challenge_me'),
         path('user-waste-summary/', UserWasteSummaryView.as_view(), name='user_waste_summary'),
+        path('waste-analytics/', CommunityWasteAnalyticsView.as_view(), name='community_waste_analytics'),
 ]
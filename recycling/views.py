@@ -2,11 +2,13 @@ from django.shortcuts import render
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Q
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from recycling.models import (
@@ -15,20 +17,42 @@ from recycling.models import (
 )
 from recycling.serializers import (
     WasteEntrySerializer, RecyclingCenterSerializer, EcoChallengeSerializer,
-    UserChallengeSerializer, LeaderboardSerializer
+    UserChallengeSerializer
 )
+from recycling import analytics, challenges, geo, waste_totals, windows
+from recycling.active_challenges import STATUSES, ACTIVE, active_challenges, filter_by_status, get_active
+from recycling.imports import WasteImportError, import_waste_entries
+from recycling.leaderboard import rank_index
+from core.exports import streaming_export
+from core.pagination import DateKeysetPagination
+from core.parsers import CSVStreamParser
 from core.permissions import (
     IsAdminOrModerator, IsOwnerOrReadOnly, IsAdminUser, IsAuthorOrReadOnly
 )
+from core.renderers import CSVRenderer, NDJSONRenderer
+import codecs
+import csv
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _bounded_int_param(request, name, default, maximum):
+    try:
+        value = int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer.')
+    if not (1 <= value <= maximum):
+        raise ValueError(f'{name} must be between 1 and {maximum}.')
+    return value
+
 # WasteEntry Views
+IMPORT_MAX_ROWS = 200000
+
 class WasteEntryListCreateView(generics.ListCreateAPIView):
     queryset = WasteEntry.objects.all()
     serializer_class = WasteEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = DateKeysetPagination
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -36,9 +60,52 @@ class WasteEntryListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         # Users can see their own waste entries; Admins can see all
         user = self.request.user
+        entries = WasteEntry.objects.select_related('user')
         if user.groups.filter(name__in=['Admin', 'Moderator']).exists():
-            return WasteEntry.objects.all()
-        return WasteEntry.objects.filter(user=user)
+            return entries
+        return entries.filter(user=user)
+
+class WasteEntryImportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, CSVStreamParser]
+
+    def post(self, request):
+        # Accepts a multipart `file` field or a raw text/csv body
+        upload = request.FILES.get('file')
+        if upload is not None:
+            lines = codecs.iterdecode(upload, 'utf-8-sig')
+        elif request.content_type.startswith(CSVStreamParser.media_type):
+            lines = request.data
+        else:
+            return Response({'error': 'Please upload a CSV file.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = import_waste_entries(request.user, lines, max_rows=IMPORT_MAX_ROWS)
+        except WasteImportError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except (UnicodeDecodeError, csv.Error) as exc:
+            return Response({'error': f'Could not read the CSV file: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+        response_status = status.HTTP_201_CREATED if report['imported'] else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=response_status)
+
+class WasteEntryExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+
+    def get(self, request):
+        user = request.user
+        entries = WasteEntry.objects.order_by('date', 'id')
+        if not user.groups.filter(name__in=['Admin', 'Moderator']).exists():
+            entries = entries.filter(user=user)
+
+        columns = [
+            ('id', 'id'),
+            ('user', 'user__username'),
+            ('waste_type', 'waste_type'),
+            ('quantity', 'quantity'),
+            ('date', 'date'),
+        ]
+        return streaming_export(entries, columns, request.accepted_renderer.format, 'waste-entries')
 
 # RecyclingCenter Views
 class RecyclingCenterListCreateView(generics.ListCreateAPIView):
@@ -49,6 +116,36 @@ class RecyclingCenterListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save()
 
+class RecyclingCenterNearestView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lon'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Please provide numeric lat and lon values.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return Response({'error': 'lat must be between -90 and 90 and lon between -180 and 180.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            radius_km = float(request.query_params.get('radius_km', geo.DEFAULT_RADIUS_KM))
+        except ValueError:
+            radius_km = None
+        if radius_km is None or not (0 < radius_km <= geo.MAX_RADIUS_KM):
+            return Response({'error': f'radius_km must be a number between 0 and {geo.MAX_RADIUS_KM}.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = _bounded_int_param(request, 'limit', geo.DEFAULT_LIMIT, geo.MAX_LIMIT)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for center, distance in geo.nearest_centers(latitude, longitude, radius_km=radius_km, limit=limit):
+            data = RecyclingCenterSerializer(center).data
+            data['distance_km'] = round(distance, 3)
+            results.append(data)
+        return Response(results, status=status.HTTP_200_OK)
+
 class RecyclingCenterDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = RecyclingCenter.objects.all()
     serializer_class = RecyclingCenterSerializer
@@ -60,6 +157,29 @@ class EcoChallengeListCreateView(generics.ListCreateAPIView):
     serializer_class = EcoChallengeSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAdminOrModerator]
 
+    def _status(self):
+        challenge_status = self.request.query_params.get('status')
+        if challenge_status and challenge_status not in STATUSES:
+            raise ValidationError({'status': f'Must be one of: {", ".join(STATUSES)}.'})
+        return challenge_status
+
+    def get_queryset(self):
+        # Optional ?status=active|upcoming|expired
+        challenge_status = self._status()
+        if challenge_status:
+            return filter_by_status(EcoChallenge.objects.all(), challenge_status)
+        return EcoChallenge.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        # Active challenges come from the in-process cache
+        if self._status() != ACTIVE:
+            return super().list(request, *args, **kwargs)
+        challenges_now = active_challenges.active()
+        page = self.paginate_queryset(challenges_now)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(challenges_now, many=True).data)
+
     def perform_create(self, serializer):
         serializer.save()
 
@@ -69,6 +189,13 @@ class EcoChallengeDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAdminOrModerator]
 
 # UserChallenge Views
+BULK_COMPLETE_MAX_USERS = 1000
+
+def _inactive_challenge_response(challenge_id):
+    if not EcoChallenge.objects.filter(id=challenge_id).exists():
+        return Response({'error': 'Challenge not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'error': 'Challenge is not active.'}, status=status.HTTP_400_BAD_REQUEST)
+
 class UserChallengeListView(generics.ListAPIView):
     serializer_class = UserChallengeSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -80,47 +207,174 @@ class UserChallengeCompleteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, challenge_id):
-        try:
-            challenge = EcoChallenge.objects.get(id=challenge_id)
-        except EcoChallenge.DoesNotExist:
-            return Response({'error': 'Challenge not found.'}, status=status.HTTP_404_NOT_FOUND)
-
         user = request.user
 
-        # Check if challenge is active
         now = timezone.now()
-        if not (challenge.start_date <= now <= challenge.end_date):
-            return Response({'error': 'Challenge is not active.'}, status=status.HTTP_400_BAD_REQUEST)
+        challenge = get_active(challenge_id, now)
+        if challenge is None:
+            return _inactive_challenge_response(challenge_id)
 
-        # Check if user already completed the challenge
-        user_challenge, created = UserChallenge.objects.get_or_create(user=user, challenge=challenge)
-        if user_challenge.completed:
+        # One conditional UPDATE, so repeated or concurrent requests award once
+        if not challenges.complete(user, challenge, now=now):
             return Response({'message': 'Challenge already completed.'}, status=status.HTTP_200_OK)
 
-        # Mark as completed
-        user_challenge.completed = True
-        user_challenge.completed_at = timezone.now()
-        user_challenge.save()
+        return Response({'message': 'Challenge completed successfully!', 'points_awarded': challenge.points}, status=status.HTTP_200_OK)
 
-        # Update leaderboard
-        leaderboard, _ = Leaderboard.objects.get_or_create(user=user)
-        leaderboard.update_points(challenge.points)
+class UserChallengeBulkCompleteView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrModerator]
 
-        return Response({'message': 'Challenge completed successfully!', 'points_awarded': challenge.points}, status=status.HTTP_200_OK)
+    def post(self, request, challenge_id):
+        now = timezone.now()
+        challenge = get_active(challenge_id, now)
+        if challenge is None:
+            return _inactive_challenge_response(challenge_id)
+
+        usernames = request.data.get('usernames', [])
+        user_ids = request.data.get('user_ids', [])
+        if not isinstance(usernames, list) or not isinstance(user_ids, list) or not (usernames or user_ids):
+            return Response({'error': 'Please provide a list of user_ids and/or usernames.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(usernames) + len(user_ids) > BULK_COMPLETE_MAX_USERS:
+            return Response({'error': f'At most {BULK_COMPLETE_MAX_USERS} users can be awarded at once.'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(isinstance(user_id, bool) or not isinstance(user_id, int) for user_id in user_ids):
+            return Response({'error': 'user_ids must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = dict(User.objects.filter(Q(id__in=user_ids) | Q(username__in=[str(name) for name in usernames])).values_list('id', 'username'))
+        found_names = set(found.values())
+        unknown = [user_id for user_id in user_ids if user_id not in found] + [name for name in usernames if name not in found_names]
+
+        completed = challenges.complete_many(challenge, found, now=now)
+        return Response({
+            'completed': [found[user_id] for user_id in completed],
+            'already_completed': len(found) - len(completed),
+            'unknown_users': unknown,
+            'points_awarded': challenge.points,
+        }, status=status.HTTP_200_OK)
 
 # Leaderboard Views
-class LeaderboardListView(generics.ListAPIView):
-    serializer_class = LeaderboardSerializer
+LEADERBOARD_DEFAULT_LIMIT = 10
+LEADERBOARD_MAX_LIMIT = 100
+LEADERBOARD_DEFAULT_WINDOW = 5
+LEADERBOARD_MAX_WINDOW = 50
+
+def _leaderboard_entries(entries):
+    # Ranks come from the in-memory index; one query resolves the usernames
+    usernames = dict(User.objects.filter(id__in=[entry['user_id'] for entry in entries]).values_list('id', 'username'))
+    return [
+        {'rank': entry['rank'], 'user': usernames.get(entry['user_id']), 'points': entry['points']}
+        for entry in entries
+    ]
+
+class LeaderboardListView(APIView):
     permission_classes = [permissions.AllowAny]
 
-    def get_queryset(self):
-        return Leaderboard.objects.all().order_by('-points')[:10]  # Top 10 users
+    def get(self, request):
+        try:
+            limit = _bounded_int_param(request, 'limit', LEADERBOARD_DEFAULT_LIMIT, LEADERBOARD_MAX_LIMIT)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(_leaderboard_entries(rank_index.top(limit)), status=status.HTTP_200_OK)
+
+class LeaderboardMeView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            points = Leaderboard.objects.values_list('points', flat=True).get(user=request.user)
+        except Leaderboard.DoesNotExist:
+            return Response({'error': 'You are not on the leaderboard yet.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'user': request.user.username,
+            'points': points,
+            'rank': rank_index.rank(points),
+            'participants': len(rank_index),
+        }, status=status.HTTP_200_OK)
+
+class LeaderboardAroundMeView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            window = _bounded_int_param(request, 'window', LEADERBOARD_DEFAULT_WINDOW, LEADERBOARD_MAX_WINDOW)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            points = Leaderboard.objects.values_list('points', flat=True).get(user=request.user)
+        except Leaderboard.DoesNotExist:
+            return Response({'error': 'You are not on the leaderboard yet.'}, status=status.HTTP_404_NOT_FOUND)
+        entries = rank_index.around(request.user.id, points, window)
+        return Response(_leaderboard_entries(entries), status=status.HTTP_200_OK)
+
+class WindowedLeaderboardView(APIView):
+    # Weekly (?window=2026-W07), monthly (?window=2026-02) or per-challenge
+    # standings; weeks and months default to the current one
+    permission_classes = [permissions.AllowAny]
+    period = None
+
+    def _window(self, request, challenge_id):
+        if self.period == windows.CHALLENGE:
+            if not EcoChallenge.objects.filter(id=challenge_id).exists():
+                return None, Response({'error': 'Challenge not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return str(challenge_id), None
+        try:
+            return windows.parse_window(self.period, request.query_params.get('window')), None
+        except ValueError as exc:
+            return None, Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def get(self, request, challenge_id=None):
+        window, error = self._window(request, challenge_id)
+        if error is not None:
+            return error
+        try:
+            limit = _bounded_int_param(request, 'limit', LEADERBOARD_DEFAULT_LIMIT, LEADERBOARD_MAX_LIMIT)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        sealed, entries = windows.top(self.period, window, limit)
+        return Response({
+            'period': self.period,
+            'window': window,
+            'sealed': sealed,
+            'entries': _leaderboard_entries(entries),
+        }, status=status.HTTP_200_OK)
+
+class WindowedLeaderboardMeView(WindowedLeaderboardView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, challenge_id=None):
+        window, error = self._window(request, challenge_id)
+        if error is not None:
+            return error
+        standing = windows.standing(self.period, window, request.user.id)
+        if standing is None:
+            return Response({'error': 'You have no points in this leaderboard window.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'user': request.user.username,
+            'period': self.period,
+            'window': window,
+            **standing,
+        }, status=status.HTTP_200_OK)
 
 # Additional Views for Aggregated Data (Optional)
 class UserWasteSummaryView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        waste_summary = WasteEntry.objects.filter(user=user).values('waste_type').annotate(total_quantity=Sum('quantity'))
+        # Optional ?period=week|month|year and ?start=/&end= dates (inclusive)
+        try:
+            period, start, end = waste_totals.parse_summary_params(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        waste_summary = waste_totals.summary(request.user, period=period, start=start, end=end)
         return Response(waste_summary, status=status.HTTP_200_OK)
+
+class CommunityWasteAnalyticsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrModerator]
+
+    def get(self, request):
+        # ?start=/&end= dates (default: the last 30 days), ?period=day|week|month|year,
+        # and optional ?region= (recycling center id or "none") and ?waste_type=
+        try:
+            start, end, period, region, waste_type = analytics.parse_analytics_params(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        report = analytics.community_analytics(start, end, period=period, region=region, waste_type=waste_type)
+        return Response(report, status=status.HTTP_200_OK)
@@ -0,0 +1,205 @@
+from datetime import timezone as dt_timezone
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek, TruncYear
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_date
+
+from recycling.models import WasteEntry, WasteDailyTotal, CommunityWasteDailyTotal, RecyclingCenter
+
+BULK_BATCH_SIZE = 1000
+
+PERIODS = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def entry_day(date):
+    return date.astimezone(dt_timezone.utc).date()
+
+
+def add_entry(deltas, user_id, waste_type, date, quantity, region_id=None, count=1):
+    # Accumulates an entry (count=1) or its removal (count=-1) into
+    # {(user_id, waste_type, day, region): [quantity, entry_count]}
+    key = (user_id, waste_type, entry_day(date), region_id or 0)
+    delta = deltas.setdefault(key, [0.0, 0])
+    delta[0] += quantity * count
+    delta[1] += count
+
+
+def _project(deltas, fields, positions):
+    # Sums deltas over the key positions a counter table does not have
+    projected = {}
+    for key, (quantity, count) in deltas.items():
+        delta = projected.setdefault(tuple(key[position] for position in positions), [0.0, 0])
+        delta[0] += quantity
+        delta[1] += count
+    return [
+        (dict(zip(fields, key)), quantity, count)
+        for key, (quantity, count) in projected.items() if quantity or count
+    ]
+
+
+def _upsert(model, deltas):
+    # One INSERT ... ON CONFLICT DO UPDATE adding the deltas to the stored
+    # counters (PostgreSQL and SQLite), so concurrent writers never lose each
+    # other's changes
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    key_fields = [(name, model._meta.get_field(name)) for name in deltas[0][0]]
+    columns = [quote(field.column) for _, field in key_fields] + [quote('quantity'), quote('entry_count')]
+    conflict = ', '.join(quote(model._meta.get_field(name).column) for name in model._meta.unique_together[0])
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(deltas))
+    params = []
+    for key, quantity, count in deltas:
+        params.extend(field.get_db_prep_value(key[name], connection) for name, field in key_fields)
+        params.extend([quantity, count])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES {placeholders} '
+            f'ON CONFLICT ({conflict}) DO UPDATE SET '
+            f'{quote("quantity")} = {table}.{quote("quantity")} + EXCLUDED.{quote("quantity")}, '
+            f'{quote("entry_count")} = {table}.{quote("entry_count")} + EXCLUDED.{quote("entry_count")}',
+            params,
+        )
+
+
+def _merge(model, deltas):
+    # Applies the deltas with one upsert per chunk. Rows left without entries
+    # (including ones just created by a removal) are dropped.
+    for start in range(0, len(deltas), BULK_BATCH_SIZE):
+        chunk = deltas[start:start + BULK_BATCH_SIZE]
+        _upsert(model, chunk)
+        emptied = Q()
+        for key, _, count in chunk:
+            if count < 0:
+                emptied |= Q(**key)
+        if emptied:
+            model.objects.filter(emptied, entry_count__lte=0).delete()
+
+
+def apply(deltas):
+    with transaction.atomic():
+        _merge(WasteDailyTotal, _project(deltas, ('user_id', 'waste_type', 'day'), (0, 1, 2)))
+        _merge(CommunityWasteDailyTotal, _project(deltas, ('day', 'waste_type', 'region'), (2, 1, 3)))
+
+
+def rebuild():
+    # Recomputes every counter from the raw entries (initial backfill, or
+    # after entries were changed with queryset.update(), which sends no
+    # signals). Returns the number of counter rows written.
+    rows = (
+        WasteEntry.objects
+        .annotate(day=TruncDate('date', tzinfo=dt_timezone.utc), region_key=Coalesce('region_id', 0))
+        .values('user_id', 'waste_type', 'day', 'region_key')
+        .annotate(total=Sum('quantity'), count=Count('id'))
+        .order_by()
+    )
+    deltas = {
+        (row['user_id'], row['waste_type'], row['day'], row['region_key']): [row['total'], row['count']]
+        for row in rows.iterator()
+    }
+    with transaction.atomic():
+        WasteDailyTotal.objects.all().delete()
+        CommunityWasteDailyTotal.objects.all().delete()
+        written = 0
+        for model, fields, positions in (
+            (WasteDailyTotal, ('user_id', 'waste_type', 'day'), (0, 1, 2)),
+            (CommunityWasteDailyTotal, ('day', 'waste_type', 'region'), (2, 1, 3)),
+        ):
+            written += len(model.objects.bulk_create(
+                [
+                    model(quantity=quantity, entry_count=count, **key)
+                    for key, quantity, count in _project(deltas, fields, positions)
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            ))
+    return written
+
+
+def parse_date_param(value, name):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 date.')
+    return parsed
+
+
+def parse_summary_params(params):
+    # Returns (period, start, end) from query parameters; all are optional
+    period = params.get('period') or None
+    if period is not None and period not in PERIODS:
+        raise ValueError(f'period must be one of: {", ".join(PERIODS)}.')
+    start = parse_date_param(params['start'], 'start') if params.get('start') else None
+    end = parse_date_param(params['end'], 'end') if params.get('end') else None
+    if start and end and start > end:
+        raise ValueError('start must not be after end.')
+    return period, start, end
+
+
+def summary(user, period=None, start=None, end=None):
+    # Totals per waste type over [start, end] (UTC days, inclusive), split
+    # into week/month/year buckets when a period is given
+    totals = WasteDailyTotal.objects.filter(user=user, entry_count__gt=0)
+    if start is not None:
+        totals = totals.filter(day__gte=start)
+    if end is not None:
+        totals = totals.filter(day__lte=end)
+
+    fields = ['waste_type']
+    if period is not None:
+        totals = totals.annotate(period_start=PERIODS[period]('day'))
+        fields = ['period_start', 'waste_type']
+    return list(
+        totals.values(*fields)
+        .annotate(total_quantity=Sum('quantity'), entry_count=Sum('entry_count'))
+        .order_by(*fields)
+    )
+
+
+# Imported from RecyclingConfig.ready so the receivers are always connected.
+# Bulk inserts bypass these; recycling.imports applies its own deltas.
+@receiver(pre_save, sender=WasteEntry)
+def remember_previous_entry(sender, instance, **kwargs):
+    instance._waste_total_previous = None
+    if instance.pk is not None:
+        instance._waste_total_previous = (
+            WasteEntry.objects.filter(pk=instance.pk).values_list('user_id', 'waste_type', 'date', 'quantity', 'region_id').first()
+        )
+
+
+@receiver(post_save, sender=WasteEntry)
+def count_saved_entry(sender, instance, **kwargs):
+    deltas = {}
+    previous = getattr(instance, '_waste_total_previous', None)
+    if previous is not None:
+        add_entry(deltas, *previous, count=-1)
+    add_entry(deltas, instance.user_id, instance.waste_type, instance.date, instance.quantity, instance.region_id)
+    apply(deltas)
+
+
+@receiver(post_delete, sender=WasteEntry)
+def count_deleted_entry(sender, instance, **kwargs):
+    deltas = {}
+    add_entry(deltas, instance.user_id, instance.waste_type, instance.date, instance.quantity, instance.region_id, count=-1)
+    apply(deltas)
+
+
+@receiver(pre_delete, sender=RecyclingCenter)
+def release_region(sender, instance, **kwargs):
+    # The center's entries lose their region (SET_NULL), so its community
+    # counters move to the no-region rows
+    with transaction.atomic():
+        totals = CommunityWasteDailyTotal.objects.select_for_update().filter(region=instance.pk)
+        _merge(CommunityWasteDailyTotal, [
+            ({'day': row.day, 'waste_type': row.waste_type, 'region': 0}, row.quantity, row.entry_count)
+            for row in totals
+        ])
+        totals.delete()
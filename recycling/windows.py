@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recycling.models import EcoChallenge, LeaderboardWindowEntry, LeaderboardSnapshot, LeaderboardSnapshotEntry
+
+WEEK = LeaderboardWindowEntry.WEEK
+MONTH = LeaderboardWindowEntry.MONTH
+CHALLENGE = LeaderboardWindowEntry.CHALLENGE
+
+BULK_BATCH_SIZE = 1000
+
+_WINDOW_FORMATS = {
+    WEEK: ('%G-W%V', '2026-W07'),
+    MONTH: ('%Y-%m', '2026-02'),
+}
+
+
+def window_key(period, moment):
+    # Key of the week or month (UTC) containing the moment
+    return f'{moment.astimezone(dt_timezone.utc):{_WINDOW_FORMATS[period][0]}}'
+
+
+def _window_start(period, window):
+    if period == WEEK:
+        return datetime.strptime(f'{window}-1', '%G-W%V-%u').replace(tzinfo=dt_timezone.utc)
+    return datetime.strptime(window, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+
+
+def window_end(period, window):
+    start = _window_start(period, window)
+    if period == WEEK:
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def parse_window(period, value, now=None):
+    # Normalised week/month key from a query parameter; the current one by default
+    if not value:
+        return window_key(period, now or timezone.now())
+    example = _WINDOW_FORMATS[period][1]
+    try:
+        return window_key(period, _window_start(period, value))
+    except ValueError:
+        raise ValueError(f'window must look like {example}.')
+
+
+def record(challenge, user_ids, now):
+    # Adds a completed challenge's points to the users' current weekly and
+    # monthly windows and to the challenge's own window. Called inside the
+    # completion transaction, so the windows stay in step with Leaderboard.
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    windows = [(WEEK, window_key(WEEK, now)), (MONTH, window_key(MONTH, now)), (CHALLENGE, str(challenge.pk))]
+    LeaderboardWindowEntry.objects.bulk_create(
+        [
+            LeaderboardWindowEntry(period=period, window=window, user_id=user_id, reached_at=now)
+            for period, window in windows for user_id in user_ids
+        ],
+        batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+    )
+    for period, window in windows:
+        LeaderboardWindowEntry.objects.filter(period=period, window=window, user_id__in=user_ids).update(
+            points=F('points') + challenge.points, reached_at=now,
+        )
+
+
+def _competition_ranks(rows):
+    # rows sorted by points descending; ties share a rank
+    ranked = []
+    for position, row in enumerate(rows):
+        rank = ranked[-1]['rank'] if ranked and ranked[-1]['points'] == row['points'] else position + 1
+        ranked.append({**row, 'rank': rank})
+    return ranked
+
+
+def latest_snapshot(period, window):
+    return LeaderboardSnapshot.objects.filter(period=period, window=window).order_by('-revision').first()
+
+
+def top(period, window, limit):
+    # (sealed, [{'rank', 'user_id', 'points'}]) for the window's first `limit`
+    # places; ties are ordered by who reached their points first
+    snapshot = latest_snapshot(period, window)
+    if snapshot is not None:
+        return True, list(snapshot.entries.order_by('rank', 'reached_at', 'user_id').values('rank', 'user_id', 'points')[:limit])
+    rows = (
+        LeaderboardWindowEntry.objects
+        .filter(period=period, window=window)
+        .order_by('-points', 'reached_at', 'user_id')
+        .values('user_id', 'points')[:limit]
+    )
+    return False, _competition_ranks(rows)
+
+
+def standing(period, window, user_id):
+    # {'rank', 'points', 'participants', 'sealed'}, or None if the user has no
+    # points in the window. Live ranks are one indexed count.
+    snapshot = latest_snapshot(period, window)
+    if snapshot is not None:
+        entry = snapshot.entries.filter(user_id=user_id).values('rank', 'points').first()
+        if entry is None:
+            return None
+        return {**entry, 'participants': snapshot.participants, 'sealed': True}
+
+    entries = LeaderboardWindowEntry.objects.filter(period=period, window=window)
+    points = entries.filter(user_id=user_id).values_list('points', flat=True).first()
+    if points is None:
+        return None
+    return {
+        'rank': entries.filter(points__gt=points).count() + 1,
+        'points': points,
+        'participants': entries.count(),
+        'sealed': False,
+    }
+
+
+def seal_window(period, window):
+    # Replaces the window's live entries with a snapshot of final ranks. A
+    # window sealed earlier (e.g. a challenge completed after it ended) gets a
+    # new revision merging the previous one; snapshots are never modified or
+    # deleted.
+    with transaction.atomic():
+        live = LeaderboardWindowEntry.objects.select_for_update().filter(period=period, window=window)
+        # Only the rows read here are removed, so nothing written meanwhile is lost
+        live_rows = list(live.values('id', 'user_id', 'points', 'reached_at'))
+        standings = {
+            row['user_id']: {'user_id': row['user_id'], 'points': row['points'], 'reached_at': row['reached_at']}
+            for row in live_rows
+        }
+        previous = latest_snapshot(period, window)
+        if previous is not None:
+            for row in previous.entries.values('user_id', 'points', 'reached_at'):
+                current = standings.get(row['user_id'])
+                if current is not None:
+                    row = {**row, 'points': row['points'] + current['points'], 'reached_at': current['reached_at']}
+                standings[row['user_id']] = row
+
+        rows = sorted(standings.values(), key=lambda row: (-row['points'], row['reached_at'], row['user_id']))
+        snapshot = LeaderboardSnapshot.objects.create(
+            period=period, window=window, participants=len(rows),
+            revision=previous.revision + 1 if previous is not None else 1,
+        )
+        LeaderboardSnapshotEntry.objects.bulk_create(
+            [
+                LeaderboardSnapshotEntry(snapshot=snapshot, **row)
+                for row in _competition_ranks(rows)
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        LeaderboardWindowEntry.objects.filter(pk__in=[row['id'] for row in live_rows]).delete()
+    return snapshot
+
+
+def sealable_windows(now=None):
+    # Live windows that have ended: past weeks and months, and challenges
+    # whose end date has passed (or that were deleted)
+    now = now or timezone.now()
+    live = LeaderboardWindowEntry.objects.values_list('period', 'window').distinct().order_by('period', 'window')
+    windows = []
+    challenge_windows = []
+    for period, window in live:
+        if period == CHALLENGE:
+            challenge_windows.append(window)
+        elif window_end(period, window) <= now:
+            windows.append((period, window))
+
+    ends = dict(EcoChallenge.objects.filter(pk__in=[int(window) for window in challenge_windows]).values_list('pk', 'end_date'))
+    for window in challenge_windows:
+        end = ends.get(int(window))
+        if end is None or end <= now:
+            windows.append((CHALLENGE, window))
+    return windows
+
+
+def seal(now=None):
+    # Returns the number of windows sealed
+    windows = sealable_windows(now)
+    for period, window in windows:
+        seal_window(period, window)
+    return len(windows)